@@ -1,5 +1,5 @@
 import { useState } from "react";
-import { fetchDocumentsByTopic, startAnalysisForTopic } from "../services/api";
+import { fetchDocumentsByTopic, streamAnalysisForTopic } from "../services/api";
 
 const INITIAL_STATUS = "Enter a topic to begin analysis.";
 
@@ -40,18 +40,30 @@ export const useAnalysis = () => {
     setStatus(`Initializing analysis for "${topic}"...`);
 
     try {
-      // Step 1: Start the analysis job on the server.
-      await startAnalysisForTopic(topic);
-      setStatus(`Processing documents for "${topic}"...`);
+      // Stream the analysis: documents render as soon as they are fetched and
+      // are updated in place as each one is analyzed.
+      await streamAnalysisForTopic(topic, (event) => {
+        if (event.event === "documents") {
+          setDocuments(event.documents || []);
+          setStatus(`Analyzing ${event.documents?.length || 0} documents for "${topic}"...`);
+        } else if (event.event === "analysis") {
+          setDocuments((prev) => {
+            const next = [...prev];
+            next[event.index] = event.document;
+            return next;
+          });
+        }
+      });
+      setStatus(`Loading stored documents for "${topic}"...`);
 
-      // Step 2: Fetch the processed documents.
+      // The topic's full stored history (not just this run) is what gets displayed.
       const data = await fetchDocumentsByTopic(topic);
       const results = data || [];
 
       setDocuments(results);
       setAnalyzedTopic(topic); // Set topic to render analytics.
 
-      // Step 3: Update status message based on results.
+      // Update status message based on results.
       if (results.length > 0) {
         setStatus(`Displaying ${results.length} results for "${topic}".`);
       } else {
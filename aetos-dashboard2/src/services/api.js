@@ -10,20 +10,86 @@ export const fetchDocumentsByTopic = async (topic) => {
   return response.json();
 };
 
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
+const readError = async (response) => {
+  const text = await response.text().catch(() => '')
+  let payload = text || response.statusText
+  try { payload = JSON.parse(text) } catch (e) {}
+  return new Error(payload?.status || payload?.error || payload || `HTTP error! status: ${response.status}`);
+};
+
+/**
+ * Fetches the status (with per-stage progress) of a background analysis job.
+ */
+export const fetchJobStatus = async (jobId) => {
+  const response = await fetch(`${API_BASE_URL}/jobs/${encodeURIComponent(jobId)}`);
+  if (!response.ok) throw await readError(response);
+  return response.json();
+};
+
 /**
- * Starts a new analysis for a given topic.
+ * Starts a new analysis for a given topic as a background job and polls
+ * until its result is ready. `onProgress` receives each status snapshot.
  */
-export const startAnalysisForTopic = async (topic) => {
-  const response = await fetch(`${API_BASE_URL}/analyze/${encodeURIComponent(topic)}`, {
+export const startAnalysisForTopic = async (topic, onProgress) => {
+  const response = await fetch(`${API_BASE_URL}/analyze/${encodeURIComponent(topic)}?mode=job`, {
     method: "POST"
   });
-  if (!response.ok) {
-    const text = await response.text().catch(() => '')
-    let payload = text || response.statusText
-    try { payload = JSON.parse(text) } catch (e) {}
-    throw new Error(payload?.status || payload?.error || payload || `HTTP error! status: ${response.status}`);
+  if (!response.ok) throw await readError(response);
+  const { job_id: jobId } = await response.json();
+
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const job = await fetchJobStatus(jobId);
+    if (onProgress) onProgress(job);
+    if (job.status === "failed") throw new Error(job.error || "Analysis failed");
+    if (job.status === "complete") {
+      const result = await fetch(`${API_BASE_URL}/jobs/${encodeURIComponent(jobId)}/result`);
+      if (!result.ok) throw await readError(result);
+      return result.json();
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
   }
-  return response.json();
+  throw new Error(`Analysis job ${jobId} timed out`);
+};
+
+/**
+ * Runs the analysis as a stream of NDJSON events and calls `onEvent` for each:
+ * "documents" (fetched candidates), "analysis" (one per analyzed document, with
+ * an `index` into the documents event), then "summary" with the final documents.
+ * Resolves with the summary event.
+ */
+export const streamAnalysisForTopic = async (topic, onEvent) => {
+  const response = await fetch(`${API_BASE_URL}/analyze/${encodeURIComponent(topic)}/stream`, {
+    method: "POST"
+  });
+  if (!response.ok || !response.body) throw await readError(response);
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let summary = null;
+  const handleLine = (line) => {
+    if (!line.trim()) return;
+    const event = JSON.parse(line);
+    if (event.event === "error") throw new Error(event.error || "Analysis failed");
+    if (event.event === "summary") summary = event;
+    if (onEvent) onEvent(event);
+  };
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+  if (!summary) throw new Error("Analysis stream ended early");
+  return summary;
 };
 
 /**
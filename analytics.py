@@ -1,55 +1,259 @@
 # analytics.py
 import pandas as pd
-import networkx as nx
-from itertools import combinations
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
 
 def calculate_s_curve(df: pd.DataFrame) -> list:
-    """Calculates the S-curve data from a dataframe of documents."""
-    df['published_date'] = pd.to_datetime(df['published'], errors='coerce')
-    df.dropna(subset=['published_date'], inplace=True)
-    if df.empty:
+    """Calculates the S-curve data from a dataframe of documents (the frame is not modified)."""
+    years = pd.to_datetime(df['published'], errors='coerce', utc=True).dt.year.dropna().astype(int)
+    if years.empty:
         return []
+    yearly_counts = years.value_counts().sort_index()
+    return [
+        {'year': int(year), 'count': int(count), 'cumulative_count': int(cumulative)}
+        for year, count, cumulative in zip(yearly_counts.index, yearly_counts.to_numpy(), yearly_counts.cumsum().to_numpy())
+    ]
+
+def yearly_count_matrix(df: pd.DataFrame, topic_column: str = 'topic'):
+    """
+    Documents per topic per year as (topics, years, counts) for
+    scurve.fit_s_curves, with every year of the span present (gaps are zero).
+    """
+    published = pd.to_datetime(df['published'], errors='coerce', utc=True)
+    frame = pd.DataFrame({'topic': df[topic_column], 'year': published.dt.year}).dropna()
+    if frame.empty:
+        return [], np.empty(0, dtype=int), np.empty((0, 0))
+    table = pd.crosstab(frame['topic'], frame['year'].astype(int))
+    years = np.arange(table.columns.min(), table.columns.max() + 1)
+    table = table.reindex(columns=years, fill_value=0)
+    return list(table.index), years, table.to_numpy(dtype=float)
+
+def forecast_s_curves(df: pd.DataFrame, topic_column: str = 'topic', horizon: int = 5, model: str = 'auto') -> dict:
+    """Fit every topic's S-curve in one batch; {topic: scurve summary}."""
+    from scurve import fit_s_curves
+    topics, years, counts = yearly_count_matrix(df, topic_column)
+    if not topics:
+        return {}
+    fits = fit_s_curves(counts, years, model=model, horizon=horizon)
+    return {topic: fits.summary(i) for i, topic in enumerate(topics)}
+
+# ========================================
+# KEYWORD CO-OCCURRENCE
+# ========================================
+# Pair keys pack two keyword ids into one int64: (lower id << 32) | higher id
+_PAIR_SHIFT = np.int64(32)
+_PAIR_MASK = np.int64((1 << 32) - 1)
+
+def keyword_list(value: Any) -> List[str]:
+    """A document's keywords as a list: lists pass through, comma strings are split, anything else is empty."""
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, (list, tuple, set, np.ndarray)):
+        return []
+    return [k.strip() for k in value if isinstance(k, str) and k.strip()]
+
+class KeywordInterner:
+    """Maps keywords to dense integer ids, case-insensitively; the first spelling seen is kept."""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, keyword: str) -> int:
+        key = keyword.casefold()
+        kid = self._ids.get(key)
+        if kid is None:
+            kid = self._ids[key] = len(self.names)
+            self.names.append(keyword)
+        return kid
+
+    def get(self, keyword: str) -> Optional[int]:
+        return self._ids.get(keyword.casefold())
+
+class CooccurrenceMatrix:
+    """
+    Keyword co-occurrence counts for a set of documents.
+
+    Each document contributes every pair of its distinct keywords once.
+    Documents are grouped by keyword count so all their pairs are generated
+    in one numpy step per group and counted with np.unique; pairs are kept as
+    sorted int64 keys with a parallel counts array. Matrices built with the
+    same interner share key space and can be compared directly.
+    """
+
+    def __init__(self, keyword_lists: Iterable[Any], interner: Optional[KeywordInterner] = None,
+                 max_keywords_per_doc: Optional[int] = None):
+        self.interner = interner or KeywordInterner()
+        self.documents = 0
+        by_length: Dict[int, List[List[int]]] = {}
+        for value in keyword_lists:
+            keywords = keyword_list(value)[:max_keywords_per_doc]
+            ids = sorted({self.interner.intern(k) for k in keywords})
+            self.documents += 1
+            if len(ids) >= 2:
+                by_length.setdefault(len(ids), []).append(ids)
+
+        keys = [self._pair_keys(np.array(rows, dtype=np.int64)) for rows in by_length.values()]
+        if keys:
+            self.pairs, self.counts = np.unique(np.concatenate(keys), return_counts=True)
+        else:
+            self.pairs = np.empty(0, dtype=np.int64)
+            self.counts = np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _pair_keys(rows: np.ndarray) -> np.ndarray:
+        # rows: (docs, k) ascending ids; every column pair i < j at once
+        left, right = np.triu_indices(rows.shape[1], k=1)
+        return ((rows[:, left] << _PAIR_SHIFT) | rows[:, right]).ravel()
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Counts for arbitrary pair keys (0 where the pair never occurs)."""
+        if not len(self.pairs):
+            return np.zeros(len(keys), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.pairs, keys), len(self.pairs) - 1)
+        return np.where(self.pairs[pos] == keys, self.counts[pos], 0)
 
-    df['year'] = df['published_date'].dt.year
-    yearly_counts = df['year'].value_counts().sort_index()
-    cumulative_counts = yearly_counts.cumsum()
-    
-    s_curve_data = []
-    for year, count in yearly_counts.items():
-        s_curve_data.append({
-            'year': int(year),
-            'count': int(count),
-            'cumulative_count': int(cumulative_counts.loc[year])
-        })
-    return s_curve_data
-
-def find_technology_convergence(df: pd.DataFrame, top_n: int = 10) -> list:
-    """Analyzes keyword co-occurrence to find technology convergence."""
-    # Create a new graph
-    G = nx.Graph()
-    
-    # Iterate through each document's keywords
-    for keywords_list in df['keywords']:
-        # Create unique pairs of keywords (combinations) from the list
-        for word1, word2 in combinations(keywords_list, 2):
-            if G.has_edge(word1, word2):
-                # If the edge already exists, increase its weight
-                G[word1][word2]['weight'] += 1
-            else:
-                # Otherwise, add a new edge with a weight of 1
-                G.add_edge(word1, word2, weight=1)
-
-    # Get all edges and their weights
-    if not G.edges(data=True):
+    def count(self, tech_1: str, tech_2: str) -> int:
+        a, b = self.interner.get(tech_1), self.interner.get(tech_2)
+        if a is None or b is None or a == b:
+            return 0
+        key = (np.int64(min(a, b)) << _PAIR_SHIFT) | np.int64(max(a, b))
+        return int(self.lookup(np.array([key]))[0])
+
+    def pair_names(self, keys: np.ndarray):
+        names = self.interner.names
+        for key in keys:
+            yield names[int(key >> _PAIR_SHIFT)], names[int(key & _PAIR_MASK)]
+
+    def top(self, n: int = 10) -> list:
+        """The n strongest pairs as [{"tech_1", "tech_2", "strength"}], strongest first."""
+        if n <= 0 or not len(self.pairs):
+            return []
+        positions = top_positions(self.counts, n)
+        return [
+            {"tech_1": a, "tech_2": b, "strength": int(strength)}
+            for (a, b), strength in zip(self.pair_names(self.pairs[positions]), self.counts[positions])
+        ]
+
+    def to_networkx(self, min_strength: int = 1):
+        """Weighted networkx Graph of pairs with at least min_strength co-occurrences (requires networkx)."""
+        import networkx as nx
+        graph = nx.Graph()
+        keep = self.counts >= min_strength
+        graph.add_weighted_edges_from(
+            (a, b, int(w)) for (a, b), w in zip(self.pair_names(self.pairs[keep]), self.counts[keep])
+        )
+        return graph
+
+def top_positions(scores: np.ndarray, n: int, tiebreak: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the n largest scores, largest first, via argpartition instead of a full sort."""
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+    secondary = tiebreak[candidates] if tiebreak is not None else np.zeros(len(candidates))
+    # lexsort sorts by the last key first: score, then tiebreak, then position
+    return candidates[np.lexsort((candidates, -secondary, -scores[candidates]))]
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+def _published_between(df: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    """Rows published in [start, end); all rows when neither bound is given."""
+    if start is None and end is None:
+        return df
+    published = pd.to_datetime(df['published'], errors='coerce', utc=True)
+    mask = published.notna()
+    if start is not None:
+        mask &= published >= _utc(start)
+    if end is not None:
+        mask &= published < _utc(end)
+    return df[mask]
+
+def find_technology_convergence(df: pd.DataFrame, top_n: int = 10, column: str = 'keywords',
+                                start=None, end=None) -> list:
+    """
+    Analyzes keyword co-occurrence to find technology convergence.
+    `column` holds each document's keywords ('keywords' from the NLP engine,
+    'technologies' from Gemini); `start`/`end` limit it to documents
+    published in [start, end).
+    """
+    if df.empty or column not in df:
+        return []
+    return CooccurrenceMatrix(_published_between(df, start, end)[column]).top(top_n)
+
+def convergence_graph(df: pd.DataFrame, column: str = 'keywords', min_strength: int = 1, start=None, end=None):
+    """The co-occurrence network as a weighted networkx Graph, for callers that want graph algorithms."""
+    return CooccurrenceMatrix(_published_between(df, start, end)[column]).to_networkx(min_strength=min_strength)
+
+def find_emerging_convergence(df: pd.DataFrame, window_days: int = 365, top_n: int = 10,
+                              column: str = 'keywords', min_recent: int = 2, end=None) -> list:
+    """
+    Pairs whose co-occurrence grew most in the last `window_days` (up to
+    `end`, default just after the newest published date) against the window
+    of the same length before it. growth = (recent + 1) / (previous + 1);
+    pairs seen fewer than `min_recent` times recently are ignored.
+    """
+    if df.empty or column not in df:
+        return []
+    published = pd.to_datetime(df['published'], errors='coerce', utc=True)
+    if not published.notna().any():
         return []
+    end = _utc(end) if end is not None else published.max() + pd.Timedelta(microseconds=1)
+    window = pd.Timedelta(days=window_days)
+
+    interner = KeywordInterner()
+    recent = CooccurrenceMatrix(df.loc[(published >= end - window) & (published < end), column], interner)
+    previous = CooccurrenceMatrix(df.loc[(published >= end - 2 * window) & (published < end - window), column], interner)
 
-    # Sort the edges by weight in descending order
-    sorted_edges = sorted(G.edges(data=True), key=lambda x: x[2]['weight'], reverse=True)
-    
-    # Format the top N results
-    top_convergences = [
-        {"tech_1": edge[0], "tech_2": edge[1], "strength": edge[2]['weight']}
-        for edge in sorted_edges[:top_n]
+    keep = recent.counts >= min_recent
+    pairs, recent_counts = recent.pairs[keep], recent.counts[keep]
+    if not len(pairs):
+        return []
+    previous_counts = previous.lookup(pairs)
+    growth = (recent_counts + 1) / (previous_counts + 1)
+    positions = top_positions(growth, top_n, tiebreak=recent_counts)
+    return [
+        {"tech_1": a, "tech_2": b, "strength": int(r), "previous": int(p), "growth": round(float(g), 3)}
+        for (a, b), r, p, g in zip(recent.pair_names(pairs[positions]), recent_counts[positions],
+                                   previous_counts[positions], growth[positions])
     ]
-    
-    return top_convergences
\ No newline at end of file
+
+def _benchmark(num_docs: int):
+    import time
+    import random
+    from itertools import combinations
+
+    rng = random.Random(0)
+    vocabulary = [f"tech {i}" for i in range(5000)]
+    keywords = [rng.sample(vocabulary, rng.randint(5, 10)) for _ in range(num_docs)]
+    df = pd.DataFrame({"keywords": keywords})
+
+    def legacy():
+        # The previous implementation, minus networkx: one dict update per edge, full sort
+        weights = {}
+        for keywords_list in df['keywords']:
+            for pair in combinations(keywords_list, 2):
+                pair = tuple(sorted(pair))
+                weights[pair] = weights.get(pair, 0) + 1
+        return sorted(weights.items(), key=lambda x: x[1], reverse=True)[:10]
+
+    for label, fn in (("per-edge dict + full sort", legacy),
+                      ("CooccurrenceMatrix", lambda: find_technology_convergence(df, top_n=10))):
+        start = time.perf_counter()
+        fn()
+        print(f"{label:<28}{time.perf_counter() - start:>8.2f} s")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark keyword co-occurrence counting")
+    parser.add_argument("--docs", type=int, default=100_000)
+    args = parser.parse_args()
+    _benchmark(args.docs)
@@ -3,14 +3,26 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 from pymongo import MongoClient
 from dotenv import load_dotenv
-from bson import json_util
 import json
 import concurrent.futures
 import re
-import requests
-import xml.etree.ElementTree as ET
-import pandas as pd
-from datetime import datetime
+import time
+import http_client
+from datetime import datetime, timedelta
+from jobs import JobManager, JobQueueFull
+from ratelimit import TokenBucket
+from llm_cache import get_default_cache
+from batching import pack_batches, format_batch_documents, parse_batch_response
+from database import bulk_upsert, ensure_indexes, DB_BULK_CHUNK_SIZE
+from search import search_documents, search_page, decode_cursor, SEARCH_MODES, SORT_ORDERS
+from serialization import dumps, DOCUMENT_PROJECTION
+from records import DocumentRecord, to_records
+from keyword_pairs import KeywordPairStore, count_changes
+from rollups import RollupStore, annotate
+from dedupe import StoredDuplicateIndex, encode_signatures, signatures, source_priority
+from fetch_cache import get_default_fetch_cache
+from arxiv_harvester import HighWaterMarks, harvest_new
+from async_fetch import get_fetcher, fetch_combined_papers as fetch_combined_sync, gemini_generate as async_gemini_generate
 
 load_dotenv()
 
@@ -24,7 +36,22 @@ ARXIV_MAX_RESULTS = int(os.getenv("ARXIV_MAX_RESULTS", "10"))
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "8.0"))
 SERPAPI_MAX_RESULTS = int(os.getenv("SERPAPI_MAX_RESULTS", "10"))
+# Overall budget for the combined upstream fetch; slower sources are cancelled
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", str(max(ARXIV_TIMEOUT, SERPAPI_TIMEOUT) + 1)))
+FETCH_DB_FALLBACK = os.getenv("FETCH_DB_FALLBACK", "0") == "1"
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+# Reuse analyses already stored for a document unless they are older than this
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "1") != "0"
+ANALYSIS_MAX_AGE_DAYS = float(os.getenv("ANALYSIS_MAX_AGE_DAYS", "30"))
 GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "10.0"))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "4"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "30"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", str(GEMINI_MAX_IN_FLIGHT)))
+GEMINI_RATE_WAIT_TIMEOUT = float(os.getenv("GEMINI_RATE_WAIT_TIMEOUT", "60.0"))
+GEMINI_BATCH_MAX_DOCS = int(os.getenv("GEMINI_BATCH_MAX_DOCS", "8"))
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "6000"))
+# Bump whenever the analysis prompt changes so cached results are not reused
+GEMINI_PROMPT_VERSION = "api-trl-v1"
 
 def create_app():
     app = Flask(__name__)
@@ -32,114 +59,246 @@ def create_app():
     mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
     client = MongoClient(mongo_uri)
     db = client.get_database("aetos_db")
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"Index setup skipped: {e}")
+    job_manager = JobManager()
+    # Shared across requests so concurrent pipelines respect one Gemini quota
+    gemini_bucket = TokenBucket(GEMINI_RPM, capacity=GEMINI_BURST)
+    analysis_cache = get_default_cache(GEMINI_PROMPT_VERSION, GEMINI_MODEL, db=db)
+    fetch_cache = get_default_fetch_cache()
+    arxiv_marks = HighWaterMarks(db.arxiv_watermarks)
+    # MinHash/LSH index over recently stored documents, for cross-source near-duplicates
+    stored_duplicates = StoredDuplicateIndex(db.documents)
+    keyword_pairs = KeywordPairStore(db.keyword_pairs)
+    rollups = RollupStore(db.documents, db.rollups)
+    # One event loop thread carries all upstream calls for this process
+    fetch_layer = get_fetcher()
 
     # ========================================
     # INTELLIGENCE / GEMINI ANALYSIS
     # ========================================
+    ANALYSIS_FIELDS = """1. TRL (Technology Readiness Level) from 1-9
+2. TRL justification (brief explanation)
+3. Key technologies mentioned (comma-separated list)
+4. Funding details if mentioned (amount and source)
+5. Progress/status (e.g., prototype, pilot, commercial)
+6. Strategic importance (1-10 rating with brief explanation)"""
+    ANALYSIS_KEYS = "TRL, TRL_justification, technologies, funding_details, progress, strategic_rating, strategic_summary"
+
+    def clean_dict(d):
+        """Replace NaN values in an analysis dict (recursively) with None"""
+        for k, v in list(d.items()):
+            if isinstance(v, float) and (v != v):
+                d[k] = None
+            elif isinstance(v, dict):
+                clean_dict(v)
+        return d
+
+    def gemini_generate(prompt, max_output_tokens=1024):
+        """
+        Send one generateContent request, taking a slot from the shared rate limiter.
+        Returns (text, error); exactly one of them is None.
+        """
+        return fetch_layer.run(async_gemini_generate(
+            prompt, GEMINI_API_KEY, GEMINI_MODEL, max_output_tokens=max_output_tokens, timeout=GEMINI_TIMEOUT,
+            bucket=gemini_bucket, rate_wait_timeout=GEMINI_RATE_WAIT_TIMEOUT))
+
     def get_gemini_analysis(summary_text):
         """
-        Call Gemini API to analyze a research summary and extract structured information.
+        Analyze a research summary, serving repeated abstracts from the LLM cache.
         Returns dict with analysis results or error info.
         """
         if not GEMINI_API_KEY:
             return {"analysis_error": "GEMINI_API_KEY not configured"}
-        
+        if analysis_cache is None:
+            return call_gemini(summary_text)
+        return analysis_cache.get_or_compute(summary_text, lambda: call_gemini(summary_text))
+
+    def call_gemini(summary_text):
+        """
+        Call Gemini API to analyze a research summary and extract structured information.
+        Returns dict with analysis results or error info.
+        """
         try:
             prompt = f"""Analyze the following research summary and provide:
-1. TRL (Technology Readiness Level) from 1-9
-2. TRL justification (brief explanation)
-3. Key technologies mentioned (comma-separated list)
-4. Funding details if mentioned (amount and source)
-5. Progress/status (e.g., prototype, pilot, commercial)
-6. Strategic importance (1-10 rating with brief explanation)
+{ANALYSIS_FIELDS}
 
 Research Summary:
 {summary_text}
 
-Respond in JSON format with keys: TRL, TRL_justification, technologies, funding_details, progress, strategic_rating, strategic_summary"""
+Respond in JSON format with keys: {ANALYSIS_KEYS}"""
 
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }],
-                "generationConfig": {
-                    "temperature": 0.3,
-                    "maxOutputTokens": 1024
-                }
-            }
-            
-            resp = requests.post(url, json=payload, timeout=GEMINI_TIMEOUT)
-            if resp.status_code != 200:
-                return {"analysis_error": f"Gemini API error: {resp.status_code}"}
+            text, error = gemini_generate(prompt)
+            if error:
+                return {"analysis_error": error}
             
-            result = resp.json()
-            if 'candidates' in result and len(result['candidates']) > 0:
-                text = result['candidates'][0].get('content', {}).get('parts', [{}])[0].get('text', '')
-                # Try to parse JSON from response
-                try:
-                    # Remove markdown code blocks if present
-                    text = text.strip()
-                    if text.startswith('```'):
-                        lines = text.split('\n')
-                        text = '\n'.join(lines[1:-1]) if len(lines) > 2 else text
-                    
-                    analysis = json.loads(text)
-                    
-                    # Clean NaN values in analysis
-                    def clean_dict(d):
-                        for k, v in list(d.items()):
-                            if isinstance(v, float) and (v != v):
-                                d[k] = None
-                            elif isinstance(v, dict):
-                                clean_dict(v)
-                        return d
-                    
-                    analysis = clean_dict(analysis)
-                    return analysis
-                except json.JSONDecodeError:
-                    # If not valid JSON, return raw text
-                    return {"raw_analysis": text}
-            
-            return {"analysis_error": "No valid response from Gemini"}
+            # Try to parse JSON from response
+            try:
+                # Remove markdown code blocks if present
+                text = text.strip()
+                if text.startswith('```'):
+                    lines = text.split('\n')
+                    text = '\n'.join(lines[1:-1]) if len(lines) > 2 else text
+                
+                analysis = json.loads(text)
+                return clean_dict(analysis)
+            except json.JSONDecodeError:
+                # If not valid JSON, return raw text
+                return {"raw_analysis": text}
         except Exception as e:
             return {"analysis_error": str(e)}
 
+    def call_gemini_batch(summaries):
+        """
+        Analyze several summaries with a single generateContent request.
+        Returns a list aligned with summaries; entries the model dropped or
+        mangled are None. Returns an error string instead if the request itself
+        could not be made (rate limit wait, HTTP error).
+        """
+        try:
+            prompt = f"""Analyze each of the following research summaries. For each one provide:
+{ANALYSIS_FIELDS}
+
+Each summary is preceded by a [DOC n] header.
+
+{format_batch_documents(summaries)}
+
+Respond with a JSON array only, one object per summary, each with keys: index (the n from its [DOC n] header), {ANALYSIS_KEYS}"""
+
+            text, error = gemini_generate(prompt, max_output_tokens=min(8192, 512 * len(summaries)))
+            if error:
+                return error
+            return [clean_dict(a) if a is not None else None for a in parse_batch_response(text, len(summaries))]
+        except Exception as e:
+            return str(e)
+
+    def get_gemini_batch_analysis(summaries):
+        """
+        Batch counterpart of get_gemini_analysis. Cached summaries are served
+        from the LLM cache, the rest go out in one request, and any entry missing
+        from a malformed batch response is retried on its own.
+        Returns a list of analysis dicts aligned with summaries.
+        """
+        if not GEMINI_API_KEY:
+            return [{"analysis_error": "GEMINI_API_KEY not configured"} for _ in summaries]
+        
+        results = [None] * len(summaries)
+        pending = []
+        for i, s in enumerate(summaries):
+            cached = analysis_cache.get(s) if analysis_cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+        
+        if len(pending) > 1:
+            batch = call_gemini_batch([summaries[i] for i in pending])
+            if isinstance(batch, str):
+                # The request never produced output; retrying each doc would hit the same wall
+                if "rate limit" in batch:
+                    for i in pending:
+                        results[i] = {"analysis_error": batch}
+                    return results
+                batch = [None] * len(pending)
+            for i, analysis in zip(pending, batch):
+                if analysis is not None:
+                    results[i] = analysis
+                    if analysis_cache is not None:
+                        analysis_cache.set(summaries[i], analysis)
+        
+        for i in pending:
+            if results[i] is None:
+                results[i] = get_gemini_analysis(summaries[i])
+        return results
+
+    def iter_analyze_docs(docs):
+        """
+        Run Gemini analysis over docs, packing consecutive summaries into batch
+        requests of at most GEMINI_BATCH_MAX_DOCS / GEMINI_BATCH_TOKEN_BUDGET.
+        At most GEMINI_MAX_IN_FLIGHT requests run at once and at most GEMINI_RPM
+        requests go out per minute. Docs are updated in place; as each batch
+        finishes, yields (indices into docs, latency in ms).
+        """
+        def analyze_batch(summaries):
+            start = time.perf_counter()
+            try:
+                if len(summaries) == 1:
+                    analyses = [get_gemini_analysis(summaries[0])]
+                else:
+                    analyses = get_gemini_batch_analysis(summaries)
+            except Exception as e:
+                print(f"Gemini analysis error: {e}")
+                analyses = [{"analysis_error": str(e)} for _ in summaries]
+            return analyses, (time.perf_counter() - start) * 1000.0
+
+        if not docs:
+            return
+        summaries = [d.get('summary', '') for d in docs]
+        batches = pack_batches(summaries, GEMINI_BATCH_TOKEN_BUDGET, GEMINI_BATCH_MAX_DOCS)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(GEMINI_MAX_IN_FLIGHT, len(batches))) as executor:
+            future_to_batch = {executor.submit(analyze_batch, [summaries[i] for i in b]): b for b in batches}
+            for fut in concurrent.futures.as_completed(future_to_batch):
+                batch = future_to_batch[fut]
+                analyses, latency_ms = fut.result()
+                for i, analysis in zip(batch, analyses):
+                    if isinstance(analysis, dict):
+                        docs[i].update(analysis)
+                yield batch, round(latency_ms, 1)
+
     # ========================================
     # DATABASE OPERATIONS
     # ========================================
-    def save_to_db(df):
-        """Save DataFrame of documents to MongoDB"""
+    def save_to_db(docs, topic=None):
+        """
+        Save DocumentRecords to MongoDB with unordered bulk upserts, fold
+        their technologies into the keyword_pairs counts for `topic` and
+        refresh the monthly rollups they touch.
+        Returns upserted/modified/failed counts.
+        """
         try:
-            if df.empty:
-                return
+            if not docs:
+                return None
             
-            records = df.to_dict('records')
-            # Convert datetime objects to strings and handle NaN values
-            for rec in records:
-                for k, v in list(rec.items()):
-                    if isinstance(v, pd.Timestamp):
-                        rec[k] = v.isoformat()
-                    elif isinstance(v, (list, dict)):
-                        rec[k] = v  # Keep as is
-                    elif pd.isna(v):
-                        rec[k] = None
+            doc_signatures = [signatures(doc) for doc in docs]
+            records = []
+            for doc, sigs in zip(docs, doc_signatures):
+                rec = doc.to_storage()
+                rec['minhash'] = encode_signatures(sigs)
+                records.append(annotate(rec))
             
             # Upsert based on title or url
-            for rec in records:
-                query = {}
+            def upsert_key(rec):
                 if rec.get('url'):
-                    query['url'] = rec['url']
-                elif rec.get('title'):
-                    query['title'] = rec['title']
-                else:
-                    continue
-                
-                db.documents.update_one(query, {"$set": rec}, upsert=True)
+                    return {'url': rec['url']}
+                if rec.get('title'):
+                    return {'title': rec['title']}
+                return None
+            
+            touched = []
+            deltas = keyword_pairs.stage(db.documents, records, upsert_key, topic=topic, touched=touched)
+            failed = set()
+            stats = bulk_upsert(db.documents, records, upsert_key, chunk_size=DB_BULK_CHUNK_SIZE, failed=failed)
+            if failed:
+                # Only count what was stored; the failed records keep their previous pair_state
+                deltas = count_changes(touched, skip=failed)
+            try:
+                stats["keyword_pairs"] = keyword_pairs.apply(deltas)
+            except Exception as e:
+                print(f"Keyword pair update failed: {e}")
+            try:
+                stats["rollups"] = rollups.refresh_for(touched)
+            except Exception as e:
+                print(f"Rollup refresh failed: {e}")
+            for doc, sigs in zip(docs, doc_signatures):
+                stored_duplicates.add(doc, sigs)
+            return stats
         except Exception as e:
             print(f"Error saving to DB: {e}")
             import traceback
             traceback.print_exc()
+            return None
 
     # ========================================
     # TRL SCORING
@@ -210,316 +369,281 @@ Respond in JSON format with keys: TRL, TRL_justification, technologies, funding_
     # ========================================
     # FETCHERS: arXiv, Google Scholar, DB
     # ========================================
-    def fetch_arxiv_papers(query, max_results=ARXIV_MAX_RESULTS, timeout=ARXIV_TIMEOUT):
-        """Fetch papers from arXiv API"""
+    def fetch_new_arxiv_papers(query, max_results=ARXIV_MAX_RESULTS, timeout=ARXIV_TIMEOUT):
+        """
+        Fetch up to max_results arXiv papers newer than the topic's high-water
+        mark, oldest first, so papers past the cap come in a later run. The
+        mark is not moved here; call arxiv_marks.advance_from() once the
+        papers are saved.
+        """
         try:
-            q = requests.utils.requote_uri(query)
-            url = f"http://export.arxiv.org/api/query?search_query=all:{q}&start=0&max_results={max_results}&sortBy=submittedDate&sortOrder=descending"
-            resp = requests.get(url, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
-            if resp.status_code != 200 or not resp.text:
-                return []
-            
-            root = ET.fromstring(resp.text)
-            ns = {"atom": "http://www.w3.org/2005/Atom"}
-            entries = []
-            
-            for entry in root.findall("atom:entry", ns):
-                title = entry.find("atom:title", ns).text if entry.find("atom:title", ns) is not None else ""
-                summary = entry.find("atom:summary", ns).text if entry.find("atom:summary", ns) is not None else ""
-                published = entry.find("atom:published", ns).text if entry.find("atom:published", ns) is not None else ""
-                authors = [a.find("atom:name", ns).text for a in entry.findall("atom:author", ns) if a.find("atom:name", ns) is not None]
-                
-                link = ""
-                for l in entry.findall("atom:link", ns):
-                    href = l.attrib.get("href", "")
-                    if href and (l.attrib.get("type", "").startswith("text/html") or l.attrib.get("rel") == "alternate"):
-                        link = href
-                
-                doc = {
-                    "title": (title or "").strip(),
-                    "summary": (summary or "").strip(),
-                    "published": published,
-                    "authors": authors,
-                    "source": "arXiv",
-                    "url": link or f"https://arxiv.org/abs/{entry.find('atom:id', ns).text.split('/')[-1]}" if entry.find('atom:id', ns) is not None else "",
-                    "funding_details": "0"
-                }
-                entries.append(doc)
-            
-            return entries
+            return list(harvest_new(query, arxiv_marks, max_records=max_results, commit=False,
+                                    page_size=max_results, timeout=timeout))
         except Exception as e:
-            print(f"arXiv fetch error: {e}")
+            print(f"arXiv incremental fetch error: {e}")
             return []
 
-    def fetch_scholar_via_serpapi(query, api_key=SERPAPI_KEY, max_results=SERPAPI_MAX_RESULTS, timeout=SERPAPI_TIMEOUT):
-        """Fetch papers from Google Scholar via SerpAPI"""
-        try:
-            if not api_key:
-                return []
-            
-            params = {
-                "engine": "google_scholar",
-                "q": query,
-                "api_key": api_key,
-                "num": max_results
-            }
-            resp = requests.get("https://serpapi.com/search", params=params, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
-            if resp.status_code != 200 or not resp.text:
-                return []
-            
-            j = resp.json()
-            organic = j.get("organic_results") or j.get("scholar_results") or j.get("organic") or []
-            results = []
-            
-            for item in organic[:max_results]:
-                title = item.get("title") or item.get("headline") or item.get("title_noformat") or ""
-                snippet = item.get("snippet") or item.get("citation") or item.get("abstract") or item.get("snippet_highlighted") or ""
-                
-                authors = []
-                pub_info = item.get("publication_info") or {}
-                if isinstance(pub_info, dict) and pub_info.get("authors"):
-                    try:
-                        authors = [a.get("name") if isinstance(a, dict) else str(a) for a in pub_info.get("authors")]
-                    except Exception:
-                        authors = []
-                
-                if not authors and item.get("authors"):
-                    authors = item.get("authors")
-                
-                link = item.get("link") or item.get("source") or item.get("url") or ""
-                
-                # Try to get actual paper link from inline_links or other fields
-                if not link and item.get("inline_links"):
-                    inline = item.get("inline_links", {})
-                    link = inline.get("serpapi_cite_link") or inline.get("cited_by", {}).get("link") or ""
-                
-                year = ""
-                if isinstance(pub_info, dict):
-                    year = pub_info.get("year") or pub_info.get("summary") or ""
-                
-                # Skip entries without valid links
-                if not link or link == "":
-                    continue
-                
-                doc = {
-                    "title": (title or "").strip(),
-                    "summary": (snippet or "").strip(),
-                    "published": year,
-                    "authors": authors,
-                    "source": "Google Scholar (SerpAPI)",
-                    "url": link or "",
-                    "funding_details": "0"
-                }
-                results.append(doc)
-            
-            return results
-        except Exception as e:
-            print(f"Scholar fetch error: {e}")
-            return []
+    def to_response_doc(doc):
+        """Map a stored document onto the fields the document endpoints return"""
+        return {
+            "title": doc.get("title", ""),
+            "summary": doc.get("summary", "") or doc.get("abstract", ""),
+            "published": doc.get("published", ""),
+            "authors": doc.get("authors", []),
+            "source": doc.get("source", "MongoDB"),
+            "url": doc.get("url", ""),
+            "funding_details": doc.get("funding_details", "0"),
+            "TRL": doc.get("TRL"),
+            "TRL_justification": doc.get("TRL_justification"),
+            "technologies": doc.get("technologies"),
+            "progress": doc.get("progress"),
+            "strategic_rating": doc.get("strategic_rating"),
+            "strategic_summary": doc.get("strategic_summary"),
+            "score": doc.get("score")
+        }
 
-    def fetch_from_db(query, max_results=10):
-        """Fetch documents from MongoDB"""
+    def fetch_from_db(query, max_results=10, mode="text", sort=None):
+        """
+        Fetch documents from MongoDB.
+        mode="text" uses the weighted text index (newest first unless
+        sort="relevance"); mode="regex" is the unindexed substring fallback.
+        Values are left as BSON types (ObjectId, datetime, Decimal128);
+        encode the result with serialization.dumps.
+        """
         try:
-            query_db = {
-                "$or": [
-                    {"title": {"$regex": query, "$options": "i"}},
-                    {"technologies": {"$regex": query, "$options": "i"}},
-                    {"summary": {"$regex": query, "$options": "i"}}
-                ]
-            }
-            db_docs = list(db.documents.find(query_db).sort("published", -1).limit(max_results))
-            results = []
-            
-            for d in db_docs:
-                # Parse with json_util to handle BSON types, then convert back
-                doc_str = json_util.dumps(d)
-                doc = json.loads(doc_str)
-                
-                # Flatten any remaining BSON objects
-                def flatten_bson(obj):
-                    if isinstance(obj, dict):
-                        if '$numberDouble' in obj:
-                            return float(obj['$numberDouble'])
-                        if '$numberInt' in obj:
-                            return int(obj['$numberInt'])
-                        if '$date' in obj:
-                            return obj['$date']
-                        if '$oid' in obj:
-                            return obj['$oid']
-                        return {k: flatten_bson(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [flatten_bson(item) for item in obj]
-                    return obj
-                
-                doc = flatten_bson(doc)
-                
-                results.append({
-                    "title": doc.get("title", ""),
-                    "summary": doc.get("summary", "") or doc.get("abstract", ""),
-                    "published": doc.get("published", ""),
-                    "authors": doc.get("authors", []),
-                    "source": doc.get("source", "MongoDB"),
-                    "url": doc.get("url", ""),
-                    "funding_details": doc.get("funding_details", "0"),
-                    "TRL": doc.get("TRL"),
-                    "TRL_justification": doc.get("TRL_justification"),
-                    "technologies": doc.get("technologies"),
-                    "progress": doc.get("progress"),
-                    "strategic_rating": doc.get("strategic_rating"),
-                    "strategic_summary": doc.get("strategic_summary")
-                })
-            
-            return results
+            # Projection keeps unused fields (raw analyses, entities, ...) from being decoded
+            cursor = search_documents(db.documents, query, limit=max_results, mode=mode, sort=sort,
+                                      projection=DOCUMENT_PROJECTION)
+            return [to_response_doc(doc) for doc in cursor]
         except Exception as e:
             print(f"DB fetch error: {e}")
             import traceback
             traceback.print_exc()
             return []
 
-    def fetch_combined_papers(query, desired_num=10):
+    def fetch_combined_papers(query, desired_num=10, new_only=False):
         """
-        Fetch papers from multiple sources concurrently:
+        Fetch papers from multiple sources concurrently on the shared fetch loop:
         1. arXiv
         2. Google Scholar (via SerpAPI)
-        3. MongoDB (existing documents)
+        3. MongoDB (existing documents, only with FETCH_DB_FALLBACK=1)
         
-        Deduplicates by URL/title and returns up to desired_num results.
-        Sorts results: arXiv first, then Scholar, then DB.
+        Deduplicates by URL/title, collapses near-duplicates (MinHash/LSH over
+        title and summary) and returns up to desired_num results.
+        Sorts results: arXiv first, then Scholar, then DB. Sources that miss
+        FETCH_DEADLINE are cancelled and left out.
+        With new_only, arXiv is asked only for papers newer than the topic's
+        high-water mark (uncached, since the answer moves with the mark).
         """
-        results = []
-        
-        # Run all fetchers concurrently (disable DB for now)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as exe:
-            future_arxiv = exe.submit(fetch_arxiv_papers, query, max_results=desired_num, timeout=ARXIV_TIMEOUT)
-            future_scholar = exe.submit(fetch_scholar_via_serpapi, query, api_key=SERPAPI_KEY, max_results=desired_num, timeout=SERPAPI_TIMEOUT)
-            # future_db = exe.submit(fetch_from_db, query, max_results=desired_num)
-            
-            arxiv_res = []
-            scholar_res = []
-            db_res = []  # Empty for now
-            
-            try:
-                arxiv_res = future_arxiv.result(timeout=ARXIV_TIMEOUT + 1)
-            except Exception as e:
-                print(f"arXiv future error: {e}")
-            
-            try:
-                scholar_res = future_scholar.result(timeout=SERPAPI_TIMEOUT + 1)
-            except Exception as e:
-                print(f"Scholar future error: {e}")
-            
-            # Disable DB fetch temporarily
-            # try:
-            #     db_res = future_db.result(timeout=5)
-            # except Exception as e:
-            #     print(f"DB future error: {e}")
-
-        # Deduplicate by URL or title
-        seen = set()
-        arxiv_final = []
-        scholar_final = []
-        db_final = []
-
-        def normalize_key(doc):
-            url = (doc.get("url") or "").strip()
-            title = (doc.get("title") or "").strip().lower()
-            if url:
-                return url
-            return title
-
-        # Separate by source while deduplicating
-        for doc in (arxiv_res or []):
-            key = normalize_key(doc)
-            if key and key not in seen:
-                seen.add(key)
-                arxiv_final.append(doc)
-
-        for doc in (scholar_res or []):
-            key = normalize_key(doc)
-            if key and key not in seen:
-                seen.add(key)
-                scholar_final.append(doc)
-
-        for doc in (db_res or []):
-            key = normalize_key(doc)
-            if key and key not in seen:
-                seen.add(key)
-                db_final.append(doc)
-
-        # Combine: arXiv first, then Scholar, then DB
-        combined = arxiv_final + scholar_final + db_final
-        return combined[:desired_num]
+        arxiv_fetch = None
+        deadline = FETCH_DEADLINE
+        if new_only:
+            arxiv_fetch = lambda: fetch_new_arxiv_papers(query, max_results=desired_num, timeout=ARXIV_TIMEOUT)
+            # The harvester spaces arXiv calls politely; don't cut it off mid-page
+            deadline = None
+        try:
+            # Upstream results are cached per (source, query, size); identical concurrent searches share one call
+            return fetch_combined_sync(query, desired_num, deadline=deadline, cache=fetch_cache,
+                                       arxiv_fetch=arxiv_fetch,
+                                       db_fallback=fetch_from_db if FETCH_DB_FALLBACK else None)
+        except Exception as e:
+            print(f"Combined fetch error: {e}")
+            return []
 
     # ========================================
     # ANALYSIS PIPELINE
     # ========================================
-    def run_analysis_pipeline(topic, num_documents=5):
+    STORED_ANALYSIS_FIELDS = ("TRL", "TRL_justification", "technologies", "funding_details",
+                              "progress", "strategic_rating", "strategic_summary", "analyzed_at")
+
+    def as_datetime(value):
+        if isinstance(value, datetime):
+            return value.replace(tzinfo=None) if value.tzinfo else value
+        if isinstance(value, str) and value:
+            try:
+                parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+            return parsed.replace(tzinfo=None) if parsed.tzinfo else parsed
+        return None
+
+    def merge_stored_analyses(docs, max_age_days=ANALYSIS_MAX_AGE_DAYS):
+        """
+        Look up all docs in aetos_db.documents with a single $in query and copy
+        over stored analyses that are younger than max_age_days. Only analyses
+        with an analyzed_at stamp (a real Gemini result) are reused.
+        Returns the number of docs that were filled in.
+        """
+        urls = [d["url"] for d in docs if d.get("url")]
+        titles = [d["title"] for d in docs if not d.get("url") and d.get("title")]
+        clauses = []
+        if urls:
+            clauses.append({"url": {"$in": urls}})
+        if titles:
+            clauses.append({"title": {"$in": titles}})
+        if not clauses:
+            return 0
+        
+        projection = {"_id": 0, "url": 1, "title": 1, **{f: 1 for f in STORED_ANALYSIS_FIELDS}}
+        by_url, by_title = {}, {}
+        for stored in db.documents.find({"$or": clauses}, projection):
+            if stored.get("url"):
+                by_url[stored["url"]] = stored
+            if stored.get("title"):
+                by_title[stored["title"]] = stored
+        
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        reused = 0
+        for doc in docs:
+            stored = by_url.get(doc.get("url")) if doc.get("url") else by_title.get(doc.get("title"))
+            if not stored:
+                continue
+            analyzed_at = as_datetime(stored.get("analyzed_at"))
+            if analyzed_at is None or analyzed_at < cutoff or not stored.get("TRL"):
+                continue
+            for field in STORED_ANALYSIS_FIELDS:
+                if stored.get(field) is not None:
+                    doc[field] = stored[field]
+            reused += 1
+        return reused
+
+    def replace_stored_duplicates(docs, keep_analysis=True):
+        """
+        Swap each doc that near-duplicates a stored paper from a preferred (or
+        the same) source for the stored copy, so the paper is neither analyzed
+        nor stored a second time under another URL. Without keep_analysis the
+        stored copy comes back unanalyzed. Returns (docs, replaced).
+        """
+        matches = {}
+        for pos, doc in enumerate(docs):
+            match = stored_duplicates.find(signatures(doc))
+            if match and match["url"] != doc.get("url") and source_priority(match) <= source_priority(doc):
+                matches[pos] = match["url"]
+        if not matches:
+            return docs, 0
+        
+        projection = {**DOCUMENT_PROJECTION, **{f: 1 for f in STORED_ANALYSIS_FIELDS}}
+        stored = {d["url"]: d for d in db.documents.find({"url": {"$in": sorted(set(matches.values()))}}, projection)}
+        result, seen, replaced = [], set(), 0
+        for pos, doc in enumerate(docs):
+            if pos in matches and matches[pos] in stored:
+                duplicate_url = doc.get("url")
+                doc = DocumentRecord.from_dict({k: v for k, v in stored[matches[pos]].items()
+                                                if keep_analysis or k not in STORED_ANALYSIS_FIELDS})
+                if duplicate_url:
+                    doc["duplicate_urls"] = sorted(set(doc.get("duplicate_urls") or []) | {duplicate_url})
+                replaced += 1
+            key = doc.get("url") or doc.get("title")
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append(doc)
+        return result, replaced
+
+    def advance_arxiv_mark(topic, papers):
+        """Move the topic's high-water mark past the arXiv papers this run has handled"""
+        try:
+            arxiv_marks.advance_from(topic, [p for p in papers if p.get("source") == "arXiv" and p.get("id")])
+        except Exception as e:
+            print(f"High-water mark update failed: {e}")
+
+    def iter_analysis_pipeline(topic, num_documents=5, progress=None, incremental=INCREMENTAL_ANALYSIS,
+                               new_only=False):
         """
-        Complete analysis pipeline:
+        Complete analysis pipeline, yielding events as each stage finishes:
         1. Fetch papers from multiple sources
-        2. Filter and clean
-        3. Run Gemini analysis on summaries
+        2. Filter and clean -> {"event": "documents", "documents": [...]}
+        3. Run Gemini analysis on summaries -> {"event": "analysis", "index": i, "document": {...}}
+           per document as its Gemini call returns (index into the documents event,
+           with a provisional TRL)
         4. Score TRL
         5. Save to database
-        6. Return enriched documents
+        6. Return enriched documents -> {"event": "summary", "status": ..., "documents": [...], ...}
+
+        Near-duplicates of recently stored papers (the same work under another
+        URL) are swapped for the stored copy before analysis.
+        With `incremental`, stored analyses for the same URLs are merged in first
+        (one batched lookup) so only new or stale documents reach Gemini.
+        With `new_only`, arXiv is only asked for papers newer than the topic's
+        high-water mark, which advances once the run has saved them.
+
+        `progress(stage, status=None, done=None, total=None)` is called as each
+        stage starts and finishes (used by the job API).
         """
+        report = progress or (lambda *a, **k: None)
         max_results = max(1, int(num_documents))
         
         # Fetch papers
-        papers = fetch_combined_papers(topic, desired_num=max_results)
+        report("fetch", "running")
+        papers = fetch_combined_papers(topic, desired_num=max_results, new_only=new_only)
+        report("fetch", "done", done=len(papers), total=max_results)
         
         if not papers:
-            return {"status": "complete", "documents": [], "message": "No documents found."}
+            yield {"event": "summary", "status": "complete", "documents": [], "message": "No documents found."}
+            return
         
-        # Convert to DataFrame for easier processing
-        df = pd.DataFrame(papers)
-        
-        # Normalize published column
-        if 'published' in df.columns:
-            df['published'] = pd.to_datetime(df['published'], errors='coerce')
-        
-        # Filter out documents with very short summaries
+        # Filter out documents with very short summaries; published is parsed to datetime
+        report("filter", "running")
         MIN_SUMMARY_LENGTH = 80
-        df = df[df.get('summary', pd.Series()).str.len() >= MIN_SUMMARY_LENGTH]
+        processed_docs = to_records(papers, min_summary_length=MIN_SUMMARY_LENGTH)
+        near_duplicates = 0
+        try:
+            processed_docs, near_duplicates = replace_stored_duplicates(processed_docs, keep_analysis=incremental)
+        except Exception as e:
+            print(f"Near-duplicate lookup failed: {e}")
+        report("filter", "done", done=len(processed_docs), total=len(papers))
         
-        if df.empty:
-            return {"status": "complete", "documents": [], "message": "No high-quality documents found."}
+        if not processed_docs:
+            if new_only:
+                advance_arxiv_mark(topic, papers)
+            yield {"event": "summary", "status": "complete", "documents": [], "message": "No high-quality documents found."}
+            return
         
-        # Process each document
-        processed_docs = []
-        for _, row in df.iterrows():
-            doc = row.to_dict()
-            
-            # Convert NaN to None, handle lists/arrays specially
-            cleaned = {}
-            for k, v in doc.items():
-                if isinstance(v, list):
-                    cleaned[k] = v
-                elif pd.isna(v):
-                    cleaned[k] = None
-                else:
-                    cleaned[k] = v
-            doc = cleaned
-            
+        # Pick the ones that still need analysis
+        report("analyze", "running", done=0, total=len(processed_docs))
+        reused = 0
+        if incremental:
+            try:
+                reused = merge_stored_analyses(processed_docs)
+            except Exception as e:
+                print(f"Stored analysis lookup failed: {e}")
+        
+        to_analyze = []
+        analyze_positions = []
+        for pos, doc in enumerate(processed_docs):
             # Skip if already analyzed (has TRL from DB)
             if doc.get('TRL') and doc.get('TRL_justification'):
-                processed_docs.append(doc)
                 continue
             
             # Run Gemini analysis if summary is substantial
             summary = doc.get('summary', '')
             if summary and len(summary.split()) >= 20:
-                try:
-                    analysis = get_gemini_analysis(summary)
-                    if isinstance(analysis, dict):
-                        doc.update(analysis)
-                except Exception as e:
-                    print(f"Gemini analysis error: {e}")
-                    doc['analysis_error'] = str(e)
-            
-            processed_docs.append(doc)
+                to_analyze.append(doc)
+                analyze_positions.append(pos)
+        
+        yield {"event": "documents", "documents": [doc.to_dict() for doc in processed_docs]}
+        
+        done = len(processed_docs) - len(to_analyze)
+        latencies = [0.0] * len(to_analyze)
+        for batch, latency_ms in iter_analyze_docs(to_analyze):
+            analyzed_at = datetime.utcnow()
+            for i in batch:
+                latencies[i] = latency_ms
+                doc = to_analyze[i]
+                if "analysis_error" not in doc and "raw_analysis" not in doc:
+                    doc["analyzed_at"] = analyzed_at
+                trl_val, justification = score_doc_trl(doc)
+                yield {
+                    "event": "analysis",
+                    "index": analyze_positions[i],
+                    "document": {**doc.to_dict(), "TRL": trl_val, "TRL_justification": doc.get("TRL_justification") or justification}
+                }
+            done += len(batch)
+            report("analyze", done=done)
+        report("analyze", "done", done=len(processed_docs))
         
         # Score TRL for all documents
+        report("score", "running", done=0, total=len(processed_docs))
         scored = score_docs_concurrently(processed_docs)
         enriched = []
         for doc, trl_val, justification in scored:
@@ -538,63 +662,216 @@ Respond in JSON format with keys: TRL, TRL_justification, technologies, funding_
             if not doc.get("funding_details"):
                 doc["funding_details"] = "0"
             
-            # Clean all numeric fields
-            for k, v in list(doc.items()):
-                if isinstance(v, float) and (v != v):  # NaN
-                    doc[k] = None
-            
             enriched.append(doc)
+        report("score", "done", done=len(enriched))
         
         # Save to database
+        report("save", "running")
+        save_stats = None
         if enriched:
             try:
-                df_enriched = pd.DataFrame(enriched)
-                save_to_db(df_enriched)
+                save_stats = save_to_db(enriched, topic=topic)
             except Exception as e:
                 print(f"DB save error: {e}")
+        if new_only and save_stats is not None:
+            advance_arxiv_mark(topic, papers)
+        report("save", "done", done=len(enriched))
         
-        return {
+        yield {
+            "event": "summary",
             "status": "complete",
-            "documents": enriched,
-            "message": f"Processed {len(enriched)} documents."
+            "documents": [doc.to_dict() for doc in enriched],
+            "message": f"Processed {len(enriched)} documents ({reused} reused, {len(to_analyze)} analyzed).",
+            "analysis_stats": {
+                "analyzed": len(latencies),
+                "reused": reused,
+                "near_duplicates": near_duplicates,
+                "latency_ms": [
+                    {"url": d.get("url") or d.get("title"), "latency_ms": ms}
+                    for d, ms in zip(to_analyze, latencies)
+                ],
+                "max_latency_ms": max(latencies) if latencies else 0.0
+            },
+            "save_stats": save_stats
         }
 
+    def run_analysis_pipeline(topic, num_documents=5, progress=None, incremental=INCREMENTAL_ANALYSIS,
+                              new_only=False):
+        """
+        Run iter_analysis_pipeline to completion and return its summary:
+        {"status", "documents", "message", "analysis_stats", "save_stats"}
+        """
+        result = None
+        for event in iter_analysis_pipeline(topic, num_documents=num_documents, progress=progress,
+                                            incremental=incremental, new_only=new_only):
+            if event["event"] == "summary":
+                result = {k: v for k, v in event.items() if k != "event"}
+        return result
+
     # ========================================
     # API ROUTES
     # ========================================
     @app.route("/api/documents/<topic>", methods=['GET'])
     def get_documents(topic):
-        """Get documents from database matching topic"""
+        """
+        Get documents from database matching topic
+        Query params:
+        - limit: max documents (default: 50)
+        - mode: "text" (default, indexed phrase match) or "regex" (substring fallback)
+        - sort: "published" (default, newest first) or "relevance" (text mode only)
+        - page_size / cursor: keyset pagination ordered by published. Returns
+          {"documents": [...], "next_cursor": token}; pass next_cursor back as
+          cursor to get the following page (null on the last page).
+        - format: "ndjson" streams one document per line straight from the
+          Mongo cursor (no limit unless one is given; cursor resumes a stream)
+        """
         try:
+            mode = request.args.get("mode", "text")
+            sort = request.args.get("sort")
+            after = request.args.get("cursor")
+            if mode not in SEARCH_MODES or (sort and sort not in SORT_ORDERS):
+                return jsonify({"error": f"mode must be one of {SEARCH_MODES}, sort one of {SORT_ORDERS}"}), 400
+            if after:
+                try:
+                    decode_cursor(after)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                if sort == "relevance":
+                    return jsonify({"error": "cursor pagination requires sort=published"}), 400
+            
+            if request.args.get("format") == "ndjson":
+                limit = int(request.args["limit"]) if "limit" in request.args else None
+                cursor = search_documents(db.documents, topic, limit=limit, mode=mode, sort=sort,
+                                          projection=DOCUMENT_PROJECTION, after=after)
+                
+                def generate():
+                    try:
+                        for doc in cursor:
+                            yield dumps(to_response_doc(doc)) + b"\n"
+                    except Exception as e:
+                        print(f"NDJSON stream aborted: {e}")
+                    finally:
+                        cursor.close()
+                
+                return app.response_class(generate(), mimetype="application/x-ndjson")
+            
+            if "page_size" in request.args or after:
+                page_size = max(1, min(MAX_PAGE_SIZE, int(request.args.get("page_size", "50"))))
+                docs, next_cursor = search_page(db.documents, topic, page_size, mode=mode,
+                                                projection=DOCUMENT_PROJECTION, after=after)
+                return json_response({
+                    "documents": [to_response_doc(d) for d in docs],
+                    "next_cursor": next_cursor
+                })
+            
             limit = int(request.args.get("limit", "50"))
-            docs = fetch_from_db(topic, max_results=limit)
-            return jsonify(docs)
+            docs = fetch_from_db(topic, max_results=limit, mode=mode, sort=sort)
+            return json_response(docs)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/convergence", methods=['GET'])
+    def get_convergence():
+        """
+        Strongest technology pairs from the keyword_pairs counts
+        Query params:
+        - topic: analysis topic (default: all topics)
+        - start / end: publication months, YYYY-MM, inclusive (default: all time)
+        - limit: number of pairs (default: 10)
+        """
+        try:
+            limit = max(1, min(MAX_PAGE_SIZE, int(request.args.get("limit", "10"))))
+            start, end = request.args.get("start"), request.args.get("end")
+            for bound in (start, end):
+                if bound is not None and not re.fullmatch(r"\d{4}-\d{2}", bound):
+                    return jsonify({"error": "start and end must be YYYY-MM"}), 400
+            pairs = keyword_pairs.top_pairs(request.args.get("topic"), start=start, end=end, limit=limit)
+            return json_response({"pairs": pairs})
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/analytics/timeseries", methods=['GET'])
+    def get_timeseries():
+        """
+        Monthly or yearly series from the precomputed rollups: document count,
+        cumulative count, average TRL, source mix and funding sum per period
+        Query params:
+        - dim: "topic" (default) or "technology"
+        - key: the topic or technology (default for topics: all topics)
+        - start / end: publication months, YYYY-MM, inclusive
+        - granularity: "month" (default) or "year"
+        """
+        try:
+            dim = request.args.get("dim", "topic")
+            granularity = request.args.get("granularity", "month")
+            start, end = request.args.get("start"), request.args.get("end")
+            for bound in (start, end):
+                if bound is not None and not re.fullmatch(r"\d{4}-\d{2}", bound):
+                    return jsonify({"error": "start and end must be YYYY-MM"}), 400
+            if dim == "technology" and not request.args.get("key"):
+                return jsonify({"error": "key is required for dim=technology"}), 400
+            try:
+                series = rollups.series(dim, request.args.get("key"), start=start, end=end, granularity=granularity)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return json_response({"dim": dim, "key": request.args.get("key"), "granularity": granularity,
+                                  "series": series})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    def json_response(payload, status=200):
+        """Encode payload in one pass (BSON types and NaN included) into a JSON response"""
+        return app.response_class(dumps(payload), status=status, mimetype="application/json")
+
+    def clean_nan(obj):
+        """Recursively replace NaN floats with None so the payload is valid JSON"""
+        if isinstance(obj, dict):
+            return {k: clean_nan(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [clean_nan(item) for item in obj]
+        elif isinstance(obj, float):
+            if obj != obj:  # NaN check
+                return None
+            return obj
+        return obj
+
+    def incremental_arg():
+        """?incremental=0 forces every document back through Gemini"""
+        return request.args.get("incremental", "1" if INCREMENTAL_ANALYSIS else "0") != "0"
+
+    def new_only_arg():
+        """?fetch=new only asks arXiv for papers newer than the topic's high-water mark"""
+        return request.args.get("fetch", "latest") == "new"
+
     @app.route("/api/analyze/<topic>", methods=['POST'])
     def analyze_topic(topic):
         """
         Analyze a topic: fetch papers, run AI analysis, score TRL, save to DB
         Query params:
         - n: number of documents to analyze (default: 5)
+        - incremental: "0" to re-analyze documents that already have a fresh stored analysis
+        - fetch: "new" to only fetch arXiv papers published since the last run for this topic
+        - mode: "job" to run in the background and return a job id immediately
+          (poll /api/jobs/<job_id> and fetch /api/jobs/<job_id>/result)
         """
         try:
             num = int(request.args.get("n", "5"))
-            result = run_analysis_pipeline(topic, num_documents=num)
             
-            # Clean NaN values before returning JSON
-            def clean_nan(obj):
-                if isinstance(obj, dict):
-                    return {k: clean_nan(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [clean_nan(item) for item in obj]
-                elif isinstance(obj, float):
-                    if obj != obj:  # NaN check
-                        return None
-                    return obj
-                return obj
+            if request.args.get("mode") == "job":
+                try:
+                    job_id = job_manager.submit(run_analysis_pipeline, topic, num_documents=num,
+                                                incremental=incremental_arg(), new_only=new_only_arg())
+                except JobQueueFull as e:
+                    return jsonify({"status": "busy", "error": str(e)}), 503
+                return jsonify({
+                    "status": "queued",
+                    "job_id": job_id,
+                    "status_url": f"/api/jobs/{job_id}",
+                    "result_url": f"/api/jobs/{job_id}/result"
+                }), 202
             
+            result = run_analysis_pipeline(topic, num_documents=num, incremental=incremental_arg(),
+                                           new_only=new_only_arg())
             result = clean_nan(result)
             return jsonify(result), 200
         except Exception as e:
@@ -602,6 +879,68 @@ Respond in JSON format with keys: TRL, TRL_justification, technologies, funding_
             traceback.print_exc()
             return jsonify({"status": "Analysis failed", "error": str(e)}), 500
 
+    @app.route("/api/analyze/<topic>/stream", methods=['GET', 'POST'])
+    def analyze_topic_stream(topic):
+        """
+        Streaming variant of /api/analyze: sends the fetched documents as soon as
+        they are available, an analysis event per document as its Gemini call
+        finishes, then a summary event (see iter_analysis_pipeline).
+        Query params:
+        - n: number of documents to analyze (default: 5)
+        - incremental: "0" to re-analyze documents that already have a fresh stored analysis
+        - fetch: "new" to only fetch arXiv papers published since the last run for this topic
+        - format: "ndjson" (default, one JSON event per line) or "sse" (text/event-stream)
+        """
+        try:
+            num = int(request.args.get("n", "5"))
+        except ValueError:
+            return jsonify({"error": "n must be an integer"}), 400
+        incremental = incremental_arg()
+        new_only = new_only_arg()
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in ("ndjson", "sse"):
+            return jsonify({"error": "format must be ndjson or sse"}), 400
+        
+        def encode(event):
+            if fmt == "sse":
+                return b"event: " + event["event"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+            return dumps(event) + b"\n"
+        
+        def generate():
+            try:
+                for event in iter_analysis_pipeline(topic, num_documents=num, incremental=incremental,
+                                                    new_only=new_only):
+                    yield encode(event)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                yield encode({"event": "error", "status": "Analysis failed", "error": str(e)})
+        
+        mimetype = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+        # Ask proxies not to buffer so each event reaches the client as it is produced
+        return app.response_class(generate(), mimetype=mimetype,
+                                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.route("/api/jobs/<job_id>", methods=['GET'])
+    def get_job_status(job_id):
+        """Report job status and per-stage progress"""
+        job = job_manager.status(job_id)
+        if job is None:
+            return jsonify({"status": "not found", "error": f"Unknown job {job_id}"}), 404
+        return jsonify(job), 200
+
+    @app.route("/api/jobs/<job_id>/result", methods=['GET'])
+    def get_job_result(job_id):
+        """Return the pipeline result once the job is complete (202 while pending)"""
+        job = job_manager.result(job_id)
+        if job is None:
+            return jsonify({"status": "not found", "error": f"Unknown job {job_id}"}), 404
+        if job["status"] == "failed":
+            return jsonify({"status": "Analysis failed", "error": job["error"]}), 500
+        if job["status"] != "complete":
+            return jsonify({"status": job["status"], "job_id": job_id}), 202
+        return jsonify(clean_nan(job["result"])), 200
+
     @app.route("/api/health", methods=['GET'])
     def health_check():
         """Health check endpoint"""
@@ -612,7 +951,11 @@ Respond in JSON format with keys: TRL, TRL_justification, technologies, funding_
                 "serpapi": "configured" if SERPAPI_KEY else "not configured",
                 "gemini": "configured" if GEMINI_API_KEY else "not configured",
                 "mongodb": "connected"
-            }
+            },
+            "llm_cache": analysis_cache.stats() if analysis_cache is not None else "disabled",
+            "http": http_client.get_client().stats(),
+            "async_fetch": fetch_layer.stats(),
+            "fetch_cache": fetch_cache.stats()
         })
 
     return app
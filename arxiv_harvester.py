@@ -0,0 +1,298 @@
+# arxiv_harvester.py
+"""
+Bulk arXiv harvester for historical backfills.
+
+Pages through the arXiv query API in `start`/`max_results` windows, keeping
+to arXiv's required delay between requests (a shared scheduler, so concurrent
+harvests in one process still space their calls). Each page is parsed
+incrementally with iterparse straight off the response stream, and entries
+are cleared as soon as they are normalized, so memory stays flat however many
+records are harvested. Records are yielded as a generator and can be fed
+directly into database.bulk_upsert:
+
+    python arxiv_harvester.py "quantum cryptography" --max 5000
+
+harvest_new() is the incremental variant: it only yields entries newer than
+a per-topic high-water mark kept in Mongo (see HighWaterMarks), oldest
+first, so a run cut short by its cap resumes where it stopped next time.
+
+The endpoint is configurable (ARXIV_API_URL or base_url=...) so the harvester
+can be pointed at a local fixture HTTP server.
+"""
+import os
+import time
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional
+
+import http_client
+
+logger = logging.getLogger("aetos.arxiv_harvester")
+
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+# arXiv's terms of use ask for at least 3 seconds between consecutive calls
+ARXIV_HARVEST_DELAY = float(os.getenv("ARXIV_HARVEST_DELAY", "3.0"))
+ARXIV_PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "200"))
+ARXIV_HARVEST_TIMEOUT = float(os.getenv("ARXIV_HARVEST_TIMEOUT", "30.0"))
+# arXiv occasionally returns an empty page mid-result-set; retry it a few times
+ARXIV_EMPTY_PAGE_RETRIES = int(os.getenv("ARXIV_EMPTY_PAGE_RETRIES", "3"))
+# Safety cap on one incremental run; the rest of the new entries come next run
+ARXIV_INCREMENTAL_MAX_RECORDS = int(os.getenv("ARXIV_INCREMENTAL_MAX_RECORDS", "1000"))
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+class PoliteScheduler:
+    """Blocks callers so consecutive requests are at least `delay` seconds apart."""
+
+    def __init__(self, delay: float = ARXIV_HARVEST_DELAY):
+        self.delay = delay
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_default_scheduler = PoliteScheduler()
+
+
+def _text(elem, tag: str) -> str:
+    child = elem.find(tag)
+    return (child.text or "").strip() if child is not None and child.text else ""
+
+
+def entry_to_record(entry) -> Dict[str, Any]:
+    """Normalize an Atom <entry> the same way api.fetch_arxiv_papers does, plus the arXiv id."""
+    entry_id = _text(entry, f"{ATOM}id")
+    link = ""
+    for l in entry.findall(f"{ATOM}link"):
+        href = l.attrib.get("href", "")
+        if href and (l.attrib.get("type", "").startswith("text/html") or l.attrib.get("rel") == "alternate"):
+            link = href
+    arxiv_id = entry_id.rsplit("/abs/", 1)[-1] if entry_id else ""
+    return {
+        "id": arxiv_id or entry_id,
+        "title": " ".join(_text(entry, f"{ATOM}title").split()),
+        "summary": _text(entry, f"{ATOM}summary"),
+        "published": _text(entry, f"{ATOM}published"),
+        "updated": _text(entry, f"{ATOM}updated"),
+        "authors": [_text(a, f"{ATOM}name") for a in entry.findall(f"{ATOM}author") if _text(a, f"{ATOM}name")],
+        "categories": [c.attrib.get("term") for c in entry.findall(f"{ATOM}category") if c.attrib.get("term")],
+        "source": "arXiv",
+        "url": link or (f"https://arxiv.org/abs/{arxiv_id}" if arxiv_id else ""),
+        "funding_details": "0",
+    }
+
+
+def parse_feed(stream, page_info: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Incrementally parse an arXiv Atom feed from a file-like stream, yielding
+    one normalized record per <entry>. Processed elements are cleared as we go.
+    If page_info is given, opensearch:totalResults is stored in it.
+    """
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if root is None and event == "start":
+            root = elem
+            continue
+        if event != "end":
+            continue
+        if elem.tag == f"{OPENSEARCH}totalResults" and page_info is not None:
+            try:
+                page_info["total"] = int(elem.text or 0)
+            except ValueError:
+                pass
+        elif elem.tag == f"{ATOM}entry":
+            yield entry_to_record(elem)
+            # Drop the finished entry (and anything before it) from the tree
+            root.clear()
+
+
+def harvest(query: str, max_records: Optional[int] = None, page_size: int = ARXIV_PAGE_SIZE, start: int = 0,
+            base_url: str = ARXIV_API_URL, scheduler: Optional[PoliteScheduler] = None,
+            timeout: float = ARXIV_HARVEST_TIMEOUT, sort_by: str = "submittedDate",
+            sort_order: str = "descending") -> Iterator[Dict[str, Any]]:
+    """
+    Yield normalized records for `query` (an arXiv search_query, e.g. "all:drone"
+    or a bare phrase, which is searched with all:), page by page, until the
+    result set or max_records is exhausted.
+    """
+    scheduler = scheduler or _default_scheduler
+    search_query = query if ":" in query else f"all:{query}"
+    yielded = 0
+    empty_retries = 0
+    total = None
+    while max_records is None or yielded < max_records:
+        size = page_size if max_records is None else min(page_size, max_records - yielded)
+        params = {
+            "search_query": search_query,
+            "start": start,
+            "max_results": size,
+            "sortBy": sort_by,
+            "sortOrder": sort_order,
+        }
+        scheduler.wait()
+        resp = http_client.get(base_url, params=params, timeout=timeout, stream=True)
+        if resp.status_code != 200:
+            logger.warning("arXiv page start=%d returned %d; stopping", start, resp.status_code)
+            resp.close()
+            return
+        page_info: Dict[str, Any] = {}
+        count = 0
+        try:
+            resp.raw.decode_content = True
+            for record in parse_feed(resp.raw, page_info):
+                count += 1
+                yielded += 1
+                yield record
+                if max_records is not None and yielded >= max_records:
+                    return
+        finally:
+            resp.close()
+        total = page_info.get("total", total)
+        if count == 0:
+            if total is not None and start < total and empty_retries < ARXIV_EMPTY_PAGE_RETRIES:
+                empty_retries += 1
+                logger.info("empty arXiv page at start=%d of %d; retrying", start, total)
+                continue
+            return
+        empty_retries = 0
+        start += count
+        if count < size or (total is not None and start >= total):
+            return
+
+
+class HighWaterMarks:
+    """
+    Per-topic high-water marks for incremental harvests, stored in a Mongo
+    collection (aetos_db.arxiv_watermarks): the newest `published` timestamp
+    seen for a topic and the arXiv ids seen at exactly that timestamp (so ties
+    are not re-fetched or skipped).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def key(topic: str) -> str:
+        return " ".join((topic or "").lower().split())
+
+    def get(self, topic: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": self.key(topic)})
+
+    def advance_from(self, topic: str, records) -> Optional[str]:
+        """Move the mark forward to the newest record in `records` (never backwards)."""
+        newest = max((r.get("published") or "" for r in records), default="")
+        if not newest:
+            return None
+        ids = sorted({r["id"] for r in records if r.get("published") == newest and r.get("id")})
+        key = self.key(topic)
+        current = self.collection.find_one({"_id": key})
+        if current is None or (current.get("published") or "") < newest:
+            self.collection.replace_one(
+                {"_id": key}, {"_id": key, "published": newest, "ids": ids, "updated_at": datetime.utcnow()},
+                upsert=True)
+        elif current.get("published") == newest:
+            self.collection.update_one(
+                {"_id": key}, {"$addToSet": {"ids": {"$each": ids}}, "$set": {"updated_at": datetime.utcnow()}})
+        return newest
+
+
+def is_known(record: Dict[str, Any], mark: Optional[Dict[str, Any]]) -> bool:
+    """True if record is at or behind the high-water mark."""
+    if not mark or not mark.get("published"):
+        return False
+    published = record.get("published") or ""
+    if published < mark["published"]:
+        return True
+    return published == mark["published"] and record.get("id") in set(mark.get("ids") or [])
+
+
+def _submitted_minute(published: str) -> str:
+    """arXiv submittedDate range bound (YYYYMMDDHHMM, GMT) for an Atom published timestamp."""
+    digits = "".join(ch for ch in published[:16] if ch.isdigit())
+    return digits.ljust(12, "0")[:12]
+
+
+def harvest_new(topic: str, marks: HighWaterMarks, max_records: Optional[int] = None, commit: bool = True,
+                **harvest_kwargs) -> Iterator[Dict[str, Any]]:
+    """
+    Yield only entries newer than the topic's high-water mark, at most
+    max_records (ARXIV_INCREMENTAL_MAX_RECORDS when omitted).
+
+    Entries are requested with a submittedDate range starting at the mark's
+    minute, oldest first, and paged until the result set is exhausted. Every
+    prefix of what is yielded therefore joins up with the mark: when the cap
+    cuts a run short, advancing the mark over the records handled leaves no
+    gap, and the next run picks up the newer entries. A topic without a mark
+    starts one from its newest max_records entries (older papers are backfill
+    territory, see harvest_to_db).
+
+    With commit=True the mark advances once the generator is exhausted; pass
+    commit=False and call marks.advance_from() with the records that were
+    safely stored (an oldest-first prefix) to avoid losing entries on a failed run.
+    """
+    mark = marks.get(topic)
+    limit = max_records if max_records is not None else ARXIV_INCREMENTAL_MAX_RECORDS
+    query = topic
+    if mark and mark.get("published"):
+        base = topic if ":" in topic else f"all:{topic}"
+        upper = (datetime.utcnow() + timedelta(days=1)).strftime("%Y%m%d%H%M")
+        query = f"({base}) AND submittedDate:[{_submitted_minute(mark['published'])} TO {upper}]"
+        harvest_kwargs.setdefault("sort_order", "ascending")
+    harvest_kwargs.setdefault("sort_by", "submittedDate")
+    harvest_kwargs.setdefault("sort_order", "descending")
+    harvest_kwargs.setdefault("page_size", max(1, min(ARXIV_PAGE_SIZE, limit)))
+    seen = []
+    # Entries in the mark's own minute may be known; they don't count towards the cap
+    for record in harvest(query, **harvest_kwargs):
+        if is_known(record, mark):
+            continue
+        seen.append({"id": record.get("id"), "published": record.get("published")})
+        yield record
+        if len(seen) >= limit:
+            if mark:
+                logger.info("incremental harvest for %r stopped at %d entries; the rest follow next run",
+                            topic, limit)
+            break
+    if commit and seen:
+        marks.advance_from(topic, seen)
+
+
+def harvest_to_db(query: str, collection=None, chunk_size: Optional[int] = None, **harvest_kwargs) -> Dict[str, int]:
+    """
+    Stream harvest() into the bulk upsert writer (keyed by arXiv id) without
+    materializing the result set. Returns the bulk_upsert counts.
+    """
+    from database import bulk_upsert, get_db_connection, DB_BULK_CHUNK_SIZE
+    if collection is None:
+        collection = get_db_connection().documents
+
+    def stamped():
+        for record in harvest(query, **harvest_kwargs):
+            record["updated_at"] = datetime.utcnow()
+            yield record
+
+    return bulk_upsert(collection, stamped(), lambda r: {"id": r["id"]} if r.get("id") else None,
+                       chunk_size=chunk_size or DB_BULK_CHUNK_SIZE)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Harvest arXiv results for a query into MongoDB")
+    parser.add_argument("query")
+    parser.add_argument("--max", type=int, default=None, help="maximum records to harvest")
+    parser.add_argument("--page-size", type=int, default=ARXIV_PAGE_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    stats = harvest_to_db(args.query, max_records=args.max, page_size=args.page_size)
+    print(f"Harvest finished: {stats}")
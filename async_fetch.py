@@ -0,0 +1,415 @@
+# async_fetch.py
+"""
+asyncio fetch layer for upstream calls: arXiv, SerpAPI, Gemini and the Mongo
+fallback.
+
+One event loop runs in a background thread per process. Flask request
+threads, job workers and Celery tasks hand it coroutines through the sync
+wrappers (AsyncFetcher.run, fetch_combined_papers) and block only on their own
+result, so hundreds of upstream calls can be in flight without a thread each.
+
+Each upstream host is capped by its own asyncio.Semaphore (sized from
+HTTP_POOL_SIZES, like the pooled requests client), every combined fetch runs
+under an overall deadline, and work that loses is cancelled: sources still
+pending at the deadline, and the DB fallback once the upstreams have filled
+the request.
+
+aiohttp is used when installed; otherwise requests calls run on the loop's
+small thread pool (still bounded by the same semaphores).
+"""
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from dedupe import collapse_near_duplicates
+from http_client import (HTTP_DEFAULT_POOL_SIZE, HTTP_MAX_RETRIES, HTTP_POOL_SIZES, HTTP_RETRY_AFTER_MAX,
+                         RETRY_STATUSES, USER_AGENT, _parse_pool_sizes, backoff_delay, parse_retry_after)
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+logger = logging.getLogger("aetos.async_fetch")
+
+ASYNC_FETCH_DEADLINE = float(os.getenv("ASYNC_FETCH_DEADLINE", "10.0"))
+# Threads for blocking work on the loop (pymongo, the requests fallback)
+ASYNC_FETCH_THREADS = int(os.getenv("ASYNC_FETCH_THREADS", "4"))
+ARXIV_TIMEOUT = float(os.getenv("ARXIV_TIMEOUT", "8.0"))
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "8.0"))
+
+ARXIV_QUERY_URL = "http://export.arxiv.org/api/query"
+SERPAPI_URL = "https://serpapi.com/search"
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+
+class FetchResponse:
+    """Fully-read response: status, headers and body bytes."""
+
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        import json
+        return json.loads(self.content)
+
+
+class AsyncFetcher:
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None, default_limit: int = HTTP_DEFAULT_POOL_SIZE,
+                 max_retries: int = HTTP_MAX_RETRIES, threads: int = ASYNC_FETCH_THREADS):
+        self.pool_sizes = pool_sizes if pool_sizes is not None else _parse_pool_sizes(HTTP_POOL_SIZES)
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads,
+                                                               thread_name_prefix="aetos-fetch")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session = None
+        # Created and used on the loop thread only
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "cancelled": 0,
+                          "in_flight": 0, "max_in_flight": 0}
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self._counters[key] += delta
+            if key == "in_flight" and self._counters["in_flight"] > self._counters["max_in_flight"]:
+                self._counters["max_in_flight"] = self._counters["in_flight"]
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(self._executor)
+                self._thread = threading.Thread(target=loop.run_forever, name="aetos-fetch-loop", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run coro on the fetch loop from synchronous code and return its result.
+        If timeout passes first the coroutine is cancelled and TimeoutError raised.
+        """
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncFetcher.run() called from the fetch loop; await the coroutine instead")
+        fut = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            self._count("cancelled")
+            raise
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(host)
+        if sem is None:
+            sem = self._semaphores[host] = asyncio.Semaphore(self.pool_sizes.get(host, self.default_limit))
+        return sem
+
+    async def _send(self, method: str, url: str, timeout: float, **kwargs) -> FetchResponse:
+        if AIOHTTP_AVAILABLE:
+            if self._session is None:
+                # Per-host semaphores do the limiting; the connector just keeps connections alive
+                self._session = aiohttp.ClientSession(headers={"User-Agent": USER_AGENT},
+                                                      connector=aiohttp.TCPConnector(limit=0))
+            async with self._session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                             **kwargs) as resp:
+                return FetchResponse(resp.status, resp.headers, await resp.read())
+        import http_client
+        session = http_client.get_client().session
+        resp = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: session.request(method, url, timeout=timeout, **kwargs))
+        return FetchResponse(resp.status_code, resp.headers, resp.content)
+
+    def _transient_errors(self) -> Tuple[type, ...]:
+        if AIOHTTP_AVAILABLE:
+            return (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        import requests
+        return (requests.ConnectionError, requests.Timeout)
+
+    async def request(self, method: str, url: str, timeout: float = 30.0, **kwargs) -> FetchResponse:
+        """
+        Send one request under the host's semaphore. Retries RETRY_STATUSES and
+        connection errors like http_client; the slot is released while backing off.
+        kwargs are passed through (params=, json=, headers=).
+        """
+        host = urlsplit(url).hostname or ""
+        transient = self._transient_errors()
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                async with self._semaphore(host):
+                    self._count("in_flight")
+                    try:
+                        resp = await self._send(method, url, timeout, **kwargs)
+                    finally:
+                        self._count("in_flight", -1)
+            except asyncio.CancelledError:
+                self._count("cancelled")
+                raise
+            except transient as e:
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("%s %s failed (%s); retry %d in %.2fs", method, host, e, attempt + 1, delay)
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return resp
+                delay = backoff_delay(attempt)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    if retry_after > HTTP_RETRY_AFTER_MAX:
+                        return resp
+                    delay = max(delay, retry_after)
+                logger.info("%s %s returned %d; retry %d in %.2fs", method, host, resp.status_code, attempt + 1, delay)
+            self._count("retries")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> FetchResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> FetchResponse:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._counters)
+        out["backend"] = "aiohttp" if AIOHTTP_AVAILABLE else "requests+threads"
+        return out
+
+
+_fetcher: Optional[AsyncFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> AsyncFetcher:
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = AsyncFetcher()
+        return _fetcher
+
+
+# ========================================
+# SOURCES
+# ========================================
+def parse_serpapi_results(payload: Dict[str, Any], max_results: int) -> List[Dict[str, Any]]:
+    """Normalize a SerpAPI google_scholar response into document dicts."""
+    organic = payload.get("organic_results") or payload.get("scholar_results") or payload.get("organic") or []
+    results = []
+    for item in organic[:max_results]:
+        title = item.get("title") or item.get("headline") or item.get("title_noformat") or ""
+        snippet = item.get("snippet") or item.get("citation") or item.get("abstract") or item.get("snippet_highlighted") or ""
+
+        authors = []
+        pub_info = item.get("publication_info") or {}
+        if isinstance(pub_info, dict) and pub_info.get("authors"):
+            try:
+                authors = [a.get("name") if isinstance(a, dict) else str(a) for a in pub_info.get("authors")]
+            except Exception:
+                authors = []
+        if not authors and item.get("authors"):
+            authors = item.get("authors")
+
+        link = item.get("link") or item.get("source") or item.get("url") or ""
+        # Try to get actual paper link from inline_links or other fields
+        if not link and item.get("inline_links"):
+            inline = item.get("inline_links", {})
+            link = inline.get("serpapi_cite_link") or inline.get("cited_by", {}).get("link") or ""
+
+        year = ""
+        if isinstance(pub_info, dict):
+            year = pub_info.get("year") or pub_info.get("summary") or ""
+
+        # Skip entries without valid links
+        if not link:
+            continue
+
+        results.append({
+            "title": (title or "").strip(),
+            "summary": (snippet or "").strip(),
+            "published": year,
+            "authors": authors,
+            "source": "Google Scholar (SerpAPI)",
+            "url": link,
+            "funding_details": "0"
+        })
+    return results
+
+
+async def fetch_arxiv(query: str, max_results: int, timeout: float = ARXIV_TIMEOUT,
+                      fetcher: Optional[AsyncFetcher] = None) -> List[Dict[str, Any]]:
+    """Newest max_results arXiv papers for query; [] on any upstream error."""
+    from arxiv_harvester import parse_feed
+    fetcher = fetcher or get_fetcher()
+    params = {"search_query": f"all:{query}", "start": 0, "max_results": max_results,
+              "sortBy": "submittedDate", "sortOrder": "descending"}
+    try:
+        resp = await fetcher.get(ARXIV_QUERY_URL, params=params, timeout=timeout)
+        if resp.status_code != 200 or not resp.content:
+            return []
+        return list(parse_feed(io.BytesIO(resp.content)))
+    except Exception as e:
+        logger.warning("arXiv fetch error: %s", e)
+        return []
+
+
+async def fetch_serpapi(query: str, max_results: int, timeout: float = SERPAPI_TIMEOUT,
+                        api_key: Optional[str] = None,
+                        fetcher: Optional[AsyncFetcher] = None) -> List[Dict[str, Any]]:
+    """Google Scholar results via SerpAPI; [] without a key or on any upstream error."""
+    # Read at call time: api.py loads .env after its imports
+    api_key = api_key or os.getenv("SERPAPI_KEY")
+    if not api_key:
+        return []
+    fetcher = fetcher or get_fetcher()
+    params = {"engine": "google_scholar", "q": query, "api_key": api_key, "num": max_results}
+    try:
+        resp = await fetcher.get(SERPAPI_URL, params=params, timeout=timeout)
+        if resp.status_code != 200 or not resp.content:
+            return []
+        return parse_serpapi_results(resp.json(), max_results)
+    except Exception as e:
+        logger.warning("Scholar fetch error: %s", e)
+        return []
+
+
+async def gemini_generate(prompt: str, api_key: str, model: str, max_output_tokens: int = 1024,
+                          timeout: float = 10.0, bucket=None, rate_wait_timeout: Optional[float] = None,
+                          fetcher: Optional[AsyncFetcher] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    One generateContent request, waiting on the event loop for a rate-limiter
+    token. Returns (text, error); exactly one of them is None.
+    """
+    if bucket is not None and not await bucket.acquire_async(timeout=rate_wait_timeout):
+        return None, "Gemini rate limit wait timed out"
+    fetcher = fetcher or get_fetcher()
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"temperature": 0.3, "maxOutputTokens": max_output_tokens}
+    }
+    resp = await fetcher.post(GEMINI_URL.format(model=model), params={"key": api_key}, json=payload,
+                              timeout=timeout)
+    if resp.status_code != 200:
+        return None, f"Gemini API error: {resp.status_code}"
+    result = resp.json()
+    if result.get("candidates"):
+        return result["candidates"][0].get("content", {}).get("parts", [{}])[0].get("text", ""), None
+    return None, "No valid response from Gemini"
+
+
+# ========================================
+# COMBINED FETCH
+# ========================================
+def combine_results(groups: List[Optional[List[Dict[str, Any]]]], desired_num: int) -> List[Dict[str, Any]]:
+    """
+    Concatenate source groups in priority order, dropping repeats by URL (or
+    title), then collapse near-duplicates (the same paper under another URL)
+    to their preferred copy.
+    """
+    seen = set()
+    combined = []
+    for docs in groups:
+        for doc in (docs or []):
+            key = (doc.get("url") or "").strip() or (doc.get("title") or "").strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                combined.append(doc)
+    return collapse_near_duplicates(combined)[:desired_num]
+
+
+async def fetch_combined(query: str, desired_num: int = 10, deadline: Optional[float] = ASYNC_FETCH_DEADLINE,
+                         cache=None, arxiv_fetch: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+                         db_fallback: Optional[Callable[[str, int], List[Dict[str, Any]]]] = None,
+                         fetcher: Optional[AsyncFetcher] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch arXiv and SerpAPI concurrently and return up to desired_num
+    deduplicated documents, arXiv first, then Scholar, then DB.
+
+    Sources still running when `deadline` seconds have passed are cancelled
+    and the request is served from whatever finished. `cache` (a FetchCache)
+    serves and coalesces repeated upstream queries. `arxiv_fetch` replaces the
+    arXiv query with a blocking callable run on the fetch thread pool (used for
+    the incremental harvest). `db_fallback(query, n)` is started alongside the
+    upstreams and cancelled if they fill the request on their own.
+    """
+    fetcher = fetcher or get_fetcher()
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+
+    def cached(source, fn):
+        return cache.afetch(source, query, desired_num, fn) if cache is not None else fn()
+
+    if arxiv_fetch is not None:
+        arxiv_coro = loop.run_in_executor(None, arxiv_fetch)
+    else:
+        arxiv_coro = cached("arxiv", lambda: fetch_arxiv(query, desired_num, fetcher=fetcher))
+    upstream = {
+        "arxiv": asyncio.ensure_future(arxiv_coro),
+        "serpapi": asyncio.ensure_future(
+            cached("serpapi", lambda: fetch_serpapi(query, desired_num, fetcher=fetcher))),
+    }
+    db_task = asyncio.ensure_future(loop.run_in_executor(None, db_fallback, query, desired_num)) if db_fallback else None
+
+    try:
+        done, pending = await asyncio.wait(upstream.values(), timeout=deadline)
+    except asyncio.CancelledError:
+        for task in list(upstream.values()) + ([db_task] if db_task else []):
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for name, task in upstream.items():
+        if task in pending or task.cancelled():
+            logger.info("%s fetch missed the deadline; cancelled", name)
+        elif task.exception() is not None:
+            logger.warning("%s fetch failed: %s", name, task.exception())
+        else:
+            results[name] = task.result()
+
+    combined = combine_results([results.get("arxiv"), results.get("serpapi")], desired_num)
+    if db_task is not None:
+        if len(combined) >= desired_num:
+            db_task.cancel()
+        else:
+            remaining = None if deadline is None else max(0.0, deadline - (time.monotonic() - started))
+            try:
+                db_docs = await asyncio.wait_for(db_task, remaining)
+            except asyncio.TimeoutError:
+                logger.info("DB fallback missed the deadline; cancelled")
+            except Exception as e:
+                logger.warning("DB fallback failed: %s", e)
+            else:
+                combined = combine_results([combined, db_docs], desired_num)
+    return combined
+
+
+def fetch_combined_papers(query: str, desired_num: int = 10, deadline: Optional[float] = ASYNC_FETCH_DEADLINE,
+                          **kwargs) -> List[Dict[str, Any]]:
+    """Synchronous wrapper around fetch_combined for Flask routes and workers."""
+    fetcher = kwargs.pop("fetcher", None) or get_fetcher()
+    return fetcher.run(fetch_combined(query, desired_num, deadline=deadline, fetcher=fetcher, **kwargs))
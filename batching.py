@@ -0,0 +1,115 @@
+# batching.py
+"""
+Helpers for packing several documents into one LLM request and mapping the
+JSON-array response back to the input documents.
+"""
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Rough chars-per-token ratio for English prose; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Per-document framing overhead ("[DOC n]" header, separators)
+DOC_OVERHEAD_TOKENS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(texts: List[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily group consecutive texts into batches whose estimated size stays
+    under token_budget and holds at most max_items. A text larger than the
+    budget on its own gets a batch to itself. Returns lists of indices into texts.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text) + DOC_OVERHEAD_TOKENS
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def stream_chunks(texts: Iterable[str], token_budget: int, separator: str = "\n\n") -> Iterator[str]:
+    """
+    Join texts into chunks of at most token_budget estimated tokens in a
+    single pass, yielding each chunk as soon as the next text would overflow
+    it. A text larger than the budget on its own is cut to fit; empty texts
+    are skipped.
+    """
+    parts: List[str] = []
+    used = 0
+    for text in texts:
+        if not text:
+            continue
+        text = text[:max(1, token_budget - 1) * CHARS_PER_TOKEN]
+        cost = estimate_tokens(text + separator)
+        if parts and used + cost > token_budget:
+            yield separator.join(parts)
+            parts, used = [], 0
+        parts.append(text)
+        used += cost
+    if parts:
+        yield separator.join(parts)
+
+
+def format_batch_documents(texts: List[str]) -> str:
+    return "\n\n".join(f"[DOC {i}]\n{t}" for i, t in enumerate(texts))
+
+
+def _strip_code_fence(text: str) -> str:
+    text = (text or "").strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        text = "\n".join(lines[1:-1]) if len(lines) > 2 else text
+    return text
+
+
+def parse_batch_response(text: str, count: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Parse a JSON array of objects keyed by "index" into a list aligned with the
+    batch. Entries that are missing, duplicated or malformed come back as None so
+    the caller can retry just those documents.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * count
+    text = _strip_code_fence(text)
+    try:
+        parsed = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        m = re.search(r"(\[[\s\S]*\])", text or "")
+        if not m:
+            return results
+        try:
+            parsed = json.loads(m.group(1))
+        except json.JSONDecodeError:
+            return results
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results") or parsed.get("documents") or []
+    if not isinstance(parsed, list):
+        return results
+    seen = set()
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get("index"))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= idx < count:
+            continue
+        if idx in seen:
+            # Conflicting answers for one document; retry it on its own
+            results[idx] = None
+            continue
+        seen.add(idx)
+        entry = {k: v for k, v in item.items() if k != "index"}
+        results[idx] = entry or None
+    return results
@@ -1,22 +1,119 @@
 import os
-from pymongo import MongoClient, ASCENDING
+import logging
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from dotenv import load_dotenv
-import pandas as pd
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+from search import ensure_text_index
+from keyword_pairs import KeywordPairStore, count_changes
+from rollups import RollupStore, annotate
 
 load_dotenv()
 
-def get_db_connection():
-    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-    client = MongoClient(mongo_uri)
-    db = client.aetos_db
+logger = logging.getLogger("aetos.database")
+
+DB_BULK_CHUNK_SIZE = int(os.getenv("DB_BULK_CHUNK_SIZE", "500"))
+
+def ensure_indexes(db):
     db.documents.create_index([("title", ASCENDING)])
     db.documents.create_index([("technologies", ASCENDING)])
     db.documents.create_index([("published", ASCENDING)])
     db.documents.create_index([("source", ASCENDING)])
+    # Per-topic/technology monthly counts: S-curve forecasts and rollup refreshes
+    db.documents.create_index([("pair_state.topics", ASCENDING), ("pair_state.bucket", ASCENDING)])
+    db.documents.create_index([("pair_state.keywords", ASCENDING), ("pair_state.bucket", ASCENDING)])
+    # Backs keyset pagination on (published, _id) newest first
+    db.documents.create_index([("published", DESCENDING), ("_id", DESCENDING)])
+    # Upsert keys. Partial so legacy docs without an id/url don't collide on null.
+    for field, partial in (("id", {"id": {"$type": "string"}}), ("url", {"url": {"$gt": ""}})):
+        try:
+            db.documents.create_index([(field, ASCENDING)], unique=True, partialFilterExpression=partial,
+                                      name=f"{field}_unique")
+        except OperationFailure as e:
+            # Existing duplicates block a unique index; keep upserts index-backed anyway
+            logger.warning("unique index on documents.%s not created (%s); using a plain index", field, e)
+            db.documents.create_index([(field, ASCENDING)])
+    try:
+        ensure_text_index(db.documents)
+    except OperationFailure as e:
+        # Only one text index is allowed per collection; an older one must be dropped first
+        logger.warning("text index on documents not created: %s", e)
+    KeywordPairStore(db.keyword_pairs).ensure_indexes()
+    RollupStore(db.documents, db.rollups).ensure_indexes()
+
+def get_db_connection():
+    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+    client = MongoClient(mongo_uri)
+    db = client.aetos_db
+    ensure_indexes(db)
     return db
 
-def save_to_db(df: pd.DataFrame) -> int:
+def bulk_upsert(collection, records, key_fn, chunk_size: int = DB_BULK_CHUNK_SIZE,
+                failed: Optional[set] = None) -> dict:
+    """
+    Upsert records with unordered bulk_write calls of at most chunk_size ops.
+    key_fn(record) returns the upsert filter, or None to skip the record.
+    Returns counts of upserted, modified, matched, failed and skipped records;
+    `failed`, if given, receives the positions of the records that failed.
+    """
+    stats = {"upserted": 0, "modified": 0, "matched": 0, "failed": 0, "skipped": 0}
+    ops, positions = [], []
+
+    def flush():
+        if not ops:
+            return
+        try:
+            result = collection.bulk_write(ops, ordered=False)
+            stats["upserted"] += result.upserted_count
+            stats["modified"] += result.modified_count
+            stats["matched"] += result.matched_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            stats["upserted"] += details.get("nUpserted", 0)
+            stats["modified"] += details.get("nModified", 0)
+            stats["matched"] += details.get("nMatched", 0)
+            stats["failed"] += len(details.get("writeErrors", []))
+            if failed is not None:
+                failed.update(positions[err["index"]] for err in details.get("writeErrors", []))
+        ops.clear()
+        positions.clear()
+
+    for position, record in enumerate(records):
+        key = key_fn(record)
+        if not key:
+            stats["skipped"] += 1
+            continue
+        ops.append(UpdateOne(key, {'$set': record}, upsert=True))
+        positions.append(position)
+        if len(ops) >= chunk_size:
+            flush()
+    flush()
+    return stats
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+def upsert_key(record):
+    """
+    Upsert filter for a record: its id, else its url (as the API keys
+    documents), else None so bulk_upsert skips it. An empty key would match
+    every stored document that lacks the field.
+    """
+    for field in ('id', 'url'):
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            return {field: value}
+    return None
+
+def save_to_db(df: "pd.DataFrame", chunk_size: int = DB_BULK_CHUNK_SIZE, topic: str = None) -> Optional[int]:
+    """
+    Upsert documents by id (url when there is none), fold their
+    technologies/keywords into the keyword_pairs counts (under `topic`,
+    when given) and refresh the monthly rollups they touch.
+    Returns the number of documents upserted or modified, or None if the
+    save failed.
+    """
     if df.empty:
         return 0
     try:
@@ -26,11 +123,26 @@ def save_to_db(df: pd.DataFrame) -> int:
             record['updated_at'] = datetime.utcnow()
             if 'authors' in record and isinstance(record['authors'], list):
                 record['authors'] = [str(a) for a in record['authors']]
-        inserted_count = 0
-        for record in records:
-            result = db.documents.update_one({'id': record.get('id')}, {'$set': record}, upsert=True)
-            if getattr(result, "upserted_id", None) or getattr(result, "modified_count", 0) > 0:
-                inserted_count += 1
-        return inserted_count
+            annotate(record)
+        pairs = KeywordPairStore(db.keyword_pairs)
+        touched = []
+        deltas = pairs.stage(db.documents, records, upsert_key, topic=topic, touched=touched)
+        failed = set()
+        stats = bulk_upsert(db.documents, records, upsert_key, chunk_size=chunk_size, failed=failed)
+        if failed:
+            # Only count what was stored; the failed records keep their previous pair_state
+            deltas = count_changes(touched, skip=failed)
     except Exception:
-        return 0
+        logger.exception("save_to_db failed")
+        return None
+    # The documents are stored; a failed count update must not report the save as failed
+    try:
+        stats["keyword_pairs"] = pairs.apply(deltas)
+    except Exception as e:
+        logger.warning("keyword pair update failed: %s", e)
+    try:
+        stats["rollups"] = RollupStore(db.documents, db.rollups).refresh_for(touched)
+    except Exception as e:
+        logger.warning("rollup refresh failed: %s", e)
+    logger.info("save_to_db: %s", stats)
+    return stats["upserted"] + stats["modified"]
@@ -0,0 +1,285 @@
+# dedupe.py
+"""
+Near-duplicate detection with MinHash signatures and LSH banding.
+
+Every document gets two MinHash signatures: one over character 3-grams of
+its normalized title and one over word 3-shingles of its summary. Signatures
+are cut into bands; documents sharing a band bucket become candidates, and a
+candidate pair is a near-duplicate when either estimated Jaccard similarity
+clears its threshold. Clustering a batch is linear in the number of
+documents plus the (few) candidate pairs.
+
+The title signature is what links the same paper across arXiv and Google
+Scholar: Scholar returns a short snippet rather than the abstract, so the
+summaries alone rarely overlap enough.
+
+Clusters collapse to one representative, preferring arXiv, then Scholar,
+then anything else (the order fetch_combined_papers already uses).
+StoredDuplicateIndex keeps an LSH index over recently stored documents so
+new fetches can be checked against them incrementally.
+"""
+import os
+import re
+import time
+import zlib
+import array
+import random
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("aetos.dedupe")
+
+DEDUPE_NUM_PERM = int(os.getenv("DEDUPE_NUM_PERM", "64"))
+# rows per band = DEDUPE_NUM_PERM / DEDUPE_BANDS; 16 bands of 4 surface pairs from ~0.5 similarity up
+DEDUPE_BANDS = int(os.getenv("DEDUPE_BANDS", "16"))
+DEDUPE_TITLE_THRESHOLD = float(os.getenv("DEDUPE_TITLE_THRESHOLD", "0.8"))
+DEDUPE_SUMMARY_THRESHOLD = float(os.getenv("DEDUPE_SUMMARY_THRESHOLD", "0.7"))
+# Shorter titles ("Introduction", "Editorial") say nothing about identity
+DEDUPE_MIN_TITLE_CHARS = int(os.getenv("DEDUPE_MIN_TITLE_CHARS", "20"))
+DEDUPE_RECENT_LIMIT = int(os.getenv("DEDUPE_RECENT_LIMIT", "5000"))
+DEDUPE_INDEX_TTL = float(os.getenv("DEDUPE_INDEX_TTL", "600"))
+
+# Lower wins when a cluster collapses to its representative
+SOURCE_PRIORITY = {"arXiv": 0, "Google Scholar (SerpAPI)": 1}
+DEFAULT_SOURCE_PRIORITY = 2
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures are stored and must compare across processes. a, b and
+# the crc32 shingle hashes stay below 2**32, so a*h + b fits in a uint64 and the
+# numpy and pure-Python paths produce identical signatures.
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _MAX_HASH), _rng.randrange(0, _MAX_HASH)) for _ in range(DEDUPE_NUM_PERM)]
+
+_np_perm = None  # (numpy, a, b) once numpy has been imported
+_np_checked = False
+
+Signature = Tuple[int, ...]
+DocSignatures = Tuple[Optional[Signature], Optional[Signature]]
+
+
+def normalize(text: Any) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip()
+
+
+def title_shingles(title: Any) -> List[str]:
+    text = normalize(title)
+    if len(text) < DEDUPE_MIN_TITLE_CHARS:
+        return []
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+
+def summary_shingles(summary: Any, k: int = 3) -> List[str]:
+    tokens = normalize(summary).split()
+    if len(tokens) < k:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)]
+
+
+def _numpy():
+    """(numpy, a, b) with the permutation coefficients as arrays, or None without numpy; imported on first use."""
+    global _np_perm, _np_checked
+    if not _np_checked:
+        try:
+            import numpy as np
+            _np_perm = (np, np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64),
+                        np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64))
+        except ImportError:
+            _np_perm = None
+        _np_checked = True
+    return _np_perm
+
+
+def minhash(shingles: Iterable[str]) -> Optional[Signature]:
+    hashes = {zlib.crc32(s.encode("utf-8")) for s in shingles}
+    if not hashes:
+        return None
+    vectorized = _numpy()
+    if vectorized is not None:
+        np, a, b = vectorized
+        h = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[:, None]
+        values = ((h * a + b) % np.uint64(_MERSENNE)) & np.uint64(_MAX_HASH)
+        return tuple(int(v) for v in values.min(axis=0))
+    return tuple(min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def signatures(doc) -> DocSignatures:
+    """(title signature, summary signature) for a document dict or record; either may be None."""
+    return minhash(title_shingles(doc.get("title"))), minhash(summary_shingles(doc.get("summary")))
+
+
+def similarity(a: Optional[Signature], b: Optional[Signature]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def is_near_duplicate(a: DocSignatures, b: DocSignatures) -> bool:
+    return (similarity(a[0], b[0]) >= DEDUPE_TITLE_THRESHOLD
+            or similarity(a[1], b[1]) >= DEDUPE_SUMMARY_THRESHOLD)
+
+
+def source_priority(doc) -> int:
+    return SOURCE_PRIORITY.get(doc.get("source"), DEFAULT_SOURCE_PRIORITY)
+
+
+def encode_signatures(sigs: DocSignatures) -> Dict[str, Any]:
+    """Compact storage form: 4 bytes per permutation, None where there was no signature."""
+    return {
+        "n": DEDUPE_NUM_PERM,
+        "title": array.array("I", sigs[0]).tobytes() if sigs[0] else None,
+        "summary": array.array("I", sigs[1]).tobytes() if sigs[1] else None,
+    }
+
+
+def decode_signatures(stored: Optional[Dict[str, Any]]) -> Optional[DocSignatures]:
+    """None if missing or computed with a different number of permutations."""
+    if not stored or stored.get("n") != DEDUPE_NUM_PERM:
+        return None
+
+    def unpack(blob):
+        return tuple(array.array("I", bytes(blob))) if blob else None
+
+    return unpack(stored.get("title")), unpack(stored.get("summary"))
+
+
+class LSHIndex:
+    """Band buckets over title and summary signatures; keys are caller-chosen ids."""
+
+    def __init__(self, num_perm: int = DEDUPE_NUM_PERM, bands: int = DEDUPE_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        # title bands first, then summary bands
+        self._buckets: List[Dict[Signature, List[Any]]] = [defaultdict(list) for _ in range(2 * bands)]
+        self.signatures: Dict[Any, DocSignatures] = {}
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _bands(self, sigs: DocSignatures):
+        for kind, sig in enumerate(sigs):
+            if not sig:
+                continue
+            for band in range(self.bands):
+                yield kind * self.bands + band, sig[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: Any, sigs: DocSignatures):
+        self.signatures[key] = sigs
+        for slot, band in self._bands(sigs):
+            self._buckets[slot][band].append(key)
+
+    def candidates(self, sigs: DocSignatures) -> set:
+        found = set()
+        for slot, band in self._bands(sigs):
+            found.update(self._buckets[slot].get(band, ()))
+        return found
+
+    def query(self, sigs: DocSignatures) -> List[Any]:
+        """Keys of indexed documents that are near-duplicates of sigs."""
+        return [k for k in self.candidates(sigs) if is_near_duplicate(sigs, self.signatures[k])]
+
+
+def cluster_near_duplicates(docs: List[Any]) -> List[List[int]]:
+    """Group docs (by position) into near-duplicate clusters, in order of first appearance."""
+    parent = list(range(len(docs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    index = LSHIndex()
+    for i, doc in enumerate(docs):
+        sigs = signatures(doc)
+        for j in index.query(sigs):
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+        index.add(i, sigs)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(docs)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+
+def collapse_near_duplicates(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keep one representative per near-duplicate cluster: the most preferred
+    source, then the longest summary. The representative lists the other
+    copies' URLs in duplicate_urls (on a copy; inputs are not modified).
+    Output keeps the input order.
+    """
+    if len(docs) < 2:
+        return list(docs)
+    kept = []
+    for members in cluster_near_duplicates(docs):
+        if len(members) == 1:
+            kept.append((members[0], docs[members[0]]))
+            continue
+        rep = min(members, key=lambda i: (source_priority(docs[i]), -len(docs[i].get("summary") or ""), i))
+        doc = dict(docs[rep])  # fetched dicts may be shared with the fetch cache
+        others = [docs[i].get("url") for i in members if i != rep and docs[i].get("url")]
+        if others:
+            doc["duplicate_urls"] = sorted(set(others) | set(doc.get("duplicate_urls") or []))
+        kept.append((min(members), doc))
+    return [doc for _, doc in sorted(kept, key=lambda item: item[0])]
+
+
+class StoredDuplicateIndex:
+    """
+    LSH index over the most recently stored documents that carry a `minhash`
+    field (see encode_signatures). Loaded on first use and rebuilt every
+    `ttl` seconds; documents saved in between are added with add().
+    """
+
+    def __init__(self, collection, limit: int = DEDUPE_RECENT_LIMIT, ttl: float = DEDUPE_INDEX_TTL):
+        self.collection = collection
+        self.limit = limit
+        self.ttl = ttl
+        self._index: Optional[LSHIndex] = None
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        index, meta = LSHIndex(), {}
+        cursor = self.collection.find(
+            {"minhash.n": DEDUPE_NUM_PERM, "url": {"$gt": ""}},
+            {"_id": 0, "url": 1, "source": 1, "minhash": 1},
+        ).sort([("_id", -1)]).limit(self.limit)
+        for doc in cursor:
+            sigs = decode_signatures(doc.get("minhash"))
+            if sigs:
+                index.add(doc["url"], sigs)
+                meta[doc["url"]] = {"url": doc["url"], "source": doc.get("source")}
+        self._index, self._meta, self._loaded_at = index, meta, time.monotonic()
+        logger.info("loaded %d stored signatures for near-duplicate checks", len(index))
+
+    def _current(self) -> LSHIndex:
+        if self._index is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+        return self._index
+
+    def find(self, sigs: DocSignatures) -> Optional[Dict[str, Any]]:
+        """The preferred stored near-duplicate ({url, source}) of sigs, or None."""
+        with self._lock:
+            matches = [self._meta[url] for url in self._current().query(sigs)]
+        if not matches:
+            return None
+        return min(matches, key=lambda m: (source_priority(m), m["url"]))
+
+    def add(self, doc, sigs: DocSignatures):
+        url = doc.get("url")
+        if not url or not (sigs[0] or sigs[1]):
+            return
+        with self._lock:
+            if self._index is not None and url not in self._meta:
+                self._index.add(url, sigs)
+                self._meta[url] = {"url": url, "source": doc.get("source")}
@@ -1,36 +1,257 @@
 # engine.py
+"""
+Local NLP enrichment for batch runs: a short generated summary, named
+entities and keywords per document.
+
+The summarizer, NER pipeline and KeyBERT are loaded once per process and
+kept in a module-level cache. Each stage runs over the whole DataFrame in
+batches (ENGINE_BATCH_SIZE) rather than three model calls per document.
+ENGINE_TORCH_THREADS caps torch's intra-op threads, and ENGINE_PROCESSES > 1
+shards the DataFrame across a process pool. The shards split the cores
+between them instead of oversubscribing.
+
+Document embeddings are computed once, in batches, by a shared
+SentenceTransformer and stored with each row as compact bytes (embedding,
+embedding_model, embedding_dtype; float16 by default). KeyBERT is handed the
+stored vectors instead of re-embedding each document, and rows that already
+carry an embedding from the current model (or have one in Mongo, see
+attach_stored_embeddings) are skipped on re-runs.
+
+Per-stage throughput (docs/sec) is printed after each run and kept in
+df.attrs["engine_stats"] for sizing CPU nodes.
+"""
+import os
+import time
+import threading
+import concurrent.futures
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 import pandas as pd
-from transformers import pipeline
-from keybert import KeyBERT
 from tqdm import tqdm
 
-def process_documents(df: pd.DataFrame) -> pd.DataFrame:
-    print("Initializing AI models...")
-    summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6", framework="pt")
-    ner_pipeline = pipeline("ner", model="dslim/bert-base-NER", grouped_entities=True, framework="pt")
-    kw_model = KeyBERT()
-    print("Models initialized.")
-    
-    results = []
-    print("Processing documents...")
-    for summary_text in tqdm(df['summary'], total=len(df), desc="Analyzing Papers"):
-        if not summary_text or not isinstance(summary_text, str):
-            results.append(("No summary available", [], []))
+ENGINE_BATCH_SIZE = int(os.getenv("ENGINE_BATCH_SIZE", "16"))
+# 0 leaves torch's default (one thread per core)
+ENGINE_TORCH_THREADS = int(os.getenv("ENGINE_TORCH_THREADS", "0"))
+ENGINE_PROCESSES = int(os.getenv("ENGINE_PROCESSES", "1"))
+SUMMARIZER_MODEL = os.getenv("ENGINE_SUMMARIZER_MODEL", "sshleifer/distilbart-cnn-6-6")
+NER_MODEL = os.getenv("ENGINE_NER_MODEL", "dslim/bert-base-NER")
+# KeyBERT's default model; the same instance embeds documents and candidate phrases
+EMBEDDING_MODEL = os.getenv("ENGINE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DTYPE = os.getenv("ENGINE_EMBEDDING_DTYPE", "float16")  # float16 | float32
+
+STAGES = ("summarize", "ner", "embed", "keywords")
+EMBEDDING_COLUMNS = ("embedding", "embedding_model", "embedding_dtype")
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def set_torch_threads(num_threads: int):
+    if num_threads > 0:
+        import torch
+        torch.set_num_threads(num_threads)
+
+
+def get_models() -> Dict[str, Any]:
+    """Process-wide model cache; the first call pays for importing and loading them."""
+    with _models_lock:
+        if not _models:
+            # transformers/torch and KeyBERT take seconds to import; only pay for them here
+            from transformers import pipeline
+            from keybert import KeyBERT
+            from sentence_transformers import SentenceTransformer
+
+            print("Initializing AI models...")
+            _models["summarizer"] = pipeline("summarization", model=SUMMARIZER_MODEL, framework="pt")
+            _models["ner"] = pipeline("ner", model=NER_MODEL, grouped_entities=True, framework="pt")
+            _models["embedder"] = SentenceTransformer(EMBEDDING_MODEL)
+            _models["keybert"] = KeyBERT(model=_models["embedder"])
+            print("Models initialized.")
+        return _models
+
+
+def encode_embedding(vector, dtype: str = EMBEDDING_DTYPE) -> bytes:
+    """Pack an embedding vector into raw bytes for storage (BSON binary in Mongo)."""
+    return np.asarray(vector, dtype=dtype).tobytes()
+
+
+def decode_embedding(blob: bytes, dtype: str = EMBEDDING_DTYPE) -> np.ndarray:
+    """Stored bytes back to a float32 vector."""
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+
+def _has_embedding(blob: Any, model: Any) -> bool:
+    return isinstance(blob, (bytes, bytearray)) and model == EMBEDDING_MODEL
+
+
+def attach_stored_embeddings(df: pd.DataFrame, collection, key: str = "id") -> int:
+    """
+    Copy embeddings already stored in Mongo (matched on `key`, same model) onto
+    rows of df that lack one, so the embed stage skips them. Returns the count.
+    """
+    if key not in df.columns:
+        return 0
+    ids = [v for v in df[key].tolist() if isinstance(v, str) and v]
+    if not ids:
+        return 0
+    projection = {"_id": 0, key: 1, **{c: 1 for c in EMBEDDING_COLUMNS}}
+    stored = {d[key]: d for d in collection.find({key: {"$in": ids}, "embedding_model": EMBEDDING_MODEL}, projection)
+              if _has_embedding(d.get("embedding"), d.get("embedding_model"))}
+    columns = {c: (df[c].tolist() if c in df.columns else [None] * len(df)) for c in EMBEDDING_COLUMNS}
+    attached = 0
+    for i, doc_id in enumerate(df[key].tolist()):
+        doc = stored.get(doc_id)
+        if doc is None or _has_embedding(columns["embedding"][i], columns["embedding_model"][i]):
             continue
-            
-        generated_summary = summarizer(summary_text[:1024], max_length=60, min_length=20, do_sample=False)[0]['summary_text']
-        
-        entities = ner_pipeline(summary_text)
-        
-        # --- THIS IS THE FIX ---
-        # Convert any numpy types in entities to standard Python types
-        for entity in entities:
-            entity['score'] = float(entity['score'])
-            
-        keywords = kw_model.extract_keywords(summary_text, keyphrase_ngram_range=(1, 2), stop_words='english', top_n=5)
-        results.append((generated_summary, entities, [kw[0] for kw in keywords]))
-
-    df[['generated_summary', 'entities', 'keywords']] = pd.DataFrame(results, index=df.index)
-    
+        for c in EMBEDDING_COLUMNS:
+            columns[c][i] = bytes(doc[c]) if c == "embedding" else doc.get(c)
+        attached += 1
+    for c in EMBEDDING_COLUMNS:
+        df[c] = pd.Series(columns[c], index=df.index, dtype=object)
+    return attached
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _run_stage(name: str, items: List[Any], batch_size: int, fn, stats: Dict[str, Dict[str, float]]) -> List[Any]:
+    start = time.perf_counter()
+    out: List[Any] = []
+    for chunk in tqdm(list(_chunks(items, batch_size)), desc=f"{name} (batches of {batch_size})"):
+        out.extend(fn(chunk))
+    elapsed = time.perf_counter() - start
+    stats[name] = {"docs": len(items), "seconds": round(elapsed, 3),
+                   "docs_per_sec": round(len(items) / elapsed, 2) if elapsed > 0 else 0.0}
+    return out
+
+
+def _process_serial(df: pd.DataFrame, batch_size: int) -> Dict[str, Dict[str, float]]:
+    """Enrich df in place; returns per-stage stats."""
+    models = get_models()
+    summarizer, ner_pipeline = models["summarizer"], models["ner"]
+    embedder, kw_model = models["embedder"], models["keybert"]
+
+    positions = [i for i, s in enumerate(df["summary"]) if s and isinstance(s, str)]
+    texts = [df["summary"].iat[i] for i in positions]
+    stats: Dict[str, Dict[str, float]] = {}
+
+    def summarize(chunk):
+        outputs = summarizer([t[:1024] for t in chunk], max_length=60, min_length=20, do_sample=False,
+                             truncation=True, batch_size=batch_size)
+        return [o["summary_text"] for o in outputs]
+
+    def entities(chunk):
+        outputs = ner_pipeline(chunk, batch_size=batch_size)
+        # Convert numpy scores to plain floats so the entities can be stored
+        return [[{**e, "score": float(e["score"])} for e in ents] for ents in outputs]
+
+    def embed(chunk):
+        vectors = embedder.encode(chunk, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return [encode_embedding(v) for v in vectors]
+
+    def keywords(chunk):
+        chunk_texts = [text for text, _ in chunk]
+        # Only candidate phrases get embedded here; document vectors come from the embed stage
+        doc_embeddings = np.vstack([vector for _, vector in chunk])
+        outputs = kw_model.extract_keywords(chunk_texts, doc_embeddings=doc_embeddings,
+                                            keyphrase_ngram_range=(1, 2), stop_words="english", top_n=5)
+        if len(chunk) == 1:
+            outputs = [outputs]  # KeyBERT returns a flat list for a single document
+        return [[kw[0] for kw in kws] for kws in outputs]
+
+    generated = _run_stage("summarize", texts, batch_size, summarize, stats)
+    ents = _run_stage("ner", texts, batch_size, entities, stats)
+
+    columns = {c: (df[c].tolist() if c in df.columns else [None] * len(df)) for c in EMBEDDING_COLUMNS}
+    missing = [i for i in positions if not _has_embedding(columns["embedding"][i], columns["embedding_model"][i])]
+    blobs = _run_stage("embed", [df["summary"].iat[i] for i in missing], batch_size, embed, stats)
+    for i, blob in zip(missing, blobs):
+        columns["embedding"][i], columns["embedding_model"][i], columns["embedding_dtype"][i] = \
+            blob, EMBEDDING_MODEL, EMBEDDING_DTYPE
+    for c in EMBEDDING_COLUMNS:
+        df[c] = pd.Series(columns[c], index=df.index, dtype=object)
+
+    vectors = [decode_embedding(columns["embedding"][i], columns["embedding_dtype"][i] or EMBEDDING_DTYPE)
+               for i in positions]
+    kws = _run_stage("keywords", list(zip(texts, vectors)), batch_size, keywords, stats)
+
+    results = [("No summary available", [], [])] * len(df)
+    for pos, summary, doc_entities, doc_keywords in zip(positions, generated, ents, kws):
+        results[pos] = (summary, doc_entities, doc_keywords)
+    df[["generated_summary", "entities", "keywords"]] = pd.DataFrame(results, index=df.index)
+    return stats
+
+
+def _init_shard_worker(torch_threads: int):
+    set_torch_threads(torch_threads)
+
+
+def _process_shard(shard: pd.DataFrame, batch_size: int):
+    stats = _process_serial(shard, batch_size)
+    return shard, stats
+
+
+def _format_stats(stats: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'stage':<12}{'docs':>8}{'seconds':>10}{'docs/sec':>10}"]
+    for stage in STAGES:
+        s = stats.get(stage)
+        if s:
+            lines.append(f"{stage:<12}{s['docs']:>8}{s['seconds']:>10.2f}{s['docs_per_sec']:>10.2f}")
+    if "total" in stats:
+        t = stats["total"]
+        lines.append(f"{'total':<12}{t['docs']:>8}{t['seconds']:>10.2f}  ({t['processes']} processes)")
+    return "\n".join(lines)
+
+
+def process_documents(df: pd.DataFrame, batch_size: int = ENGINE_BATCH_SIZE, processes: int = ENGINE_PROCESSES,
+                      torch_threads: Optional[int] = None, collection=None) -> pd.DataFrame:
+    """
+    Add generated_summary, entities, keywords and embedding columns to df.
+    With processes > 1 the rows are split into that many shards, each enriched
+    in its own process (models are loaded once per worker). Pass the documents
+    collection to reuse embeddings already stored there.
+    """
+    torch_threads = ENGINE_TORCH_THREADS if torch_threads is None else torch_threads
+    if collection is not None:
+        reused = attach_stored_embeddings(df, collection)
+        if reused:
+            print(f"Reusing {reused} stored embeddings.")
+    print("Processing documents...")
+    if processes <= 1 or len(df) <= batch_size:
+        set_torch_threads(torch_threads)
+        stats = _process_serial(df, batch_size)
+    else:
+        import multiprocessing
+        processes = min(processes, len(df))
+        if torch_threads <= 0:
+            # Split the cores between shards rather than letting each grab all of them
+            torch_threads = max(1, (os.cpu_count() or 1) // processes)
+        bounds = [len(df) * i // processes for i in range(processes + 1)]
+        shards = [df.iloc[bounds[i]:bounds[i + 1]].copy() for i in range(processes)]
+        start = time.perf_counter()
+        # spawn: forking a process that may already hold torch threads can deadlock
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_shard_worker, initargs=(torch_threads,)) as executor:
+            done = list(executor.map(_process_shard, shards, [batch_size] * len(shards)))
+        wall = time.perf_counter() - start
+        enriched = pd.concat([shard for shard, _ in done])
+        for column in ("generated_summary", "entities", "keywords") + EMBEDDING_COLUMNS:
+            # Shards come back in order; .values keeps the per-row lists as objects
+            df[column] = pd.Series(enriched[column].values, index=df.index)
+        # Shards run side by side, so stage throughput adds up across them
+        stats = {}
+        for stage in STAGES:
+            shard_stats = [s[stage] for _, s in done if stage in s]
+            stats[stage] = {"docs": sum(s["docs"] for s in shard_stats),
+                            "seconds": max((s["seconds"] for s in shard_stats), default=0.0),
+                            "docs_per_sec": round(sum(s["docs_per_sec"] for s in shard_stats), 2)}
+        stats["total"] = {"docs": len(df), "seconds": round(wall, 3), "processes": processes}
+
+    df.attrs["engine_stats"] = stats
+    print(_format_stats(stats))
     print("Processing complete.")
-    return df
\ No newline at end of file
+    return df
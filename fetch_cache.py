@@ -0,0 +1,174 @@
+# fetch_cache.py
+"""
+In-process cache for upstream paper fetches (arXiv, SerpAPI).
+
+Entries are keyed by (source, normalized query, max_results) and expire after
+a per-source TTL. Concurrent identical requests are coalesced (single-flight):
+one caller runs the upstream fetch and the others await its result, so a
+trending topic searched by several dashboard users costs one SerpAPI call.
+
+Backends are pluggable: MemoryBackend (default, size-bounded LRU) or
+RedisBackend to share entries across API processes. FetchCache.afetch() is
+the entry point, used by the async fetch layer (async_fetch.py).
+"""
+import os
+import re
+import asyncio
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("aetos.fetch_cache")
+
+FETCH_CACHE_BACKEND = os.getenv("FETCH_CACHE_BACKEND", "memory")  # memory | redis | none
+FETCH_CACHE_MAX_ENTRIES = int(os.getenv("FETCH_CACHE_MAX_ENTRIES", "1000"))
+FETCH_CACHE_TTLS = {
+    "arxiv": float(os.getenv("FETCH_CACHE_TTL_ARXIV", "900")),
+    # SerpAPI bills per call, so keep its results longer
+    "serpapi": float(os.getenv("FETCH_CACHE_TTL_SERPAPI", "3600")),
+}
+FETCH_CACHE_DEFAULT_TTL = float(os.getenv("FETCH_CACHE_DEFAULT_TTL", "600"))
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "")).strip().lower()
+
+
+class MemoryBackend:
+    """Thread-safe dict with per-entry expiry and LRU eviction beyond max_entries."""
+
+    def __init__(self, max_entries: int = FETCH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class RedisBackend:
+    """Stores JSON-encoded values in Redis with native key expiry."""
+
+    def __init__(self, client, prefix: str = "aetos:fetch:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=max(1, int(ttl)))
+
+
+class FetchCache:
+    def __init__(self, backend=None, ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = FETCH_CACHE_DEFAULT_TTL):
+        self.backend = backend
+        self.ttls = dict(FETCH_CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        # key -> [load task, waiter count]; only touched from the event loop thread
+        self._async_inflight: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    @staticmethod
+    def key(source: str, query: str, max_results: int) -> str:
+        return f"{source}|{normalize_query(query)}|{int(max_results)}"
+
+    def _read(self, key: str):
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning("fetch cache read failed: %s", e)
+            self._count("errors")
+            return None
+
+    def _store(self, key: str, source: str, docs):
+        if docs and self.backend is not None:
+            try:
+                self.backend.set(key, docs, self.ttls.get(source, self.default_ttl))
+            except Exception as e:
+                logger.warning("fetch cache write failed: %s", e)
+                self._count("errors")
+
+    async def afetch(self, source: str, query: str, max_results: int,
+                     fn: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+        """
+        Return the documents of coroutine fn() for (source, query, max_results),
+        from cache when fresh. Empty results are not cached: the fetchers
+        return [] on errors too. Concurrent callers on one event loop await a
+        single shared load task; it is cancelled only once every caller waiting
+        on it has been cancelled (e.g. all of them hit their deadline).
+        """
+        key = self.key(source, query, max_results)
+        cached = self._read(key)
+        if cached is not None:
+            self._count("hits")
+            return [dict(d) for d in cached]
+
+        entry = self._async_inflight.get(key)
+        shared = entry is not None
+        if entry is None:
+            async def load():
+                docs = await fn()
+                self._store(key, source, docs)
+                return docs
+
+            entry = self._async_inflight[key] = [asyncio.ensure_future(load()), 0]
+            entry[0].add_done_callback(
+                lambda _: self._async_inflight.pop(key, None) if self._async_inflight.get(key) is entry else None)
+        entry[1] += 1
+        try:
+            docs = await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+        self._count("coalesced" if shared else "misses")
+        return [dict(d) for d in (docs or [])]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def get_default_fetch_cache() -> FetchCache:
+    """FetchCache for FETCH_CACHE_BACKEND; 'none' keeps single-flight but stores nothing."""
+    name = FETCH_CACHE_BACKEND.lower()
+    backend = None
+    if name == "redis":
+        try:
+            import redis
+            backend = RedisBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+        except Exception as e:
+            logger.warning("redis fetch cache unavailable, using memory: %s", e)
+            backend = MemoryBackend()
+    elif name != "none":
+        backend = MemoryBackend()
+    return FetchCache(backend)
@@ -0,0 +1,170 @@
+# http_client.py
+"""
+Shared, connection-pooled HTTP session for all external fetchers (arXiv,
+SerpAPI, Gemini).
+
+One requests.Session is reused process-wide so TCP+TLS connections are kept
+alive between calls. Each upstream host gets its own pool size, and transient
+failures (429/5xx, connection errors) are retried with exponential backoff and
+full jitter, honoring Retry-After when the server sends it.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("aetos.http_client")
+
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8.0"))
+# A Retry-After longer than this is not worth blocking a request on
+HTTP_RETRY_AFTER_MAX = float(os.getenv("HTTP_RETRY_AFTER_MAX", "30.0"))
+HTTP_DEFAULT_POOL_SIZE = int(os.getenv("HTTP_DEFAULT_POOL_SIZE", "10"))
+# "host=size,host=size"
+HTTP_POOL_SIZES = os.getenv(
+    "HTTP_POOL_SIZES",
+    "export.arxiv.org=4,serpapi.com=8,generativelanguage.googleapis.com=16",
+)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+USER_AGENT = "AetosBot/1.0"
+
+
+def _parse_pool_sizes(spec: str) -> Dict[str, int]:
+    sizes = {}
+    for part in (spec or "").split(","):
+        host, _, size = part.strip().partition("=")
+        if host and size.strip().isdigit():
+            sizes[host.strip()] = int(size)
+    return sizes
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = HTTP_BACKOFF_BASE, cap: float = HTTP_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class PooledHTTPClient:
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None, default_pool_size: int = HTTP_DEFAULT_POOL_SIZE,
+                 max_retries: int = HTTP_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT, "Connection": "keep-alive"})
+        self._adapters = []
+        default = HTTPAdapter(pool_connections=8, pool_maxsize=default_pool_size)
+        self._adapters.append(default)
+        self.session.mount("http://", default)
+        self.session.mount("https://", default)
+        # requests picks the longest matching prefix, so per-host adapters win
+        for host, size in (pool_sizes if pool_sizes is not None else _parse_pool_sizes(HTTP_POOL_SIZES)).items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self._adapters.append(adapter)
+            self.session.mount(f"http://{host}/", adapter)
+            self.session.mount(f"https://{host}/", adapter)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "failures": 0}
+        self._retries_by_host: Dict[str, int] = {}
+
+    def _count(self, key: str, host: Optional[str] = None):
+        with self._lock:
+            self._counters[key] += 1
+            if host and key == "retries":
+                self._retries_by_host[host] = self._retries_by_host.get(host, 0) + 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Same signature as requests.request. Retries RETRY_STATUSES and connection
+        errors; the last response (or exception) is returned/raised unchanged.
+        """
+        host = urlsplit(url).hostname or ""
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("%s %s failed (%s); retry %d in %.2fs", method, host, e, attempt + 1, delay)
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return resp
+                delay = backoff_delay(attempt)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    if retry_after > HTTP_RETRY_AFTER_MAX:
+                        return resp
+                    delay = max(delay, retry_after)
+                logger.info("%s %s returned %d; retry %d in %.2fs", method, host, resp.status_code, attempt + 1, delay)
+                resp.close()
+            self._count("retries", host)
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, object]:
+        """Request/retry counters plus connection reuse taken from the urllib3 pools."""
+        opened = 0
+        pooled_requests = 0
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                pooled_requests += pool.num_requests
+        with self._lock:
+            out = dict(self._counters)
+            out["retries_by_host"] = dict(self._retries_by_host)
+        out["connections_opened"] = opened
+        out["connections_reused"] = max(0, pooled_requests - opened)
+        return out
+
+
+_client: Optional[PooledHTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> PooledHTTPClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PooledHTTPClient()
+        return _client
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_client().get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return get_client().post(url, **kwargs)
@@ -8,7 +8,10 @@ import json
 import concurrent.futures
 import re
 import requests
+import http_client
 import xml.etree.ElementTree as ET
+# Module-level combined fetcher (sync wrapper over the async fetch layer) used by worker.py
+from async_fetch import fetch_combined_papers
 from worker import run_analysis_pipeline_task
 
 
@@ -95,7 +98,7 @@ def create_app():
         try:
             q = requests.utils.requote_uri(query)
             url = f"http://export.arxiv.org/api/query?search_query=all:{q}&start=0&max_results={max_results}&sortBy=submittedDate&sortOrder=descending"
-            resp = requests.get(url, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
+            resp = http_client.get(url, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
             if resp.status_code != 200 or not resp.text:
                 return []
             root = ET.fromstring(resp.text)
@@ -135,7 +138,7 @@ def create_app():
                 "api_key": api_key,
                 "num": max_results
             }
-            resp = requests.get("https://serpapi.com/search", params=params, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
+            resp = http_client.get("https://serpapi.com/search", params=params, timeout=timeout, headers={"User-Agent": "AetosBot/1.0"})
             if resp.status_code != 200 or not resp.text:
                 return []
             j = resp.json()
@@ -1,16 +1,18 @@
 import requests  # Fallback, but primary is Selenium
 import pandas as pd
-from bs4 import BeautifulSoup
 from urllib.parse import quote_plus
 import time
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 def fetch_patent_data(topic: str, max_results: int = 10, retries: int = 3) -> pd.DataFrame:
+    # Selenium and the HTML parser are only needed once a browser fetch actually runs
+    from bs4 import BeautifulSoup
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     formatted_topic = quote_plus(topic)
     target_url = f"https://patents.google.com/?q=({formatted_topic})&num={max_results}"
 
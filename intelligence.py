@@ -3,15 +3,42 @@ import os
 import json
 import re
 import logging
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, List
+
+from llm_cache import get_default_cache
+from batching import pack_batches, format_batch_documents, parse_batch_response
 
 logger = logging.getLogger("aetos.intelligence")
 
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except Exception:
-    GENAI_AVAILABLE = False
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def _load_genai():
+    """Import google.generativeai on first use (it pulls in grpc/protobuf); None if not installed."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            try:
+                import google.generativeai as genai
+                _genai = genai
+            except Exception:
+                _genai = False
+        return _genai or None
+
+
+# Bump whenever the prompt below changes so cached results are not reused
+PROMPT_VERSION = "intel-v1"
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+def _get_analysis_cache(model_name: str):
+    global _analysis_cache
+    with _analysis_cache_lock:
+        if _analysis_cache is None or _analysis_cache.model != model_name:
+            _analysis_cache = get_default_cache(PROMPT_VERSION, model_name)
+        return _analysis_cache
 
 def _safe_json_parse(s: str):
     if not s:
@@ -27,7 +54,7 @@ def _safe_json_parse(s: str):
             return None
     return None
 
-def _extract_numeric_funding(text: str):
+def extract_numeric_funding(text: str):
     if not text:
         return 0
     m = re.search(r'(\d[\d,\.]{0,}\s*(?:billion|million|bn|m|k)?)', text, re.IGNORECASE)
@@ -54,10 +81,10 @@ def _extract_numeric_funding(text: str):
             return 0
     return 0
 
-def _local_analyze(text: str, topic: str = "") -> Dict[str, Any]:
+def local_analyze(text: str, topic: str = "") -> Dict[str, Any]:
     txt = (text or "").strip()
     lower = txt.lower()
-    funding_amount = _extract_numeric_funding(text)
+    funding_amount = extract_numeric_funding(text)
     if funding_amount == 0:
         if any(k in lower for k in ["industry", "commercial", "start-up", "startup", "venture", "vc", "venture capital"]):
             funding_amount = 500000
@@ -109,7 +136,8 @@ def _local_analyze(text: str, topic: str = "") -> Dict[str, Any]:
         "funding_estimate_usd": funding_amount,
         "trend_score": round(min(1.0, (funding_amount / 5_000_000) * 0.2 + 0.2), 2),
         "convergence": [],
-        "mock_trl_progression": {"history": [{"year": 2022, "avg_trl": max(1, trl-2)}, {"year": 2023, "avg_trl": trl}], "forecast": [{"year": 2024, "avg_trl": min(9, trl + 1)}]},
+        # A single text has no history; market_trends fits the progression across documents
+        "mock_trl_progression": {"history": [], "forecast": []},
         "TRL": int(min(max(trl, 1), 9)),
         "TRL_justification": f"Heuristic: funding_estimate={funding_amount}",
         "strategic_summary": strategic_summary or "No summary available",
@@ -120,53 +148,133 @@ def _local_analyze(text: str, topic: str = "") -> Dict[str, Any]:
 
 def get_gemini_analysis(text: str, topic: str = "", max_output_tokens: int = 512) -> Dict[str, Any]:
     if not text or len(text.split()) < 20:
-        return _local_analyze(text, topic)
+        return local_analyze(text, topic)
     api_key = os.getenv("GEMINI_API_KEY")
     model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
-    if GENAI_AVAILABLE and api_key:
-        try:
-            genai.configure(api_key=api_key)
-            prompt = (
-                "Produce a JSON object only (no extra text) with keys: ai_summary (short 2-4 sentence summary), "
-                "insights (array of up to 5 concise insights), key_players (array of org/company names), "
-                "country (primary country or empty), funding_estimate_usd (approx number or null), "
-                "trend_score (0.0-1.0), convergence (array of {tech_1, tech_2, strength}), "
-                "mock_trl_progression ({history:[{year,avg_trl}],forecast:[{year,avg_trl}]}), "
-                "TRL (int 1-9), TRL_justification (string), strategic_summary (string), technologies (array). "
-                f"TOPIC: {topic}\n\nTEXT: {text[:8000]}"
-            )
-            try:
-                response = genai.generate(model=model_name, prompt=prompt, max_output_tokens=max_output_tokens)
-            except Exception:
-                response = genai.respond(model=model_name, prompt=prompt) if hasattr(genai, "respond") else None
-            raw = ""
-            if response is None:
-                return _local_analyze(text, topic)
-            if isinstance(response, dict):
-                raw = response.get("candidates") or response.get("output") or response.get("text") or str(response)
-                if isinstance(raw, list):
-                    raw = raw[0] if raw else ""
-            else:
-                raw = getattr(response, "text", "") or str(response)
-            parsed = _safe_json_parse(raw)
-            if parsed and isinstance(parsed, dict):
-                parsed.setdefault("ai_summary", parsed.get("ai_summary") or parsed.get("summary") or "")
-                parsed.setdefault("insights", parsed.get("insights") or [])
-                parsed.setdefault("key_players", parsed.get("key_players") or [])
-                parsed.setdefault("country", parsed.get("country") or "")
-                parsed.setdefault("funding_estimate_usd", parsed.get("funding_estimate_usd"))
-                parsed.setdefault("trend_score", float(parsed.get("trend_score") or 0.0))
-                parsed.setdefault("convergence", parsed.get("convergence") or [])
-                parsed.setdefault("mock_trl_progression", parsed.get("mock_trl_progression") or {"history": [], "forecast": []})
-                parsed.setdefault("TRL", int(parsed.get("TRL") or parsed.get("trl") or 0))
-                parsed.setdefault("TRL_justification", parsed.get("TRL_justification") or parsed.get("trl_justification") or "")
-                parsed.setdefault("strategic_summary", parsed.get("strategic_summary") or parsed.get("ai_summary") or "")
-                parsed.setdefault("technologies", parsed.get("technologies") or [])
-                return parsed
-            else:
-                return _local_analyze(text, topic)
-        except Exception as e:
-            logger.exception("Gemini call failed, falling back: %s", e)
-            return _local_analyze(text, topic)
+    if api_key and _load_genai() is not None:
+        cache = _get_analysis_cache(model_name)
+        if cache is not None:
+            cached = cache.get(text, extra=topic)
+            if cached is not None:
+                return cached
+        parsed = _call_gemini(text, topic, model_name, api_key, max_output_tokens)
+        if parsed is None:
+            return local_analyze(text, topic)
+        if cache is not None:
+            cache.set(text, parsed, extra=topic)
+        return parsed
     else:
-        return _local_analyze(text, topic)
+        return local_analyze(text, topic)
+
+def _generate_raw(model_name: str, prompt: str, max_output_tokens: int):
+    """Run one generate call and return the raw response text, or None if there was none."""
+    genai = _load_genai()
+    try:
+        response = genai.generate(model=model_name, prompt=prompt, max_output_tokens=max_output_tokens)
+    except Exception:
+        response = genai.respond(model=model_name, prompt=prompt) if hasattr(genai, "respond") else None
+    if response is None:
+        return None
+    if isinstance(response, dict):
+        raw = response.get("candidates") or response.get("output") or response.get("text") or str(response)
+        if isinstance(raw, list):
+            raw = raw[0] if raw else ""
+        return raw
+    return getattr(response, "text", "") or str(response)
+
+def _normalize_analysis(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    parsed.setdefault("ai_summary", parsed.get("ai_summary") or parsed.get("summary") or "")
+    parsed.setdefault("insights", parsed.get("insights") or [])
+    parsed.setdefault("key_players", parsed.get("key_players") or [])
+    parsed.setdefault("country", parsed.get("country") or "")
+    parsed.setdefault("funding_estimate_usd", parsed.get("funding_estimate_usd"))
+    parsed.setdefault("trend_score", float(parsed.get("trend_score") or 0.0))
+    parsed.setdefault("convergence", parsed.get("convergence") or [])
+    parsed.setdefault("mock_trl_progression", parsed.get("mock_trl_progression") or {"history": [], "forecast": []})
+    parsed.setdefault("TRL", int(parsed.get("TRL") or parsed.get("trl") or 0))
+    parsed.setdefault("TRL_justification", parsed.get("TRL_justification") or parsed.get("trl_justification") or "")
+    parsed.setdefault("strategic_summary", parsed.get("strategic_summary") or parsed.get("ai_summary") or "")
+    parsed.setdefault("technologies", parsed.get("technologies") or [])
+    return parsed
+
+_ANALYSIS_KEYS = (
+    "ai_summary (short 2-4 sentence summary), "
+    "insights (array of up to 5 concise insights), key_players (array of org/company names), "
+    "country (primary country or empty), funding_estimate_usd (approx number or null), "
+    "trend_score (0.0-1.0), convergence (array of {tech_1, tech_2, strength}), "
+    "mock_trl_progression ({history:[{year,avg_trl}],forecast:[{year,avg_trl}]}), "
+    "TRL (int 1-9), TRL_justification (string), strategic_summary (string), technologies (array). "
+)
+
+def _call_gemini(text: str, topic: str, model_name: str, api_key: str, max_output_tokens: int):
+    """Returns the normalized Gemini JSON, or None if the caller should fall back to local_analyze."""
+    try:
+        _load_genai().configure(api_key=api_key)
+        prompt = (
+            "Produce a JSON object only (no extra text) with keys: " + _ANALYSIS_KEYS +
+            f"TOPIC: {topic}\n\nTEXT: {text[:8000]}"
+        )
+        parsed = _safe_json_parse(_generate_raw(model_name, prompt, max_output_tokens))
+        if parsed and isinstance(parsed, dict):
+            return _normalize_analysis(parsed)
+        return None
+    except Exception as e:
+        logger.exception("Gemini call failed, falling back: %s", e)
+        return None
+
+def _call_gemini_batch(texts: List[str], topic: str, model_name: str, api_key: str, max_output_tokens: int):
+    """Returns a list aligned with texts; entries missing from the response are None."""
+    try:
+        _load_genai().configure(api_key=api_key)
+        prompt = (
+            "Produce a JSON array only (no extra text) with one object per document below. "
+            "Each object has keys: index (the n from the document's [DOC n] header), " + _ANALYSIS_KEYS +
+            f"TOPIC: {topic}\n\n" + format_batch_documents([t[:8000] for t in texts])
+        )
+        raw = _generate_raw(model_name, prompt, max_output_tokens * len(texts))
+        return [_normalize_analysis(p) if p else None for p in parse_batch_response(raw, len(texts))]
+    except Exception as e:
+        logger.exception("Gemini batch call failed, retrying per document: %s", e)
+        return [None] * len(texts)
+
+def get_gemini_batch_analysis(texts: List[str], topic: str = "", max_output_tokens: int = 512) -> List[Dict[str, Any]]:
+    """
+    Analyze many texts, packing them into as few Gemini requests as the token
+    budget allows. Cached texts skip the model; entries a batch response fails
+    to return are retried through get_gemini_analysis. Results align with texts.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
+    if not api_key or _load_genai() is None:
+        return [local_analyze(t, topic) for t in texts]
+    token_budget = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "6000"))
+    max_docs = int(os.getenv("GEMINI_BATCH_MAX_DOCS", "8"))
+
+    results: List[Any] = [None] * len(texts)
+    pending = []
+    cache = _get_analysis_cache(model_name)
+    for i, t in enumerate(texts):
+        if not t or len(t.split()) < 20:
+            results[i] = local_analyze(t, topic)
+            continue
+        cached = cache.get(t, extra=topic) if cache is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    for batch in pack_batches([texts[i] for i in pending], token_budget, max_docs):
+        idxs = [pending[j] for j in batch]
+        if len(idxs) < 2:
+            continue
+        analyses = _call_gemini_batch([texts[i] for i in idxs], topic, model_name, api_key, max_output_tokens)
+        for i, parsed in zip(idxs, analyses):
+            if parsed is not None:
+                results[i] = parsed
+                if cache is not None:
+                    cache.set(texts[i], parsed, extra=topic)
+
+    for i in pending:
+        if results[i] is None:
+            results[i] = get_gemini_analysis(texts[i], topic=topic, max_output_tokens=max_output_tokens)
+    return results
@@ -0,0 +1,132 @@
+# jobs.py
+"""
+In-process background job runner for long analysis requests.
+
+The API submits `run_analysis_pipeline` here instead of running it inline so a
+Flask worker is released as soon as the job id is returned. Jobs run on a
+bounded thread pool; callers poll the status/result endpoints.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("aetos.jobs")
+
+MAX_ANALYSIS_JOBS = int(os.getenv("MAX_ANALYSIS_JOBS", "2"))
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "20"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+
+PIPELINE_STAGES = ("fetch", "filter", "analyze", "score", "save")
+
+
+class JobQueueFull(Exception):
+    """Raised when the number of queued + running jobs hits the limit."""
+
+
+class JobManager:
+    """
+    Tracks analysis jobs and runs them on a bounded ThreadPoolExecutor.
+
+    The submitted callable receives a `progress(stage, status=None, done=None, total=None)`
+    keyword argument it can use to report per-stage progress.
+    """
+
+    def __init__(self, max_workers: int = MAX_ANALYSIS_JOBS, max_pending: int = MAX_PENDING_JOBS,
+                 result_ttl: float = JOB_RESULT_TTL, stages=PIPELINE_STAGES):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="aetos-job")
+        self._max_pending = max(1, max_pending)
+        self._result_ttl = result_ttl
+        self._stages = tuple(stages)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _active_count(self) -> int:
+        return sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, j in self._jobs.items()
+            if j["finished_at"] and now - j["finished_at"] > self._result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> str:
+        with self._lock:
+            self._evict_expired()
+            if self._active_count() >= self._max_pending:
+                raise JobQueueFull(f"{self._max_pending} analysis jobs already pending")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "stages": {s: {"status": "pending"} for s in self._stages},
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _progress_callback(self, job_id: str):
+        def progress(stage, status=None, done=None, total=None):
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                entry = job["stages"].setdefault(stage, {"status": "pending"})
+                if status is not None:
+                    entry["status"] = status
+                if done is not None:
+                    entry["done"] = done
+                if total is not None:
+                    entry["total"] = total
+        return progress
+
+    def _run(self, job_id: str, fn, args, kwargs):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+        try:
+            result = fn(*args, progress=self._progress_callback(job_id), **kwargs)
+        except Exception as e:
+            logger.exception("analysis job %s failed: %s", job_id, e)
+            with self._lock:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+            return
+        with self._lock:
+            job["status"] = "complete"
+            job["result"] = result
+            job["finished_at"] = time.time()
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job without its result payload, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {k: v for k, v in job.items() if k != "result"}
+            snapshot["stages"] = {s: dict(v) for s, v in job["stages"].items()}
+            return snapshot
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return status plus result payload, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {"job_id": job_id, "status": job["status"], "error": job["error"], "result": job["result"]}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
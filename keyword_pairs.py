@@ -0,0 +1,241 @@
+# keyword_pairs.py
+"""
+Persistent technology co-occurrence counts in aetos_db.keyword_pairs.
+
+Every saved document adds one to each pair of its keywords (the union of
+Gemini `technologies` and NLP `keywords`, case-folded) in four buckets:
+its topic and ALL_TOPICS, each for its publication month ("YYYY-MM") and
+for ALL_TIME. Each bucket is one document {topic, bucket, a, b, count},
+maintained with unordered `$inc` bulk writes.
+
+Re-saving a document must not count it twice, so each saved document keeps
+what it contributed in `pair_state`; staging a save diffs the new
+contribution against the stored one and only the difference is applied.
+
+Top pairs for all time are a single indexed, sorted find. A month range is
+one aggregation over the months in the range, so its cost depends on how
+many pairs occur there and not on how many documents the corpus holds.
+"""
+import os
+import logging
+from collections import Counter
+from datetime import datetime
+from itertools import combinations
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from records import parse_published
+
+logger = logging.getLogger("aetos.keyword_pairs")
+
+# Pairs grow quadratically; KeyBERT gives 5 keywords and Gemini rarely more than 10
+KEYWORD_PAIRS_MAX_KEYWORDS = int(os.getenv("KEYWORD_PAIRS_MAX_KEYWORDS", "10"))
+KEYWORD_PAIRS_CHUNK_SIZE = int(os.getenv("KEYWORD_PAIRS_CHUNK_SIZE", "1000"))
+
+ALL_TOPICS = "*"
+ALL_TIME = "*"
+# Sorts after ALL_TIME and before every real month
+UNDATED = "0000-00"
+
+def topic_key(topic: Optional[str]) -> str:
+    """Topics are compared case- and whitespace-insensitively, like arXiv high-water marks."""
+    return " ".join((topic or "").lower().split())
+
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.casefold().split())
+
+
+def document_keywords(doc: Dict[str, Any], limit: int = KEYWORD_PAIRS_MAX_KEYWORDS) -> List[str]:
+    """Distinct normalized keywords from technologies and keywords (lists or comma strings), sorted."""
+    found = []
+    for field in ("technologies", "keywords"):
+        value = doc.get(field)
+        if isinstance(value, str):
+            value = value.split(",")
+        if not isinstance(value, (list, tuple, set)):
+            continue
+        for keyword in value:
+            if isinstance(keyword, (list, tuple)) and keyword:
+                keyword = keyword[0]  # (keyword, score) pairs
+            if isinstance(keyword, str) and normalize_keyword(keyword):
+                found.append(normalize_keyword(keyword))
+    # dict.fromkeys keeps first-seen order, so the limit prefers technologies
+    return sorted(list(dict.fromkeys(found))[:limit])
+
+
+def month_bucket(value: Any) -> str:
+    """'YYYY-MM' for a datetime, ISO string or bare year; UNDATED otherwise."""
+    if isinstance(value, str) and len(value) == 7 and value[4] == "-":
+        return value
+    published = parse_published(value) if not isinstance(value, datetime) else value
+    try:
+        return f"{published.year:04d}-{published.month:02d}"
+    except (AttributeError, TypeError, ValueError):
+        return UNDATED
+
+
+def pair_state(doc: Dict[str, Any], topics: Iterable[str]) -> Dict[str, Any]:
+    """What a document contributes: its keywords, month bucket and the topics it was saved under."""
+    return {
+        "keywords": document_keywords(doc),
+        "bucket": month_bucket(doc.get("published")),
+        "topics": sorted(set(topics) | {ALL_TOPICS}),
+    }
+
+
+def count_changes(touched: Iterable[Optional[Tuple[Optional[Dict], Optional[Dict]]]],
+                  skip: Iterable[int] = ()) -> Counter:
+    """
+    Net count changes for (previous state, new state) tuples, as stage()
+    reports them; None entries and the positions in `skip` (e.g. records
+    whose upsert failed) are left out.
+    """
+    skip = set(skip)
+    deltas = Counter()
+    for i, change in enumerate(touched):
+        if change is None or i in skip:
+            continue
+        old, new = change
+        deltas.update(contributions(new))
+        deltas.subtract(contributions(old))
+    return Counter({k: v for k, v in deltas.items() if v})
+
+
+def contributions(state: Optional[Dict[str, Any]]) -> Counter:
+    counted = Counter()
+    if not state:
+        return counted
+    for a, b in combinations(state.get("keywords") or [], 2):
+        for topic in state.get("topics") or [ALL_TOPICS]:
+            counted[(topic, state.get("bucket") or UNDATED, a, b)] += 1
+            counted[(topic, ALL_TIME, a, b)] += 1
+    return counted
+
+
+class KeywordPairStore:
+    def __init__(self, collection, chunk_size: int = KEYWORD_PAIRS_CHUNK_SIZE):
+        self.collection = collection
+        self.chunk_size = chunk_size
+
+    def ensure_indexes(self):
+        self.collection.create_index([("topic", ASCENDING), ("bucket", ASCENDING), ("a", ASCENDING), ("b", ASCENDING)],
+                                     unique=True, name="pair_unique")
+        # Top-N within one bucket is an index walk; month ranges use the prefix
+        self.collection.create_index([("topic", ASCENDING), ("bucket", ASCENDING), ("count", DESCENDING)])
+
+    def stage(self, documents, records: List[Dict[str, Any]], key_fn: Callable[[Dict[str, Any]], Optional[Dict]],
+              topic: Optional[str] = None, touched: Optional[list] = None) -> Counter:
+        """
+        Set `pair_state` on each record about to be upserted into `documents`
+        and return the count changes relative to the states already stored
+        for them (one $in lookup per key field). Records without a
+        single-field key are not counted. Apply the result with apply() once
+        the documents are written. `touched`, if given, receives one entry per
+        record: its (previous state, new state), or None if it isn't counted.
+        If some upserts fail, count_changes(touched, skip=failed) gives the
+        changes of the records that were written.
+        """
+        # Single-field upsert keys with a value identify the stored document
+        refs = []
+        for rec in records:
+            key = key_fn(rec)
+            ref = next(iter(key.items())) if key and len(key) == 1 else None
+            refs.append(ref if ref and ref[1] is not None else None)
+        wanted: Dict[str, List[Any]] = {}
+        for ref in refs:
+            if ref:
+                wanted.setdefault(ref[0], []).append(ref[1])
+        previous: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        if wanted:
+            clauses = [{field: {"$in": values}} for field, values in wanted.items()]
+            projection = {"_id": 0, "pair_state": 1, **{field: 1 for field in wanted}}
+            for stored in documents.find({"$or": clauses}, projection):
+                for field in wanted:
+                    if stored.get(field) is not None:
+                        previous[(field, stored[field])] = stored.get("pair_state")
+
+        topic = topic_key(topic)
+        changes = []
+        for rec, ref in zip(records, refs):
+            if ref is None:
+                changes.append(None)
+                continue  # no stable identity, so a re-save couldn't be told apart from a new document
+            old = previous.get(ref)
+            topics = set(old.get("topics") or []) if old else set()
+            if topic:
+                topics.add(topic)
+            new = pair_state(rec, topics)
+            rec["pair_state"] = new
+            changes.append((old, new))
+            previous[ref] = new  # a repeat of the same document in this batch diffs against this one
+        if touched is not None:
+            touched.extend(changes)
+        return count_changes(changes)
+
+    def apply(self, deltas: Counter) -> Dict[str, int]:
+        """
+        Write count changes with unordered $inc bulk writes. Then, for each
+        decremented pair, a DeleteOne on its unique key that only matches once
+        its count has dropped to zero, so no collection scan is needed.
+        """
+        stats = {"incremented": 0, "decremented": 0, "failed": 0}
+        ops, emptied = [], []
+
+        def flush(batch):
+            if not batch:
+                return
+            try:
+                self.collection.bulk_write(batch, ordered=False)
+            except BulkWriteError as e:
+                errors = (e.details or {}).get("writeErrors", [])
+                stats["failed"] += len(errors)
+                logger.warning("%d keyword pair updates failed", len(errors))
+            batch.clear()
+
+        for (topic, bucket, a, b), delta in deltas.items():
+            if not delta:
+                continue
+            key = {"topic": topic, "bucket": bucket, "a": a, "b": b}
+            # Only increments may create a pair; decrements touch existing ones
+            ops.append(UpdateOne(key, {"$inc": {"count": delta}}, upsert=delta > 0))
+            stats["incremented" if delta > 0 else "decremented"] += 1
+            if delta < 0:
+                emptied.append(DeleteOne({**key, "count": {"$lte": 0}}))
+            if len(ops) >= self.chunk_size:
+                flush(ops)
+        flush(ops)
+        # After every $inc has landed; an unordered bulk wouldn't guarantee that
+        for start in range(0, len(emptied), self.chunk_size):
+            flush(emptied[start:start + self.chunk_size])
+        return stats
+
+    def top_pairs(self, topic: Optional[str] = None, start: Any = None, end: Any = None,
+                  limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        The strongest pairs for a topic (all topics by default) over the
+        publication months start..end inclusive ('YYYY-MM', dates or years;
+        either bound may be omitted). Without a range this is all time,
+        undated documents included.
+        """
+        topic = topic_key(topic) or ALL_TOPICS
+        if start is None and end is None:
+            cursor = self.collection.find({"topic": topic, "bucket": ALL_TIME}, {"_id": 0, "a": 1, "b": 1, "count": 1})
+            rows = cursor.sort([("count", DESCENDING)]).limit(limit)
+            return [{"tech_1": r["a"], "tech_2": r["b"], "strength": r["count"]} for r in rows]
+
+        buckets = {"$gt": UNDATED}
+        if start is not None:
+            buckets = {"$gte": month_bucket(start)}
+        if end is not None:
+            buckets["$lte"] = month_bucket(end)
+        pipeline = [
+            {"$match": {"topic": topic, "bucket": buckets}},
+            {"$group": {"_id": {"a": "$a", "b": "$b"}, "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1, "_id.a": 1, "_id.b": 1}},
+            {"$limit": limit},
+        ]
+        return [{"tech_1": r["_id"]["a"], "tech_2": r["_id"]["b"], "strength": r["count"]}
+                for r in self.collection.aggregate(pipeline)]
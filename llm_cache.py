@@ -0,0 +1,254 @@
+# llm_cache.py
+"""
+Content-addressed cache for LLM analysis results.
+
+Entries are keyed by sha256(normalized text, prompt version, model name[, extra])
+so the same abstract showing up under another topic search is served without
+calling Gemini again. Two backends are available:
+
+- DiskCacheBackend: a local sqlite file (default, no extra services needed)
+- MongoCacheBackend: a collection in aetos_db, shared by API and workers
+
+Both support a TTL and size-bounded LRU eviction. LLMCache adds hit/miss
+counters and refuses results that are failures (see is_cacheable), so a bad
+reply is retried on the next run instead of being served for the whole TTL.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("aetos.llm_cache")
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "disk")  # disk | mongo | none
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.expanduser("~/.cache/aetos/llm_cache.sqlite3"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+
+# Keys that mark a result as a failure: analysis_error (the call raised) and
+# raw_analysis (the reply was not valid JSON)
+FAILURE_KEYS = ("analysis_error", "raw_analysis")
+
+
+def is_cacheable(value: Any) -> bool:
+    """Default cache predicate: a dict that is not a failure payload."""
+    return isinstance(value, dict) and not any(k in value for k in FAILURE_KEYS)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different copies share a key."""
+    return re.sub(r"\s+", " ", (text or "")).strip().lower()
+
+
+def cache_key(text: str, prompt_version: str, model: str, extra: str = "") -> str:
+    h = hashlib.sha256()
+    for part in (normalize_text(text), prompt_version, model, extra or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class DiskCacheBackend:
+    """sqlite-backed store. LRU order is tracked with an accessed_at column."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_entries
+        if self.max_entries and overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)", (overflow,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class MongoCacheBackend:
+    """
+    Mongo-backed store. Expiry is handled by a TTL index on created_at; LRU
+    eviction removes the least recently accessed entries once max_entries is exceeded.
+    """
+
+    def __init__(self, collection, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        from pymongo import ASCENDING
+        self.collection = collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if ttl:
+            collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=int(ttl))
+        collection.create_index([("accessed_at", ASCENDING)])
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        from datetime import datetime, timedelta
+        from pymongo import ReturnDocument
+        now = datetime.utcnow()
+        doc = self.collection.find_one_and_update(
+            {"_id": key}, {"$set": {"accessed_at": now}}, return_document=ReturnDocument.AFTER)
+        if doc is None:
+            return None
+        # The TTL monitor only runs once a minute; don't serve stale entries in between
+        if self.ttl and doc.get("created_at") and now - doc["created_at"] > timedelta(seconds=self.ttl):
+            return None
+        return doc.get("value")
+
+    def set(self, key: str, value: Dict[str, Any]):
+        from datetime import datetime
+        now = datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": key}, {"_id": key, "value": value, "created_at": now, "accessed_at": now}, upsert=True)
+        self._evict()
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        overflow = self.collection.estimated_document_count() - self.max_entries
+        if overflow > 0:
+            stale = [d["_id"] for d in self.collection.find({}, {"_id": 1}).sort("accessed_at", 1).limit(overflow)]
+            if stale:
+                self.collection.delete_many({"_id": {"$in": stale}})
+
+    def __len__(self):
+        return self.collection.estimated_document_count()
+
+
+class LLMCache:
+    """
+    Backend wrapper that counts hits/misses. Only values accepted by
+    `cacheable` (is_cacheable by default) are stored.
+    """
+
+    def __init__(self, backend, prompt_version: str, model: str,
+                 cacheable: Callable[[Any], bool] = is_cacheable):
+        self.backend = backend
+        self.cacheable = cacheable
+        self.prompt_version = prompt_version
+        self.model = model
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key(self, text: str, extra: str = "") -> str:
+        return cache_key(text, self.prompt_version, self.model, extra)
+
+    def get(self, text: str, extra: str = "") -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(self.key(text, extra))
+        except Exception as e:
+            logger.warning("LLM cache read failed: %s", e)
+            value = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return dict(value) if value is not None else None
+
+    def set(self, text: str, value: Dict[str, Any], extra: str = "",
+            cacheable: Optional[Callable[[Any], bool]] = None):
+        """Store value unless the predicate (per call, else the cache's) rejects it."""
+        if not isinstance(value, dict) or not (cacheable or self.cacheable)(value):
+            return
+        try:
+            self.backend.set(self.key(text, extra), value)
+        except Exception as e:
+            logger.warning("LLM cache write failed: %s", e)
+            with self._lock:
+                self.errors += 1
+
+    def get_or_compute(self, text: str, compute: Callable[[], Dict[str, Any]], extra: str = "",
+                       cacheable: Optional[Callable[[Any], bool]] = None) -> Dict[str, Any]:
+        cached = self.get(text, extra)
+        if cached is not None:
+            return cached
+        value = compute()
+        self.set(text, value, extra, cacheable=cacheable)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def get_default_cache(prompt_version: str, model: str, db=None) -> Optional[LLMCache]:
+    """
+    Build the cache configured by LLM_CACHE_BACKEND. `db` is an aetos_db handle
+    used by the mongo backend (a new client is opened from MONGO_URI if omitted).
+    Returns None when caching is disabled or the backend can't be opened.
+    """
+    backend_name = LLM_CACHE_BACKEND.lower()
+    try:
+        if backend_name == "none":
+            return None
+        if backend_name == "mongo":
+            if db is None:
+                from pymongo import MongoClient
+                db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/")).aetos_db
+            backend = MongoCacheBackend(db.llm_cache)
+        else:
+            backend = DiskCacheBackend()
+    except Exception as e:
+        logger.warning("LLM cache disabled, %s backend unavailable: %s", backend_name, e)
+        return None
+    return LLMCache(backend, prompt_version=prompt_version, model=model)
@@ -3,15 +3,27 @@
 Run a one-off pipeline locally (non-Celery) that fetches documents, runs
 analysis concurrently (limited threads) and saves results to DB. Useful
 for building initial historical DB.
+
+With incremental=True (the default) arXiv is only asked for papers newer than
+the topic's high-water mark, so refresh_watched_topics() on a schedule costs
+about one arXiv request per page of new papers.
 """
 
 import pandas as pd
 import concurrent.futures
 from tqdm import tqdm
-from ingest import fetch_arxiv_data
+import os
+from datetime import datetime
+from pymongo import ReplaceOne
+from arxiv_harvester import HighWaterMarks, harvest, harvest_new
 from ingest_patents import fetch_patent_data
-from database import save_to_db
+from database import save_to_db, get_db_connection
 from intelligence import get_gemini_analysis
+from keyword_pairs import topic_key
+from scurve import count_matrix, fit_s_curves
+
+# Comma-separated topics refreshed by refresh_watched_topics()
+WATCHED_TOPICS = [t.strip() for t in os.getenv("WATCHED_TOPICS", "").split(",") if t.strip()]
 
 def analyze_document(row_tuple):
     """Helper for ThreadPoolExecutor - expects (index, Series) tuple."""
@@ -26,15 +38,34 @@ def analyze_document(row_tuple):
         return merged
     except Exception as e:
         print(f"Error analyzing document: {e}")
-        return {**row.to_dict(), "TRL": 0}
+        return {**row.to_dict(), "TRL": 0, "analysis_error": str(e)}
 
-def run_pipeline(topic: str, num_documents: int = 20):  # Increased default
+def _handled_records(records, failed_ids):
+    """
+    The arXiv records the high-water mark may move over: all of them, or
+    only those published before the oldest one whose analysis failed, so
+    that one is fetched again next run.
+    """
+    failed = [r.get('published') or "" for r in records if r.get('id') in failed_ids]
+    if not failed:
+        return records
+    cutoff = min(failed)
+    return [r for r in records if (r.get('published') or "") < cutoff]
+
+def run_pipeline(topic: str, num_documents: int = 20, incremental: bool = True):  # Increased default
     print(f"--- Starting AETOS Batch Intelligence Run for topic: '{topic}' ---")
 
     max_per_source = max(1, num_documents // 2)
 
     print(f"Fetching up to {max_per_source} documents each from arXiv and Patents...")
-    arxiv_df = fetch_arxiv_data(topic, max_results=max_per_source)
+    marks = HighWaterMarks(get_db_connection().arxiv_watermarks) if incremental else None
+    if marks is not None:
+        # The mark only moves once this run has handled the papers
+        arxiv_records = list(harvest_new(topic, marks, max_records=max_per_source, commit=False))
+        print(f"{len(arxiv_records)} new arXiv papers since the last run.")
+    else:
+        arxiv_records = list(harvest(topic, max_records=max_per_source))
+    arxiv_df = pd.DataFrame(arxiv_records)
     patents_df = fetch_patent_data(topic, max_results=max_per_source)
 
     if arxiv_df is None:
@@ -43,6 +74,10 @@ def run_pipeline(topic: str, num_documents: int = 20):  # Increased default
         patents_df = pd.DataFrame()
 
     combined_df = pd.concat([arxiv_df, patents_df], ignore_index=True, sort=False)
+    if combined_df.empty:
+        # The usual case for an incremental run of a quiet topic; there are no columns to parse
+        print("No new documents found. Exiting.")
+        return
 
     # Parse published dates for sorting/filtering
     combined_df['published'] = pd.to_datetime(combined_df['published'], errors='coerce')
@@ -55,6 +90,8 @@ def run_pipeline(topic: str, num_documents: int = 20):  # Increased default
 
     if combined_df.empty:
         print("No high-quality documents found. Exiting.")
+        if marks is not None:
+            marks.advance_from(topic, arxiv_records)
         return
 
     # Concurrency: keep a small thread pool to avoid overwhelming the LLM or system
@@ -63,15 +100,63 @@ def run_pipeline(topic: str, num_documents: int = 20):  # Increased default
         results_iterator = executor.map(analyze_document, combined_df.iterrows())
         all_insights = list(tqdm(results_iterator, total=len(combined_df), desc="Analyzing Documents"))
 
+    # Skipped short abstracts are handled; failed analyses must be fetched again
+    failed_ids = {r.get('id') for r in all_insights if r.get('analysis_error')}
+    saved = True
     if all_insights:
         processed_df = pd.DataFrame(all_insights)
         processed_df = processed_df[processed_df.get('TRL', 0) != 0]
         if not processed_df.empty:
             print(f"Saving {len(processed_df)} successfully analyzed documents to the database.")
-            save_to_db(processed_df)
+            saved = save_to_db(processed_df, topic=topic) is not None
 
+    if marks is not None:
+        if saved:
+            marks.advance_from(topic, _handled_records(arxiv_records, failed_ids))
+        else:
+            print("Save failed; the arXiv high-water mark was not advanced.")
     print("--- AETOS Batch Run Finished ---")
 
+def refresh_watched_topics(topics=None, num_documents: int = 20):
+    """Incremental run for each watched topic (WATCHED_TOPICS by default); one failing topic doesn't stop the rest."""
+    for topic in (topics if topics is not None else WATCHED_TOPICS):
+        try:
+            run_pipeline(topic, num_documents=num_documents, incremental=True)
+        except Exception as e:
+            print(f"Refresh failed for topic '{topic}': {e}")
+
+def forecast_watched_topics(topics=None, horizon: int = 5):
+    """
+    Fit S-curves for every watched topic in one batch from the yearly
+    document counts in the topic rollups, and store them in
+    aetos_db.topic_forecasts (one document per topic). Returns {topic: fit}.
+    """
+    topics = [t for t in (topics if topics is not None else WATCHED_TOPICS)]
+    keys = {topic_key(t): t for t in topics}
+    if not keys:
+        return {}
+    db = get_db_connection()
+    # Monthly topic counts come precomputed from the rollups (see rollups.py)
+    yearly = {key: {} for key in keys}
+    for row in db.rollups.find({"dim": "topic", "key": {"$in": list(keys)}}, {"_id": 0, "key": 1, "bucket": 1, "count": 1}):
+        per_year = yearly[row["key"]]
+        year = int(row["bucket"][:4])
+        per_year[year] = per_year.get(year, 0) + row["count"]
+    yearly = {key: per_year for key, per_year in yearly.items() if per_year}
+    if not yearly:
+        return {}
+
+    names, years, counts = count_matrix(yearly)
+    fits = fit_s_curves(counts, years, horizon=horizon)
+    computed_at = datetime.utcnow()
+    results = {keys[key]: fits.summary(i) for i, key in enumerate(names)}
+    db.topic_forecasts.bulk_write([
+        ReplaceOne({"_id": key}, {**fits.summary(i), "topic": keys[key], "computed_at": computed_at}, upsert=True)
+        for i, key in enumerate(names)
+    ], ordered=False)
+    print(f"Forecast {int(fits.fitted.sum())} of {len(names)} topics with data.")
+    return results
+
 if __name__ == "__main__":
     topic_of_interest = "quantum cryptography"
     run_pipeline(topic=topic_of_interest, num_documents=5)
\ No newline at end of file
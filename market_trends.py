@@ -1,16 +1,33 @@
 # market_trends.py
+import os
+import time
 import logging
-from typing import List, Dict, Any
-from datetime import datetime
+import statistics
+import concurrent.futures
+from typing import List, Dict, Any, Iterator, Optional
+from datetime import datetime, timezone
+from collections import Counter, defaultdict
 from rich.console import Console
 from rich.table import Table
 import re
+from batching import stream_chunks
+from records import parse_published
+from scurve import fit_s_curves, year_range
 
 logger = logging.getLogger("aetos.market_trends")
 console = Console()
 
+# intelligence reads the first 8000 characters (~2000 tokens) of a text, so a chunk fits in one call
+MARKET_TRENDS_CHUNK_TOKENS = int(os.getenv("MARKET_TRENDS_CHUNK_TOKENS", "1900"))
+# Title plus the start of the abstract; keeps a 5,000-document topic to a few hundred chunks
+MARKET_TRENDS_DOC_CHARS = int(os.getenv("MARKET_TRENDS_DOC_CHARS", "600"))
+MARKET_TRENDS_WORKERS = int(os.getenv("MARKET_TRENDS_WORKERS", os.getenv("GEMINI_MAX_IN_FLIGHT", "4")))
+# Wall-clock budget for the whole map-reduce; chunks still pending get the local heuristic
+MARKET_TRENDS_DEADLINE = float(os.getenv("MARKET_TRENDS_DEADLINE", "90"))
+MARKET_TRENDS_MAP_REDUCE = os.getenv("MARKET_TRENDS_MAP_REDUCE", "1") != "0"
+
 try:
-    from intelligence import get_gemini_analysis
+    from intelligence import get_gemini_analysis, local_analyze
 except Exception:
     def get_gemini_analysis(text: str, *a, **k):
         return {
@@ -22,17 +39,176 @@ except Exception:
             "mock_trl_progression": {"history": [], "forecast": []},
             "funding_estimate_usd": None,
         }
+    local_analyze = get_gemini_analysis
+
+def _doc_text(doc: Dict[str, Any], max_chars: int) -> str:
+    t = doc.get("title") or ""
+    s = doc.get("summary") or doc.get("abstract") or doc.get("strategic_summary") or ""
+    return " ".join(f"{t}\n{s}".split())[:max_chars] if (t or s) else ""
+
+def iter_corpus_chunks(records: List[Dict[str, Any]], token_budget: int = MARKET_TRENDS_CHUNK_TOKENS,
+                       doc_chars: int = MARKET_TRENDS_DOC_CHARS) -> Iterator[str]:
+    """Every record's title and abstract, packed into chunks of at most token_budget tokens."""
+    return stream_chunks((_doc_text(d, doc_chars) for d in records), token_budget)
+
+def _analyze(text: str, topic: str) -> Dict[str, Any]:
+    # Some intelligence.get_gemini_analysis variants don't accept a topic
+    try:
+        return get_gemini_analysis(text, topic=topic)
+    except TypeError:
+        return get_gemini_analysis(text)
+
+def _map_chunks(chunks, topic: str, deadline: float, workers: int):
+    """
+    Analyze chunks in parallel as the iterable produces them. Returns
+    (texts, analyses, late): analyses align with texts and are None for
+    chunks that failed or were still pending at the deadline
+    (time.monotonic()); late counts the pending ones.
+    """
+    texts: List[str] = []
+    results: List[Optional[Dict[str, Any]]] = []
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {}
+    finished = 0
+    try:
+        for chunk in chunks:
+            futures[executor.submit(_analyze, chunk, topic)] = len(texts)
+            texts.append(chunk)
+            results.append(None)
+        for fut in concurrent.futures.as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+            finished += 1
+            try:
+                result = fut.result()
+            except Exception as e:
+                logger.warning("chunk analysis failed: %s", e)
+                continue
+            if isinstance(result, dict):
+                results[futures[fut]] = result
+    except concurrent.futures.TimeoutError:
+        pass
+    finally:
+        # Don't wait for calls still in flight past the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+    late = len(texts) - finished
+    if late:
+        logger.warning("%d of %d chunks missed the deadline and are left out of the summary", late, len(texts))
+    return texts, results, late
+
+def _summary_of(analysis: Dict[str, Any]) -> str:
+    return str(analysis.get("ai_summary") or analysis.get("summary") or "")
+
+def _reduce_summaries(partials: List[Dict[str, Any]], topic: str, deadline: float, workers: int,
+                      token_budget: int) -> Dict[str, Any]:
+    """
+    Fold partial summaries into one analysis: pack them into chunks and
+    summarize those again until they fit one call, then analyze that.
+    """
+    summaries = [_summary_of(p) for p in partials]
+    chunks = list(stream_chunks(summaries, token_budget))
+    while len(chunks) > 1 and time.monotonic() < deadline:
+        _, analyses, _ = _map_chunks(chunks, topic, deadline, workers)
+        shorter = list(stream_chunks([_summary_of(a) for a in analyses if a], token_budget))
+        if len(shorter) >= len(chunks):
+            break  # summaries are not getting shorter; go with what we have
+        chunks = shorter
+    text = chunks[0] if chunks else ""
+    return _analyze(text, topic) if time.monotonic() < deadline else local_analyze(text, topic)
+
+def _ranked(values, limit: int) -> List[str]:
+    """Distinct strings by how many partial analyses mention them (case-insensitively), then first seen."""
+    counts, first = Counter(), {}
+    for value in values:
+        if not isinstance(value, str) or not value.strip():
+            continue
+        key = value.strip().casefold()
+        counts[key] += 1
+        first.setdefault(key, value.strip())
+    return [first[k] for k, _ in counts.most_common(limit)]
+
+def _as_list(value) -> list:
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
+def _merge_analyses(final: Dict[str, Any], partials: List[Dict[str, Any]], weights: List[int]) -> Dict[str, Any]:
+    """
+    One topic-level analysis from the per-chunk ones: the reduce step's
+    summary, insights it raised first, players and convergence pairs ranked
+    across chunks and a size-weighted trend score. Every call estimates
+    funding for the topic as a whole, so the reduce step's estimate is used
+    (the median of the chunks' when it has none) rather than a sum.
+    """
+    insights = _as_list(final.get("insights")) + [i for p in partials for i in _as_list(p.get("insights"))]
+    players = [k for p in partials for k in _as_list(p.get("key_players"))]
+
+    strengths = Counter()
+    for p in partials:
+        for pair in _as_list(p.get("convergence")):
+            if not isinstance(pair, dict) or not pair.get("tech_1") or not pair.get("tech_2"):
+                continue
+            a, b = sorted((str(pair["tech_1"]).strip(), str(pair["tech_2"]).strip()))
+            strength = pair.get("strength")
+            strengths[(a, b)] += strength if isinstance(strength, (int, float)) else 1
+    convergence = [{"tech_1": a, "tech_2": b, "strength": round(s, 3)} for (a, b), s in strengths.most_common(10)]
+
+    scored = [(p.get("trend_score"), w) for p, w in zip(partials, weights)
+              if isinstance(p.get("trend_score"), (int, float))]
+    total_weight = sum(w for _, w in scored)
+    trend_score = round(sum(s * w for s, w in scored) / total_weight, 2) if total_weight else final.get("trend_score")
+    funding = final.get("funding_estimate_usd")
+    if not isinstance(funding, (int, float)):
+        estimates = [p.get("funding_estimate_usd") for p in partials
+                     if isinstance(p.get("funding_estimate_usd"), (int, float))]
+        funding = statistics.median(estimates) if estimates else None
 
-def _aggregate_docs_text(docs: List[Dict[str, Any]], max_chars: int = 25000) -> str:
-    parts = []
-    for d in docs:
-        t = d.get("title") or ""
-        s = d.get("summary") or d.get("abstract") or d.get("strategic_summary") or ""
-        parts.append(f"{t}\n{s}")
-        if sum(len(p) for p in parts) > max_chars:
-            break
-    text = "\n\n".join(parts)
-    return text[:max_chars]
+    progression = next((a["mock_trl_progression"] for a in [final] + partials
+                        if (a.get("mock_trl_progression") or {}).get("history")), None)
+    return {
+        "ai_summary": _summary_of(final),
+        "insights": _ranked(insights, 5),
+        "key_players": _ranked(players, 10),
+        "convergence": convergence,
+        "trend_score": trend_score,
+        "funding_estimate_usd": funding,
+        "mock_trl_progression": progression or {"history": [], "forecast": []},
+    }
+
+def summarize_corpus(records: List[Dict[str, Any]], topic: str = "", map_reduce: bool = MARKET_TRENDS_MAP_REDUCE,
+                     deadline_s: float = MARKET_TRENDS_DEADLINE, workers: int = MARKET_TRENDS_WORKERS,
+                     token_budget: int = MARKET_TRENDS_CHUNK_TOKENS) -> Dict[str, Any]:
+    """
+    Analyze a topic's records. The corpus is streamed into token-budgeted
+    chunks; one chunk is a single call. With map_reduce, every chunk is
+    analyzed in parallel and the partial summaries are reduced into one,
+    all within deadline_s seconds; chunks not analyzed by then are left out
+    and counted as late. Without map_reduce only the first chunk is read.
+    The result has the analysis keys plus "coverage" (documents, chunks, late).
+    """
+    deadline = time.monotonic() + deadline_s
+    chunks = iter_corpus_chunks(records, token_budget)
+    first = next(chunks, "")
+    second = next(chunks, None) if map_reduce else None
+    if second is None:
+        gem = dict(_analyze(first, topic))
+        gem["coverage"] = {"documents": len(records), "chunks": 1, "late": 0}
+        return gem
+
+    def all_chunks():
+        yield first
+        yield second
+        yield from chunks
+
+    texts, analyses, late = _map_chunks(all_chunks(), topic, deadline, workers)
+    done = [(a, len(t)) for a, t in zip(analyses, texts) if a]
+    if not done:
+        gem = dict(local_analyze(first, topic))
+        gem["coverage"] = {"documents": len(records), "chunks": len(texts), "late": late}
+        return gem
+    partials, weights = [a for a, _ in done], [w for _, w in done]
+    final = _reduce_summaries(partials, topic, deadline, workers, token_budget)
+    gem = _merge_analyses(final, partials, weights)
+    gem["coverage"] = {"documents": len(records), "chunks": len(texts), "late": late}
+    return gem
 
 def _derive_trendiness_from_docs(records: List[Dict[str, Any]]) -> float:
     if not records:
@@ -56,16 +232,63 @@ def _derive_trendiness_from_docs(records: List[Dict[str, Any]]) -> float:
     score = min(1.0, max(0.0, (recent_count / max(1, total)) * 0.9 + (avg_title_len / 100.0) * 0.1))
     return round(score, 2)
 
+def _record_year(record: Dict[str, Any]):
+    pub = record.get("published") or record.get("published_date")
+    if isinstance(pub, dict):
+        pub = pub.get("$date")
+    if isinstance(pub, (int, float)) and not isinstance(pub, bool):
+        return datetime.fromtimestamp(pub / 1000, tz=timezone.utc).year  # extended JSON millis
+    dt = parse_published(pub)
+    return dt.year if dt else None
+
+def _trl_progression(records: List[Dict[str, Any]], horizon: int = 3):
+    """
+    Average TRL per publication year, plus a forecast tied to the topic's
+    fitted S-curve of publication counts: a year that covers a share of the
+    remaining growth to saturation closes the same share of the gap between
+    the latest average TRL and 9. Returns (progression, s_curve summary).
+    """
+    counts, trl_sum, trl_n = defaultdict(int), defaultdict(float), defaultdict(int)
+    for r in records:
+        year = _record_year(r)
+        if year is None:
+            continue
+        counts[year] += 1
+        try:
+            trl = float(r.get("TRL"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= trl <= 9:
+            trl_sum[year] += trl
+            trl_n[year] += 1
+    history = [{"year": y, "avg_trl": round(trl_sum[y] / trl_n[y], 2)} for y in sorted(trl_n)]
+    if not counts:
+        return {"history": history, "forecast": []}, None
+
+    years = year_range(counts)
+    fits = fit_s_curves([[counts.get(int(y), 0) for y in years]], years, horizon=horizon)
+    s_curve = fits.summary(0)
+    if not history or not fits.fitted[0]:
+        return {"history": history, "forecast": []}, s_curve
+
+    observed, saturation = fits.cumulative[0, -1], fits.saturation[0]
+    last_trl = history[-1]["avg_trl"]
+
+    def trl_at(cumulative):
+        share = (cumulative - observed) / (saturation - observed) if saturation > observed else 1.0
+        return round(float(min(9.0, last_trl + (9.0 - last_trl) * min(max(share, 0.0), 1.0))), 2)
+
+    forecast = [
+        {"year": int(y), "avg_trl": trl_at(f), "lower": trl_at(lo), "upper": trl_at(hi)}
+        for y, f, lo, hi in zip(fits.forecast_years, fits.forecast[0], fits.lower[0], fits.upper[0])
+    ]
+    return {"history": history, "forecast": forecast}, s_curve
+
 def log_market_trends(topic: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
     now = datetime.utcnow().isoformat()
     console.print(f"[{now}] ▸ Market trend analysis for: {topic} ({len(records)} records)")
-    text_blob = _aggregate_docs_text(records)
     try:
-        # Try best-effort call: some intelligence.get_gemini_analysis variants accept topic arg
-        try:
-            gem = get_gemini_analysis(text_blob, topic=topic)
-        except TypeError:
-            gem = get_gemini_analysis(text_blob)
+        gem = summarize_corpus(records, topic=topic)
     except Exception as e:
         logger.exception("gemini analysis failed: %s", e)
         gem = {}
@@ -74,7 +297,10 @@ def log_market_trends(topic: str, records: List[Dict[str, Any]]) -> Dict[str, An
     insights = gem.get("insights") or []
     key_players = gem.get("key_players") or []
     convergence = gem.get("convergence") or []
-    mock_trl = gem.get("mock_trl_progression") or gem.get("mock_trl") or {"history": [], "forecast": []}
+    # Measured from the records when they carry TRLs and dates; the model's guess otherwise
+    mock_trl, s_curve = _trl_progression(records)
+    if not mock_trl["history"]:
+        mock_trl = gem.get("mock_trl_progression") or gem.get("mock_trl") or {"history": [], "forecast": []}
     funding_estimate = gem.get("funding_estimate_usd") if isinstance(gem.get("funding_estimate_usd", None), (int, float)) else None
     trend_score = gem.get("trend_score") or gem.get("trendiness") or _derive_trendiness_from_docs(records)
 
@@ -91,6 +317,9 @@ def log_market_trends(topic: str, records: List[Dict[str, Any]]) -> Dict[str, An
     table.add_column("Value", style="magenta")
     table.add_row("Trend Score", f"{trend_score:.2f}")
     table.add_row("Documents Analyzed", str(len(records)))
+    coverage = gem.get("coverage") or {}
+    if coverage.get("chunks", 1) > 1:
+        table.add_row("Chunks (late)", f"{coverage['chunks']} ({coverage.get('late', 0)})")
     table.add_row("AI Summary (excerpt)", (ai_summary or "")[:200])
     sample_insight = insights[0] if insights else ""
     table.add_row("Sample Insight", sample_insight)
@@ -103,6 +332,8 @@ def log_market_trends(topic: str, records: List[Dict[str, Any]]) -> Dict[str, An
         "key_players": key_players,
         "convergence": convergence,
         "mock_trl_progression": mock_trl,
+        "s_curve": s_curve,
         "funding_estimate_usd": funding_estimate,
+        "coverage": gem.get("coverage"),
         "sample": records[:5]
     }
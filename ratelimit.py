@@ -0,0 +1,79 @@
+# ratelimit.py
+"""
+Thread-safe token bucket used to keep upstream calls (Gemini) under a
+requests-per-minute quota while several worker threads share it.
+"""
+import time
+import asyncio
+import threading
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate_per_minute` tokens are added per minute, up to
+    `capacity` (the allowed burst). A rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate_per_minute / 6.0))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def _take_or_wait(self, deadline: Optional[float]) -> Optional[float]:
+        """Take a token (returns 0.0), or return how long to sleep; None once deadline has passed."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            wait = (1.0 - self._tokens) / self.rate
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            wait = min(wait, remaining)
+        return wait
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a token is available. Returns False if `timeout` seconds pass first."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take_or_wait(deadline)
+            if wait is None:
+                return False
+            if wait == 0.0:
+                return True
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """acquire() for coroutines: sleeps on the event loop instead of blocking a thread."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take_or_wait(deadline)
+            if wait is None:
+                return False
+            if wait == 0.0:
+                return True
+            await asyncio.sleep(wait)
@@ -0,0 +1,218 @@
+# records.py
+"""
+Compact document record for the request hot path.
+
+DocumentRecord keeps the fields every fetched document carries in __slots__
+(no per-instance __dict__) and anything source-specific (arXiv id,
+categories, raw_analysis, analysis_error, ...) in a small `extra` dict. It
+supports the dict-style access the pipeline helpers already use (get, [],
+in, update), so fetch -> filter -> analyze -> score -> save runs on plain
+records instead of round-tripping through DataFrames. Pandas is only needed
+for batch analytics.
+
+Run this module directly to compare per-document overhead and peak memory
+against the DataFrame path:
+
+    python records.py --docs 1000
+"""
+import re
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+_YEAR_RE = re.compile(r"\d{4}")
+
+
+def parse_published(value: Any) -> Optional[datetime]:
+    """
+    ISO timestamps (arXiv) and bare years (Scholar) to datetime; anything else
+    to None, like pd.to_datetime(errors='coerce').
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+    if _YEAR_RE.fullmatch(value):
+        return datetime(int(value), 1, 1)
+    return None
+
+
+def _clean(value: Any) -> Any:
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+class DocumentRecord:
+    FIELDS = ("title", "summary", "published", "authors", "source", "url", "funding_details",
+              "TRL", "TRL_justification", "technologies", "progress", "strategic_rating",
+              "strategic_summary", "analyzed_at")
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, title: str = "", summary: str = "", published: Optional[datetime] = None,
+                 authors: Optional[List[str]] = None, source: Optional[str] = None, url: str = "",
+                 funding_details: Optional[str] = None, TRL: Optional[int] = None,
+                 TRL_justification: Optional[str] = None, technologies: Optional[List[str]] = None,
+                 progress: Optional[str] = None, strategic_rating: Optional[float] = None,
+                 strategic_summary: Optional[str] = None, analyzed_at: Optional[datetime] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.title = title
+        self.summary = summary
+        self.published = published
+        self.authors = authors
+        self.source = source
+        self.url = url
+        self.funding_details = funding_details
+        self.TRL = TRL
+        self.TRL_justification = TRL_justification
+        self.technologies = technologies
+        self.progress = progress
+        self.strategic_rating = strategic_rating
+        self.strategic_summary = strategic_summary
+        self.analyzed_at = analyzed_at
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, doc: Dict[str, Any]) -> "DocumentRecord":
+        rec = cls()
+        rec.update(doc)
+        rec.published = parse_published(rec.published)
+        return rec
+
+    # dict-style access, so helpers written against document dicts keep working
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.__slots__ and key != "extra":
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.__slots__ and key != "extra":
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        value = _clean(value)
+        if key in self.__slots__ and key != "extra":
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.__slots__ and key != "extra":
+            return getattr(self, key) is not None
+        return bool(self.extra) and key in self.extra
+
+    def update(self, other: Dict[str, Any]):
+        for key, value in other.items():
+            self[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """All core fields (None when unset) plus extras; the API response shape."""
+        out = {field: getattr(self, field) for field in self.FIELDS}
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def to_storage(self) -> Dict[str, Any]:
+        """
+        Fields to $set in aetos_db.documents. published is stored as an ISO
+        string, as before; unset fields are left out so an upsert never
+        overwrites stored values (e.g. analyzed_at) with None.
+        """
+        out = {k: v for k, v in self.to_dict().items() if v is not None}
+        if isinstance(self.published, datetime):
+            out["published"] = self.published.isoformat()
+        return out
+
+
+def to_records(docs: Iterable[Dict[str, Any]], min_summary_length: int = 0) -> List[DocumentRecord]:
+    """Build records from fetched documents, dropping those with a summary shorter than min_summary_length."""
+    records = []
+    for doc in docs:
+        summary = doc.get("summary")
+        if not isinstance(summary, str) or len(summary) < min_summary_length:
+            continue
+        records.append(DocumentRecord.from_dict(doc))
+    return records
+
+
+def _benchmark(num_docs: int):
+    import time
+    import random
+    import tracemalloc
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    rng = random.Random(0)
+    words = "quantum drone radar lidar graphene battery swarm sensor fusion photonics".split()
+    fetched = [{
+        "id": f"2401.{i:05d}v1",
+        "title": " ".join(rng.choices(words, k=8)),
+        "summary": " ".join(rng.choices(words, k=rng.choice((5, 150)))),
+        "published": f"2024-01-{1 + i % 28:02d}T00:00:00Z" if i % 3 else str(2015 + i % 10),
+        "authors": [f"Author {j}" for j in range(4)],
+        "source": "arXiv" if i % 3 else "Google Scholar (SerpAPI)",
+        "url": f"https://arxiv.org/abs/2401.{i:05d}",
+        "funding_details": "0",
+    } for i in range(num_docs)]
+    analysis = {"TRL": 4, "TRL_justification": "prototype", "technologies": words[:3],
+                "strategic_rating": 7.5, "strategic_summary": "relevant"}
+
+    def legacy():
+        df = pd.DataFrame(fetched)
+        df["published"] = pd.to_datetime(df["published"], errors="coerce", utc=True)
+        df = df[df["summary"].str.len() >= 80]
+        docs = []
+        for _, row in df.iterrows():
+            doc = {k: (v if isinstance(v, list) or not pd.isna(v) else None) for k, v in row.to_dict().items()}
+            doc.update(analysis)
+            docs.append(doc)
+        records = pd.DataFrame(docs).to_dict("records")
+        for rec in records:
+            for k, v in list(rec.items()):
+                if isinstance(v, pd.Timestamp):
+                    rec[k] = v.isoformat()
+                elif not isinstance(v, (list, dict)) and pd.isna(v):
+                    rec[k] = None
+        return records
+
+    def slotted():
+        records = to_records(fetched, min_summary_length=80)
+        for rec in records:
+            rec.update(analysis)
+        return [rec.to_storage() for rec in records]
+
+    print(f"{'path':<22}{'us/doc':>10}{'peak KiB':>12}")
+    paths = [("DocumentRecord", slotted)]
+    if pd is not None:
+        paths.insert(0, ("DataFrame", legacy))
+    else:
+        print("pandas not installed; skipping the DataFrame path")
+    for label, fn in paths:
+        fn()  # warm up imports and caches
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<22}{elapsed * 1e6 / num_docs:>10.1f}{peak / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the record-based hot path against DataFrames")
+    parser.add_argument("--docs", type=int, default=1000)
+    args = parser.parse_args()
+    _benchmark(args.docs)
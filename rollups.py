@@ -0,0 +1,271 @@
+# rollups.py
+"""
+Materialized monthly rollups in aetos_db.rollups.
+
+One document per (dim, key, bucket):
+- dim "topic": key is an analysis topic, or "*" for all topics
+- dim "technology": key is a normalized technology/keyword
+- bucket is the publication month ("YYYY-MM")
+
+Each holds the document count, average TRL, source mix and funding sum,
+computed by a Mongo $group pipeline over aetos_db.documents. The pipeline
+reads the topics, keywords and month that keyword_pairs records on each
+document (pair_state).
+
+Saves refresh only the cells their documents touch, before and after the
+save. Charts read a handful of precomputed rows, however large the corpus
+grows. rebuild() recomputes everything.
+
+Documents saved before pair_state existed are invisible to the rollups
+until backfilled; run this module once after upgrading:
+
+    python rollups.py            # backfill pair_state, then rebuild
+    python rollups.py --rebuild-only
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DeleteMany, ReplaceOne, UpdateOne
+
+from intelligence import extract_numeric_funding
+from keyword_pairs import UNDATED, KeywordPairStore, month_bucket, topic_key
+
+logger = logging.getLogger("aetos.rollups")
+
+DIMENSIONS = {"topic": "pair_state.topics", "technology": "pair_state.keywords"}
+
+Cell = Tuple[str, str, str]  # (dim, key, bucket)
+
+# TRL only counts when it is a number from 1 to 9 (strings and NaN sort outside that range)
+_VALID_TRL = {"$and": [{"$gte": ["$TRL", 1]}, {"$lte": ["$TRL", 9]}]}
+
+
+def annotate(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the numeric fields the rollup pipeline sums (funding_usd) to a record about to be saved."""
+    funding = record.get("funding_details")
+    if funding is not None and not isinstance(funding, float):
+        record["funding_usd"] = extract_numeric_funding(str(funding))
+    return record
+
+
+def cells_of(state: Optional[Dict[str, Any]]) -> Set[Cell]:
+    """The rollup cells a document with this pair_state counts towards."""
+    if not state or (state.get("bucket") or UNDATED) == UNDATED:
+        return set()
+    bucket = state["bucket"]
+    return ({("topic", t, bucket) for t in state.get("topics") or []}
+            | {("technology", k, bucket) for k in state.get("keywords") or []})
+
+
+def _pipeline(dim: str, match: Dict[str, Any], keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    field = DIMENSIONS[dim]
+    stages = [
+        {"$match": match},
+        {"$project": {"key": f"${field}", "bucket": "$pair_state.bucket", "source": 1,
+                      "trl": {"$cond": [_VALID_TRL, "$TRL", None]}, "funding_usd": 1}},
+        {"$unwind": "$key"},
+    ]
+    if keys is not None:
+        stages.append({"$match": {"key": {"$in": keys}}})
+    stages += [
+        {"$group": {
+            "_id": {"key": "$key", "bucket": "$bucket", "source": {"$ifNull": ["$source", "unknown"]}},
+            "count": {"$sum": 1},
+            "trl_sum": {"$sum": {"$ifNull": ["$trl", 0]}},
+            "trl_n": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$trl", None]}, None]}, 0, 1]}},
+            "funding_sum": {"$sum": {"$ifNull": ["$funding_usd", 0]}},
+        }},
+        {"$group": {
+            "_id": {"key": "$_id.key", "bucket": "$_id.bucket"},
+            "count": {"$sum": "$count"},
+            "trl_sum": {"$sum": "$trl_sum"},
+            "trl_n": {"$sum": "$trl_n"},
+            "funding_sum": {"$sum": "$funding_sum"},
+            "sources": {"$push": {"source": "$_id.source", "count": "$count"}},
+        }},
+    ]
+    return stages
+
+
+def _now() -> datetime:
+    # Mongo keeps milliseconds; truncating keeps "written in this pass" comparisons exact
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _row(dim: str, group: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    return {
+        "dim": dim,
+        "key": group["_id"]["key"],
+        "bucket": group["_id"]["bucket"],
+        "count": group["count"],
+        "avg_trl": round(group["trl_sum"] / group["trl_n"], 2) if group["trl_n"] else None,
+        "trl_count": group["trl_n"],
+        "trl_sum": group["trl_sum"],
+        "sources": {s["source"]: s["count"] for s in group["sources"]},
+        "funding_sum": group["funding_sum"],
+        "updated_at": now,
+    }
+
+
+class RollupStore:
+    def __init__(self, documents, rollups):
+        self.documents = documents
+        self.rollups = rollups
+
+    def ensure_indexes(self):
+        self.rollups.create_index([("dim", ASCENDING), ("key", ASCENDING), ("bucket", ASCENDING)],
+                                  unique=True, name="cell_unique")
+
+    def refresh(self, cells: Iterable[Cell]) -> Dict[str, int]:
+        """Recompute the given cells from the documents; cells with no documents left are removed."""
+        wanted: Dict[str, Dict[str, Set[str]]] = {}
+        for dim, key, bucket in cells:
+            wanted.setdefault(dim, {}).setdefault(key, set()).add(bucket)
+        stats = {"updated": 0, "removed": 0}
+        now = _now()
+        for dim, by_key in wanted.items():
+            keys = sorted(by_key)
+            buckets = sorted(set().union(*by_key.values()))
+            match = {DIMENSIONS[dim]: {"$in": keys}, "pair_state.bucket": {"$in": buckets}}
+            ops, found = [], set()
+            for group in self.documents.aggregate(_pipeline(dim, match, keys)):
+                row = _row(dim, group, now)
+                if row["bucket"] not in by_key.get(row["key"], ()):
+                    continue  # key x bucket cross product; leave cells nobody asked for alone
+                found.add((row["key"], row["bucket"]))
+                ops.append(ReplaceOne({"dim": dim, "key": row["key"], "bucket": row["bucket"]}, row, upsert=True))
+            for key, key_buckets in by_key.items():
+                empty = sorted(b for b in key_buckets if (key, b) not in found)
+                if empty:
+                    ops.append(DeleteMany({"dim": dim, "key": key, "bucket": {"$in": empty}}))
+                    stats["removed"] += len(empty)
+            stats["updated"] += len(found)
+            if ops:
+                self.rollups.bulk_write(ops, ordered=False)
+        return stats
+
+    def refresh_for(self, touched: Iterable[Optional[Tuple[Optional[Dict], Optional[Dict]]]]) -> Dict[str, int]:
+        """Refresh the cells of (previous pair_state, new pair_state) pairs from a save; None entries are skipped."""
+        cells: Set[Cell] = set()
+        for change in touched:
+            if change is None:
+                continue
+            old, new = change
+            cells |= cells_of(old) | cells_of(new)
+        return self.refresh(cells) if cells else {"updated": 0, "removed": 0}
+
+    def rebuild(self) -> Dict[str, int]:
+        """Recompute every cell from scratch."""
+        now = _now()
+        stats = {"updated": 0, "removed": 0}
+        for dim, field in DIMENSIONS.items():
+            ops = []
+            match = {field: {"$exists": True}, "pair_state.bucket": {"$gt": UNDATED}}
+            for group in self.documents.aggregate(_pipeline(dim, match), allowDiskUse=True):
+                row = _row(dim, group, now)
+                ops.append(ReplaceOne({"dim": dim, "key": row["key"], "bucket": row["bucket"]}, row, upsert=True))
+            # Anything not rewritten in this pass has no documents left
+            ops.append(DeleteMany({"dim": dim, "updated_at": {"$lt": now}}))
+            result = self.rollups.bulk_write(ops, ordered=False)
+            stats["updated"] += len(ops) - 1
+            stats["removed"] += result.deleted_count
+        return stats
+
+    def series(self, dim: str, key: Optional[str], start: Any = None, end: Any = None,
+               granularity: str = "month") -> List[Dict[str, Any]]:
+        """
+        Time series for one topic or technology (all topics when dim is topic
+        and key is empty) over publication months start..end inclusive,
+        per month or per year, with a running cumulative count.
+        """
+        if dim not in DIMENSIONS:
+            raise ValueError(f"dim must be one of {sorted(DIMENSIONS)}")
+        if granularity not in ("month", "year"):
+            raise ValueError("granularity must be 'month' or 'year'")
+        key = (topic_key(key) or "*") if dim == "topic" else " ".join((key or "").casefold().split())
+        buckets: Dict[str, Any] = {"$gt": UNDATED}
+        if start is not None:
+            buckets = {"$gte": month_bucket(start)}
+        if end is not None:
+            buckets["$lte"] = month_bucket(end)
+        rows = self.rollups.find({"dim": dim, "key": key, "bucket": buckets},
+                                 {"_id": 0, "bucket": 1, "count": 1, "avg_trl": 1, "trl_count": 1,
+                                  "trl_sum": 1, "sources": 1, "funding_sum": 1}).sort([("bucket", ASCENDING)])
+
+        series: List[Dict[str, Any]] = []
+        for row in rows:
+            period = row["bucket"][:4] if granularity == "year" else row["bucket"]
+            if not series or series[-1]["period"] != period:
+                series.append({"period": period, "count": 0, "trl_sum": 0.0, "trl_count": 0,
+                               "sources": {}, "funding_sum": 0})
+            point = series[-1]
+            point["count"] += row["count"]
+            point["trl_count"] += row.get("trl_count") or 0
+            if row.get("trl_sum") is not None:
+                point["trl_sum"] += row["trl_sum"]
+            else:  # cell written before trl_sum was stored; exact again after the next refresh
+                point["trl_sum"] += (row.get("avg_trl") or 0) * (row.get("trl_count") or 0)
+            point["funding_sum"] += row.get("funding_sum") or 0
+            for source, n in (row.get("sources") or {}).items():
+                point["sources"][source] = point["sources"].get(source, 0) + n
+
+        cumulative = 0
+        for point in series:
+            cumulative += point["count"]
+            trl_sum = point.pop("trl_sum")
+            point["avg_trl"] = round(trl_sum / point["trl_count"], 2) if point["trl_count"] else None
+            point["cumulative_count"] = cumulative
+        return series
+
+
+def backfill(documents, keyword_pairs, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Stage pair_state (and funding_usd) on stored documents that have none,
+    i.e. were saved before keyword_pairs existed, and count their keyword
+    pairs. Their topic was never recorded, so they count under all topics
+    only. Documents that already have pair_state are left alone, so this
+    can be re-run. Follow it with RollupStore.rebuild().
+    """
+    pairs = KeywordPairStore(keyword_pairs)
+    key_fn = lambda r: {"_id": r["_id"]}
+    projection = {"_id": 1, "technologies": 1, "keywords": 1, "published": 1, "funding_details": 1}
+    stats = {"documents": 0, "pairs_incremented": 0}
+
+    def flush(batch):
+        for record in batch:
+            annotate(record)
+        deltas = pairs.stage(documents, batch, key_fn)
+        ops = [UpdateOne(key_fn(r), {"$set": {k: r[k] for k in ("pair_state", "funding_usd") if k in r}})
+               for r in batch]
+        documents.bulk_write(ops, ordered=False)
+        stats["documents"] += len(batch)
+        stats["pairs_incremented"] += pairs.apply(deltas)["incremented"]
+        logger.info("backfilled %d documents", stats["documents"])
+
+    batch = []
+    # _id order; the $set doesn't move documents within it
+    for record in documents.find({"pair_state": {"$exists": False}}, projection).sort([("_id", ASCENDING)]):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Backfill pair_state on older documents and rebuild the rollups")
+    parser.add_argument("--rebuild-only", action="store_true", help="skip the backfill and only recompute every cell")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = get_db_connection()
+    if not args.rebuild_only:
+        print("backfill:", backfill(db.documents, db.keyword_pairs, batch_size=args.batch_size))
+    print("rebuild:", RollupStore(db.documents, db.rollups).rebuild())
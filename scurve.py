@@ -0,0 +1,304 @@
+# scurve.py
+"""
+Batched S-curve fitting and forecasting.
+
+fit_s_curves() takes yearly document counts for many topics at once, a 2-D
+array of shape (topics, years), and fits a logistic or Gompertz curve to
+each topic's cumulative counts:
+
+    logistic   K / (1 + exp(-r (t - t0)))      inflection at K / 2
+    gompertz   K * exp(-exp(-r (t - t0)))      inflection at K / e
+
+All topics are fitted together by Levenberg-Marquardt least squares. Each
+iteration builds every Jacobian as one (topics, years, 3) array and solves
+all the 3x3 normal equations with one np.linalg.solve call. Each topic is
+also started from a few saturation guesses in the same batch, and the best
+fit is kept.
+
+Saturation (K), inflection year (t0) and an N-year forecast come with
+approximate confidence bands from the fit covariance (delta method).
+Cumulative counts are autocorrelated, so treat the bands as indicative.
+Only numpy is required.
+"""
+import os
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SCURVE_MAX_ITER = int(os.getenv("SCURVE_MAX_ITER", "200"))
+# Topics with fewer years of non-zero counts are left unfitted
+SCURVE_MIN_YEARS = int(os.getenv("SCURVE_MIN_YEARS", "4"))
+
+MODELS = ("logistic", "gompertz")
+# Starting saturation as a multiple of the documents seen so far
+_SATURATION_STARTS = (1.1, 2.0, 5.0)
+_MAX_EXPONENT = 50.0
+
+
+def _z_score(confidence: float) -> float:
+    """Two-sided normal quantile, by bisection on erf (no scipy needed)."""
+    lo, hi = 0.0, 10.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def _curve(model: str, theta: np.ndarray, x: np.ndarray):
+    """
+    Values and Jacobian for parameters theta = (log K, log r, t0), shape
+    (n, 3), at times x, shape (n, m) or (m,). Returns f (n, m), J (n, m, 3).
+    """
+    K = np.exp(theta[:, 0])[:, None]
+    r = np.exp(theta[:, 1])[:, None]
+    shifted = x - theta[:, 2][:, None]
+    e = np.exp(np.clip(-r * shifted, -_MAX_EXPONENT, _MAX_EXPONENT))
+    if model == "logistic":
+        s = 1.0 / (1.0 + e)
+        f = K * s
+        slope = K * s * (1.0 - s)  # d f / d(r (t - t0))
+    else:
+        g = np.exp(-e)
+        f = K * g
+        slope = K * g * e
+    J = np.stack([f, slope * shifted * r, -slope * r], axis=-1)
+    return f, J
+
+
+def _levenberg_marquardt(model: str, y: np.ndarray, x: np.ndarray, theta: np.ndarray,
+                         bounds: np.ndarray, max_iter: int):
+    n = len(y)
+    lam = np.full(n, 1e-2)
+    f, J = _curve(model, theta, x)
+    ssr = ((y - f) ** 2).sum(axis=1)
+    active = np.ones(n, dtype=bool)
+    eye = np.eye(3)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        Ja, ra = J[idx], (y - f)[idx]
+        A = np.einsum("nmi,nmj->nij", Ja, Ja)
+        g = np.einsum("nmi,nm->ni", Ja, ra)
+        damped = A + lam[idx, None, None] * (A * eye + 1e-9 * eye)
+        step = np.linalg.solve(damped, g[..., None])[..., 0]
+        trial = np.clip(theta[idx] + step, bounds[0], bounds[1])
+        f_trial, J_trial = _curve(model, trial, x)
+        ssr_trial = ((y[idx] - f_trial) ** 2).sum(axis=1)
+
+        better = ssr_trial < ssr[idx]
+        accepted = idx[better]
+        improvement = ssr[accepted] - ssr_trial[better]
+        theta[accepted], f[accepted], J[accepted] = trial[better], f_trial[better], J_trial[better]
+        ssr[accepted] = ssr_trial[better]
+        lam[accepted] /= 3.0
+        lam[idx[~better]] *= 4.0
+        # Converged: accepted step with negligible gain, or damping blew up
+        done = np.zeros(n, dtype=bool)
+        done[accepted] = improvement <= 1e-12 * (1.0 + ssr[accepted])
+        done |= lam > 1e10
+        active &= ~done
+    return theta, f, J, ssr
+
+
+class SCurveFits:
+    """
+    Fitted curves for a batch of topics; arrays are indexed like the input
+    rows. Entries for topics that could not be fitted (too few non-zero
+    years) are NaN and `fitted` is False.
+    """
+
+    def __init__(self, years: np.ndarray, counts: np.ndarray, horizon: int):
+        n = len(counts)
+        self.years = years
+        self.counts = counts
+        self.cumulative = counts.cumsum(axis=1)
+        self.fitted = np.zeros(n, dtype=bool)
+        self.model = np.array([""] * n, dtype=object)
+        self.saturation = np.full(n, np.nan)
+        self.saturation_ci = np.full((n, 2), np.nan)
+        self.inflection_year = np.full(n, np.nan)
+        self.inflection_ci = np.full((n, 2), np.nan)
+        self.growth_rate = np.full(n, np.nan)
+        self.r2 = np.full(n, np.nan)
+        self.forecast_years = years[-1] + np.arange(1, horizon + 1)
+        self.forecast = np.full((n, horizon), np.nan)
+        self.lower = np.full((n, horizon), np.nan)
+        self.upper = np.full((n, horizon), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def summary(self, i: int) -> Dict[str, Any]:
+        """One topic's fit as plain JSON-able values; just the history when it wasn't fitted."""
+        def num(value, digits=2):
+            return None if not np.isfinite(value) else round(float(value), digits)
+
+        if not self.fitted[i]:
+            return {"fitted": False, "history": self.history(i)}
+        return {
+            "fitted": True,
+            "model": str(self.model[i]),
+            "saturation": num(self.saturation[i], 1),
+            "saturation_ci": [num(v, 1) for v in self.saturation_ci[i]],
+            "inflection_year": num(self.inflection_year[i]),
+            "inflection_ci": [num(v) for v in self.inflection_ci[i]],
+            "growth_rate": num(self.growth_rate[i], 4),
+            "r2": num(self.r2[i], 4),
+            "history": self.history(i),
+            "forecast": [
+                {"year": int(y), "cumulative_count": num(f, 1), "lower": num(lo, 1), "upper": num(hi, 1)}
+                for y, f, lo, hi in zip(self.forecast_years, self.forecast[i], self.lower[i], self.upper[i])
+            ],
+        }
+
+    def history(self, i: int) -> List[Dict[str, int]]:
+        """Observed years in calculate_s_curve's shape."""
+        return [
+            {"year": int(y), "count": int(c), "cumulative_count": int(cum)}
+            for y, c, cum in zip(self.years, self.counts[i], self.cumulative[i]) if cum > 0
+        ]
+
+
+def fit_s_curves(counts: Any, years: Sequence[int], model: str = "auto", horizon: int = 5,
+                 confidence: float = 0.95, min_years: int = SCURVE_MIN_YEARS,
+                 max_iter: int = SCURVE_MAX_ITER) -> SCurveFits:
+    """
+    Fit S-curves to yearly counts, shape (topics, len(years)) (a 1-D array is
+    one topic). model is "logistic", "gompertz" or "auto" (per topic, the one
+    with the smaller residual; both have three parameters). Returns an
+    SCurveFits with saturation, inflection year, growth rate, R^2 and a
+    `horizon`-year forecast of cumulative counts with `confidence` bands.
+    """
+    if model not in MODELS + ("auto",):
+        raise ValueError(f"model must be one of {MODELS + ('auto',)}")
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    years = np.asarray(years, dtype=float)
+    if counts.shape[1] != len(years):
+        raise ValueError(f"counts has {counts.shape[1]} columns for {len(years)} years")
+    counts = np.clip(np.nan_to_num(counts), 0, None)
+    fits = SCurveFits(years, counts, horizon)
+
+    usable = np.flatnonzero((counts > 0).sum(axis=1) >= max(min_years, 4))
+    if not len(usable) or len(years) < 4:
+        return fits
+
+    # Work in units of each topic's total so one tolerance suits every topic
+    cumulative = fits.cumulative[usable]
+    scale = cumulative[:, -1]
+    y = cumulative / scale[:, None]
+    center = years.mean()
+    x = years - center
+    span = max(years[-1] - years[0], 1.0)
+
+    # theta = (log K, log r, t0); K never below what has already been observed
+    bounds = np.array([[0.0, math.log(1e-3), x[0] - 3 * span],
+                       [math.log(1e3), math.log(5.0), x[-1] + 3 * span]])
+    n, starts = len(usable), len(_SATURATION_STARTS)
+    y_tiled = np.repeat(y, starts, axis=0)
+    best = {}
+    for name in (MODELS if model == "auto" else (model,)):
+        theta0 = np.empty((n * starts, 3))
+        for j, k0 in enumerate(_SATURATION_STARTS):
+            # Start the inflection where the data passes the curve's inflection level,
+            # or a quarter span past the last year if it hasn't yet
+            level = k0 / 2 if name == "logistic" else k0 / math.e
+            t0 = x[np.argmax(y >= level, axis=1)] if level < 1.0 else np.full(n, x[-1] + span / 4)
+            theta0[j::starts] = np.column_stack([np.full(n, math.log(k0)), np.full(n, math.log(8.0 / span)), t0])
+        theta, f, J, ssr = _levenberg_marquardt(name, y_tiled, x, theta0, bounds, max_iter)
+        pick = ssr.reshape(n, starts).argmin(axis=1) + np.arange(n) * starts
+        best[name] = (theta[pick], J[pick], ssr[pick])
+
+    if model == "auto":
+        use_gompertz = best["gompertz"][2] < best["logistic"][2]
+        names = np.where(use_gompertz, "gompertz", "logistic")
+    else:
+        names = np.full(n, model)
+
+    z = _z_score(confidence)
+    dof = max(len(years) - 3, 1)
+    x_future = fits.forecast_years - center
+    for name in set(names):
+        rows = np.flatnonzero(names == name)
+        theta, J, ssr = (part[rows] for part in best[name])
+        # Covariance of theta: sigma^2 (J'J)^-1; pinv copes with flat, unidentifiable curves
+        sigma2 = ssr / dof
+        cov = np.linalg.pinv(np.einsum("nmi,nmj->nij", J, J)) * sigma2[:, None, None]
+        f_future, J_future = _curve(name, theta, x_future)
+        spread = np.sqrt(np.clip(np.einsum("nhi,nij,nhj->nh", J_future, cov, J_future), 0, None))
+
+        topics, s = usable[rows], scale[rows]
+        K = np.exp(theta[:, 0])
+        K_se = K * np.sqrt(np.clip(cov[:, 0, 0], 0, None))
+        t0_se = np.sqrt(np.clip(cov[:, 2, 2], 0, None))
+        y_rows = y[rows]
+        sst = ((y_rows - y_rows.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+
+        fits.fitted[topics] = True
+        fits.model[topics] = name
+        fits.saturation[topics] = K * s
+        fits.saturation_ci[topics] = np.column_stack([np.maximum(K - z * K_se, 1.0), K + z * K_se]) * s[:, None]
+        fits.inflection_year[topics] = theta[:, 2] + center
+        fits.inflection_ci[topics] = (theta[:, 2] + center)[:, None] + np.outer(t0_se, [-z, z])
+        fits.growth_rate[topics] = np.exp(theta[:, 1])
+        fits.r2[topics] = np.where(sst > 0, 1.0 - ssr / np.where(sst > 0, sst, 1.0), np.nan)
+        fits.forecast[topics] = f_future * s[:, None]
+        # Cumulative counts can't fall below what has already been observed
+        fits.lower[topics] = np.maximum(f_future - z * spread, 1.0) * s[:, None]
+        fits.upper[topics] = (f_future + z * spread) * s[:, None]
+    return fits
+
+
+def year_range(years: Sequence[int]) -> np.ndarray:
+    """Every year from the first to the last, so gaps count as zero rather than being skipped."""
+    years = [int(y) for y in years]
+    return np.arange(min(years), max(years) + 1) if years else np.empty(0, dtype=int)
+
+
+def count_matrix(yearly: Dict[str, Dict[int, int]], years: Optional[Sequence[int]] = None):
+    """
+    {topic: {year: count}} to (topics, years, counts) for fit_s_curves.
+    `years` defaults to the full span across all topics.
+    """
+    topics = list(yearly)
+    if years is None:
+        years = year_range([y for per_topic in yearly.values() for y in per_topic])
+    years = np.asarray(years, dtype=int)
+    position = {int(y): i for i, y in enumerate(years)}
+    counts = np.zeros((len(topics), len(years)))
+    for row, topic in enumerate(topics):
+        for year, count in yearly[topic].items():
+            if int(year) in position:
+                counts[row, position[int(year)]] += count
+    return topics, years, counts
+
+
+def _benchmark(num_topics: int):
+    import time
+    rng = np.random.default_rng(0)
+    years = np.arange(2000, 2025)
+    K = rng.uniform(50, 5000, num_topics)
+    t0 = rng.uniform(2005, 2030, num_topics)
+    r = rng.uniform(0.2, 1.0, num_topics)
+    cumulative = K[:, None] / (1 + np.exp(-r[:, None] * (years - t0[:, None])))
+    counts = rng.poisson(np.diff(cumulative, axis=1, prepend=0).clip(0))
+    start = time.perf_counter()
+    fits = fit_s_curves(counts, years, model="auto")
+    elapsed = time.perf_counter() - start
+    ok = fits.fitted & (t0 < 2022)  # inflection already observed: should be recovered
+    err = np.abs(fits.inflection_year[ok] - t0[ok])
+    print(f"{num_topics} topics in {elapsed:.2f} s ({elapsed / num_topics * 1e3:.2f} ms/topic); "
+          f"fitted {fits.fitted.mean():.0%}; median inflection error {np.median(err):.2f} years "
+          f"where the inflection was observed")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark batched S-curve fitting")
+    parser.add_argument("--topics", type=int, default=5000)
+    args = parser.parse_args()
+    _benchmark(args.topics)
@@ -0,0 +1,216 @@
+# search.py
+"""
+Document search over aetos_db.documents.
+
+The default mode uses the weighted text index created by
+database.ensure_indexes (title > technologies > summary) with the query as
+one phrase, so "quantum cryptography" matches what the old substring search
+matched rather than every document mentioning "quantum". Results come newest
+first; ranking by textScore is opt-in (sort="relevance"). Case-insensitive
+regex matching is kept only as an explicit fallback (mode="regex"): it can't
+use an index and scans the collection.
+
+Pages ordered by published are cut with keyset pagination on (published, _id)
+and opaque continuation tokens, backed by the compound index from
+database.ensure_indexes.
+
+Run this module directly to benchmark both modes against a synthetic corpus:
+
+    python search.py --docs 100000
+"""
+import re
+import json
+import base64
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+SEARCH_MODES = ("text", "regex")
+SORT_ORDERS = ("relevance", "published")
+
+TEXT_INDEX_NAME = "documents_text"
+TEXT_INDEX_WEIGHTS = {"title": 10, "technologies": 5, "summary": 1}
+
+
+def ensure_text_index(collection):
+    from pymongo import TEXT
+    collection.create_index(
+        [(field, TEXT) for field in TEXT_INDEX_WEIGHTS],
+        weights=TEXT_INDEX_WEIGHTS,
+        default_language="english",
+        name=TEXT_INDEX_NAME,
+    )
+
+
+def build_search_filter(query: str, mode: str = "text") -> Dict[str, Any]:
+    if mode == "regex":
+        pattern = re.escape(query)
+        return {
+            "$or": [
+                {"title": {"$regex": pattern, "$options": "i"}},
+                {"technologies": {"$regex": pattern, "$options": "i"}},
+                {"summary": {"$regex": pattern, "$options": "i"}}
+            ]
+        }
+    if mode == "text":
+        # Quoted, $text requires the whole phrase instead of OR-ing its stemmed terms
+        phrase = " ".join(query.replace('"', " ").split())
+        return {"$text": {"$search": f'"{phrase}"'}}
+    raise ValueError(f"unknown search mode {mode!r}; expected one of {SEARCH_MODES}")
+
+
+# `published` holds a mix of ISO strings (API saves), dates (batch saves) and
+# nulls. Mongo sorts mixed types by BSON type order; listed here ascending.
+_PUBLISHED_TYPE_ORDER = ("null", "number", "string", "date")
+
+
+def _published_kind(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, datetime.datetime):
+        return "date"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, (int, float)):
+        return "number"
+    raise ValueError(f"cannot paginate on published of type {type(value).__name__}")
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque continuation token for the position just after doc."""
+    value = doc.get("published")
+    kind = _published_kind(value)
+    if kind == "date":
+        value = value.isoformat()
+    payload = json.dumps({"k": kind, "v": value, "i": str(doc["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[str, Any, Any]:
+    """Return (kind, published, _id) from a token; ValueError if it was tampered with."""
+    from bson import ObjectId
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        kind, value, oid = data["k"], data["v"], ObjectId(data["i"])
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {e}")
+    if kind not in _PUBLISHED_TYPE_ORDER:
+        raise ValueError(f"invalid cursor kind {kind!r}")
+    if kind == "date":
+        value = datetime.datetime.fromisoformat(value)
+    return kind, value, oid
+
+
+def keyset_filter(after: Tuple[str, Any, Any]) -> Dict[str, Any]:
+    """Match documents that sort after `after` in (published desc, _id desc) order."""
+    kind, value, oid = after
+    if kind == "null":
+        clauses = [{"published": None, "_id": {"$lt": oid}}]
+    else:
+        clauses = [{"published": {"$lt": value}}, {"published": value, "_id": {"$lt": oid}}]
+    # Every value of a lower-ordered BSON type also comes later in a descending sort
+    for lower in _PUBLISHED_TYPE_ORDER[:_PUBLISHED_TYPE_ORDER.index(kind)]:
+        clauses.append({"published": None} if lower == "null" else {"published": {"$type": lower}})
+    return {"$or": clauses}
+
+
+def search_documents(collection, query: str, limit: Optional[int] = 10, mode: str = "text",
+                     sort: Optional[str] = None, projection: Optional[Dict[str, Any]] = None,
+                     after: Optional[str] = None):
+    """
+    Return a cursor over documents matching query.
+
+    sort="published" (the default) orders newest first, with _id as the
+    tiebreaker; sort="relevance" orders text-mode results by textScore and
+    adds a `score` field. Regex mode has no relevance score, so it always
+    sorts by published. `after` is a continuation token from encode_cursor and is only
+    valid with sort="published". limit=None streams every match.
+    """
+    sort = sort or "published"
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"unknown sort {sort!r}; expected one of {SORT_ORDERS}")
+    if after and sort != "published":
+        raise ValueError("cursor pagination requires sort=published")
+    filt = build_search_filter(query, mode)
+    if after:
+        filt = {"$and": [filt, keyset_filter(decode_cursor(after))]}
+    proj = dict(projection) if projection else None
+    if mode == "text" and sort == "relevance":
+        proj = proj or {}
+        proj["score"] = {"$meta": "textScore"}
+        cursor = collection.find(filt, proj).sort([("score", {"$meta": "textScore"})])
+    else:
+        cursor = collection.find(filt, proj).sort([("published", -1), ("_id", -1)])
+    return cursor.limit(limit) if limit else cursor
+
+
+def search_page(collection, query: str, page_size: int, mode: str = "text",
+                projection: Optional[Dict[str, Any]] = None,
+                after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One keyset page ordered by (published, _id) desc.
+    Returns (documents, next_token); next_token is None on the last page.
+    """
+    proj = dict(projection, _id=1, published=1) if projection else None
+    docs = list(search_documents(collection, query, limit=page_size + 1, mode=mode,
+                                 sort="published", projection=proj, after=after))
+    next_token = encode_cursor(docs[page_size - 1]) if len(docs) > page_size else None
+    return docs[:page_size], next_token
+
+
+def _benchmark(num_docs: int, rounds: int, limit: int):
+    import os
+    import time
+    import random
+    import statistics
+    from pymongo import MongoClient, ASCENDING
+
+    vocab = ("quantum", "cryptography", "drone", "swarm", "lidar", "battery", "graphene", "satellite",
+             "hypersonic", "radar", "neural", "network", "robotics", "photonics", "fusion", "sensor",
+             "autonomous", "navigation", "materials", "propulsion", "imaging", "learning", "edge", "secure")
+    rng = random.Random(42)
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    coll = client.aetos_bench.search_documents
+    if coll.estimated_document_count() != num_docs:
+        print(f"Seeding {num_docs} synthetic documents...")
+        coll.drop()
+        batch = []
+        for i in range(num_docs):
+            batch.append({
+                "title": " ".join(rng.choices(vocab, k=6)),
+                "summary": " ".join(rng.choices(vocab, k=120)),
+                "technologies": rng.sample(vocab, 4),
+                "published": f"20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}-01",
+                "url": f"https://example.org/{i}",
+            })
+            if len(batch) == 5000:
+                coll.insert_many(batch)
+                batch = []
+        if batch:
+            coll.insert_many(batch)
+    coll.create_index([("published", ASCENDING)])
+    ensure_text_index(coll)
+
+    queries = ["quantum cryptography", "drone swarm", "graphene battery", "hypersonic propulsion", "lidar"]
+    print(f"{'mode':<8}{'sort':<11}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, sort in (("regex", "published"), ("text", "relevance"), ("text", "published")):
+        timings = []
+        for _ in range(rounds):
+            for q in queries:
+                start = time.perf_counter()
+                list(search_documents(coll, q, limit=limit, mode=mode, sort=sort))
+                timings.append((time.perf_counter() - start) * 1000.0)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{mode:<8}{sort:<11}{statistics.median(timings):>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark regex vs text-index document search")
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    _benchmark(args.docs, args.rounds, args.limit)
@@ -0,0 +1,159 @@
+# serialization.py
+"""
+Single-pass JSON encoding for Mongo documents.
+
+`dumps` turns ObjectId, datetime, Decimal128/Decimal and NaN/inf into plain
+JSON types while encoding, instead of round-tripping through
+json_util.dumps -> json.loads -> flatten_bson -> jsonify. orjson (listed in
+requirements.txt) does the encoding; where it is missing, the stdlib encoder
+runs over a one-pass `to_jsonable` conversion instead.
+
+Run this module directly to compare per-document cost against the legacy path:
+
+    python serialization.py --docs 20000
+"""
+import json
+import math
+import datetime
+from decimal import Decimal
+from typing import Any
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Fields the document endpoints return; anything else is never decoded
+DOCUMENT_PROJECTION = {
+    "_id": 0,
+    "title": 1,
+    "summary": 1,
+    "abstract": 1,
+    "published": 1,
+    "authors": 1,
+    "source": 1,
+    "url": 1,
+    "funding_details": 1,
+    "TRL": 1,
+    "TRL_justification": 1,
+    "technologies": 1,
+    "progress": 1,
+    "strategic_rating": 1,
+    "strategic_summary": 1,
+}
+
+
+def _isoformat(dt: datetime.datetime) -> str:
+    # pymongo returns naive UTC datetimes; mark them as UTC like json_util does
+    if dt.tzinfo is None:
+        return dt.isoformat() + "Z"
+    return dt.isoformat()
+
+
+def _default(obj: Any) -> Any:
+    """Fallback hook for types orjson doesn't encode natively."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        # pandas.Timestamp and other subclasses end up here
+        if obj != obj:  # NaT
+            return None
+        return _isoformat(obj)
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        obj = obj.to_decimal()
+    if isinstance(obj, Decimal):
+        return float(obj) if obj.is_finite() else None
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def to_jsonable(obj: Any) -> Any:
+    """Convert a (possibly nested) BSON document to plain JSON types in one pass."""
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if obj is None or isinstance(obj, (str, int, bool)):
+        return obj
+    return _default(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj (dicts/lists of BSON values) straight to JSON bytes."""
+    if ORJSON_AVAILABLE:
+        # orjson already writes NaN/inf as null and naive datetimes as UTC "Z"
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return json.dumps(to_jsonable(obj), separators=(",", ":")).encode("utf-8")
+
+
+def _benchmark(num_docs: int):
+    import time
+    import random
+    from bson import json_util
+
+    def legacy(d):
+        doc = json.loads(json_util.dumps(d))
+
+        def flatten_bson(obj):
+            if isinstance(obj, dict):
+                if '$numberDouble' in obj:
+                    return float(obj['$numberDouble'])
+                if '$numberInt' in obj:
+                    return int(obj['$numberInt'])
+                if '$date' in obj:
+                    return obj['$date']
+                if '$oid' in obj:
+                    return obj['$oid']
+                return {k: flatten_bson(v) for k, v in obj.items()}
+            elif isinstance(obj, list):
+                return [flatten_bson(item) for item in obj]
+            return obj
+
+        return flatten_bson(doc)
+
+    rng = random.Random(0)
+    words = "quantum drone radar lidar graphene battery swarm sensor fusion photonics".split()
+    docs = [{
+        "_id": ObjectId(),
+        "title": " ".join(rng.choices(words, k=8)),
+        "summary": " ".join(rng.choices(words, k=150)),
+        "published": datetime.datetime(2020 + i % 5, 1 + i % 12, 1),
+        "updated_at": datetime.datetime.utcnow(),
+        "authors": [f"Author {j}" for j in range(5)],
+        "source": "arXiv",
+        "url": f"https://arxiv.org/abs/{i}",
+        "TRL": rng.randint(1, 9),
+        "strategic_rating": float("nan") if i % 7 == 0 else rng.random() * 10,
+        "funding_details": Decimal128("125000.50"),
+        "technologies": rng.sample(words, 4),
+        "raw_analysis": " ".join(rng.choices(words, k=300)),
+    } for i in range(num_docs)]
+    projected = [{k: d[k] for k in d if k in DOCUMENT_PROJECTION and DOCUMENT_PROJECTION[k]} for d in docs]
+
+    def run(label, fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<40}{elapsed * 1e6 / num_docs:>10.1f} us/doc")
+
+    run("legacy json_util+loads+flatten+dumps", lambda: json.dumps([legacy(d) for d in docs]))
+    run("dumps (full document)", lambda: dumps(docs))
+    run("dumps (projected fields)", lambda: dumps(projected))
+    print(f"encoder: {'orjson' if ORJSON_AVAILABLE else 'stdlib json'}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark BSON document serialization")
+    parser.add_argument("--docs", type=int, default=20_000)
+    args = parser.parse_args()
+    _benchmark(args.docs)
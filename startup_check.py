@@ -0,0 +1,118 @@
+# startup_check.py
+"""
+Cold-start budget check for the API, worker and batch entry points.
+
+Each entry point is imported in a fresh interpreter under `python -X importtime`.
+The check reports the slowest imports and fails (exit code 1) when:
+- importing an entry point's dependencies takes longer than its budget, or
+- a heavy stack it should only load on demand shows up in sys.modules.
+
+For the API it also answers /api/health through the Flask test client and
+checks that no ML or browser module was loaded along the way.
+
+    python startup_check.py            # all entry points
+    python startup_check.py api --top 25
+
+Budgets (milliseconds) can be overridden with STARTUP_BUDGET_API_MS,
+STARTUP_BUDGET_WORKER_MS and STARTUP_BUDGET_MAIN_MS.
+"""
+import os
+import sys
+import json
+import subprocess
+from typing import Dict, List, Tuple
+
+# Loaded only when the feature that needs them runs
+ML_MODULES = ("torch", "transformers", "keybert", "sentence_transformers")
+BROWSER_MODULES = ("selenium",)
+
+ENTRY_POINTS = {
+    # api must not even load pandas: the request path is pandas-free
+    "api": {"budget_ms": float(os.getenv("STARTUP_BUDGET_API_MS", "1500")),
+            "forbidden": ML_MODULES + BROWSER_MODULES + ("pandas", "google.generativeai")},
+    "worker": {"budget_ms": float(os.getenv("STARTUP_BUDGET_WORKER_MS", "1000")),
+               "forbidden": ML_MODULES + BROWSER_MODULES + ("pandas", "google.generativeai")},
+    "main": {"budget_ms": float(os.getenv("STARTUP_BUDGET_MAIN_MS", "2500")),
+             "forbidden": ML_MODULES + BROWSER_MODULES},
+}
+
+# Keep `import api` from waiting on a Mongo server that isn't there
+_CHILD_ENV = {"MONGO_URI": os.getenv("MONGO_URI", "mongodb://localhost:27017/?serverSelectionTimeoutMS=200")}
+
+_PROBE = """
+import sys, json
+import {module}
+health = None
+if {check_health}:
+    resp = {module}.app.test_client().get("/api/health")
+    health = resp.status_code
+print(json.dumps({{"modules": sorted(sys.modules), "health": health}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for each line of -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def probe(module: str, check_health: bool) -> Dict:
+    env = dict(os.environ, **_CHILD_ENV)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, check_health=check_health)],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def check(name: str, top: int) -> bool:
+    spec = ENTRY_POINTS[name]
+    result = probe(name, check_health=(name == "api"))
+    rows = result["imports"]
+    entry = next((r for r in rows if r[0].strip() == name), None)
+    # The entry point's own body (create_app, index setup) is not import cost
+    deps_ms = (entry[2] - entry[1]) / 1000.0 if entry else sum(r[1] for r in rows) / 1000.0
+    loaded = set(result["modules"])
+    leaked = [m for m in spec["forbidden"] if m in loaded]
+
+    print(f"== {name}: dependencies {deps_ms:.0f} ms (budget {spec['budget_ms']:.0f} ms)")
+    for mod, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"   {cumulative_us / 1000.0:>9.1f} ms  {self_us / 1000.0:>8.1f} ms self  {mod}")
+
+    ok = True
+    if deps_ms > spec["budget_ms"]:
+        print(f"   FAIL: import time over budget by {deps_ms - spec['budget_ms']:.0f} ms")
+        ok = False
+    if leaked:
+        print(f"   FAIL: loaded at startup: {', '.join(leaked)}")
+        ok = False
+    if name == "api" and result["health"] != 200:
+        print(f"   FAIL: /api/health returned {result['health']}")
+        ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Check import-time budgets for the AETOS entry points")
+    parser.add_argument("entry_points", nargs="*", help=f"any of {', '.join(sorted(ENTRY_POINTS))} (default: all)")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+    unknown = [e for e in args.entry_points if e not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(unknown)}")
+    args.entry_points = args.entry_points or sorted(ENTRY_POINTS)
+    results = [check(name, args.top) for name in args.entry_points]
+    sys.exit(0 if all(results) else 1)
@@ -1,9 +1,8 @@
 # worker.py
 import os
 import time
-import pandas as pd
 from database import save_to_db
-from intelligence import get_gemini_analysis
+from intelligence import get_gemini_analysis, get_gemini_batch_analysis
 
 
 def run_analysis_pipeline_task(topic: str, num_documents: int = 5):
@@ -11,10 +10,13 @@ def run_analysis_pipeline_task(topic: str, num_documents: int = 5):
     Synchronous analysis pipeline:
       - fetches papers via ingest.fetch_combined_papers (imported locally to avoid circular import)
       - filters and cleans
-      - runs get_gemini_analysis on summaries
+      - runs get_gemini_analysis on summaries (batched when there are several)
       - saves results to DB via save_to_db
       - returns a dict with status and documents
     """
+    # Imported per task so worker processes start without loading pandas
+    import pandas as pd
+
     max_results = max(1, int(num_documents))
 
     try:
@@ -41,17 +43,26 @@ def run_analysis_pipeline_task(topic: str, num_documents: int = 5):
     if arxiv_df.empty:
         return {"status": "complete", "documents": [], "message": "No high-quality documents found."}
 
-    docs = []
+    rows = []
     for _, row in arxiv_df.iterrows():
         s = row.get('summary') or ""
         # ensure enough content
         if len(s.split()) < 20:
             continue
-        # Gemeni analysis may raise; guard it
-        try:
-            analysis = get_gemini_analysis(s)
-        except Exception as e:
-            analysis = {"analysis_error": str(e)}
+        rows.append(row)
+
+    # Gemeni analysis may raise; guard it. Several docs go out as batched prompts.
+    summaries = [row.get('summary') or "" for row in rows]
+    try:
+        if len(summaries) > 1:
+            analyses = get_gemini_batch_analysis(summaries)
+        else:
+            analyses = [get_gemini_analysis(s) for s in summaries]
+    except Exception as e:
+        analyses = [{"analysis_error": str(e)} for _ in summaries]
+
+    docs = []
+    for row, analysis in zip(rows, analyses):
         merged = row.to_dict()
         # ensure merged has plain python types
         merged = {k: (v if pd.notna(v) else None) for k, v in merged.items()}
@@ -65,7 +76,7 @@ def run_analysis_pipeline_task(topic: str, num_documents: int = 5):
     if docs:
         try:
             df = pd.DataFrame(docs)
-            save_to_db(df)
+            save_to_db(df, topic=topic)
         except Exception as e:
             # DB save failed but still return processed docs
             return {"status": "complete", "documents": docs, "message": f"Processed {len(docs)} documents; save_to_db failed: {e}"}